@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+FINAL_FRAME_RETRIES = 5
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза из RetryAfter в секундах (int или timedelta в зависимости от версии PTB)"""
+    retry_after = error.retry_after
+    if hasattr(retry_after, 'total_seconds'):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def delay(self, now: float, reserve: float = 0.0) -> float:
+        """Через сколько секунд можно будет потратить токен, не опускаясь ниже reserve"""
+        self._refill(now)
+        if now < self.updated:
+            # Ведро на паузе после RetryAfter
+            return self.updated - now + (reserve + 1 - self.tokens) / self.rate
+        missing = reserve + 1 - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def try_consume(self, now: float, reserve: float = 0.0) -> bool:
+        """Списание одного токена, если после него останется не меньше reserve"""
+        if self.delay(now, reserve) > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def pause(self, until: float):
+        """Полная остановка пополнения до момента until"""
+        self.tokens = 0
+        self.updated = max(self.updated, until)
+
+    def is_idle(self, now: float) -> bool:
+        """Ведро полное и его можно забыть без потери состояния"""
+        self._refill(now)
+        return now >= self.updated and self.tokens >= self.burst
+
+
+class _Animation:
+    __slots__ = ('chat_id', 'message_id', 'frames', 'final_text', 'final_markup',
+                 'started', 'final_at', 'next_frame', 'in_flight', 'final_failures')
+
+    def __init__(self, chat_id, message_id, frames, final_text, final_markup, now):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.final_text = final_text
+        self.final_markup = final_markup
+        self.started = now
+        self.next_frame = 0
+        self.in_flight = False
+        self.final_failures = 0
+        # Кадр показывается в момент offset и держится delay секунд
+        self.frames = []
+        offset = 0.0
+        for text, delay in frames:
+            self.frames.append((offset, text))
+            offset += delay
+        self.final_at = now + offset
+
+    def due_frame(self, now: float) -> Optional[int]:
+        """Индекс последнего наступившего кадра; более ранние пропускаются"""
+        elapsed = now - self.started
+        index = None
+        for i in range(self.next_frame, len(self.frames)):
+            if self.frames[i][0] > elapsed:
+                break
+            index = i
+        return index
+
+    def next_due(self, now: float) -> float:
+        if self.next_frame < len(self.frames):
+            return max(0.0, self.started + self.frames[self.next_frame][0] - now)
+        return max(0.0, self.final_at - now)
+
+
+class SpinAnimator:
+    """Фоновая анимация колеса с учетом лимитов Bot API
+
+    Кадры отправляются из отдельной задачи, а не из обработчика апдейта.
+    Глобальное ведро токенов и ведра для каждого чата ограничивают частоту
+    editMessageText: промежуточные кадры при нехватке бюджета пропускаются
+    (показывается самый свежий из наступивших), финальный кадр доставляется
+    всегда. RetryAfter приостанавливает ведро соответствующего чата.
+    """
+
+    def __init__(self, global_rate: float = 25.0, chat_rate: float = 1.0,
+                 chat_burst: float = 3.0, final_reserve: float = 5.0):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        # Часть глобального бюджета, которую промежуточные кадры не трогают
+        self.final_reserve = final_reserve
+        self.bot = None
+        self._animations: Dict[Tuple[int, int], _Animation] = {}
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._sends = set()
+        self._closing = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.retry_after_count = 0
+
+    async def start(self, bot):
+        """Запуск фоновой задачи анимации"""
+        self.bot = bot
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Остановка с доставкой финальных кадров всех начатых анимаций"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Animator stopped with {len(self._animations)} unfinished animations")
+                self._task.cancel()
+            self._task = None
+
+    def animate(self, chat_id: int, message_id: int, frames: List[Tuple[str, float]],
+                final_text: str, final_markup: Optional[InlineKeyboardMarkup] = None):
+        """Постановка анимации в очередь; frames — пары (текст, задержка после кадра)"""
+        self._animations[(chat_id, message_id)] = _Animation(
+            chat_id, message_id, frames, final_text, final_markup, time.monotonic()
+        )
+        self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._animations)
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _step(self, animation: _Animation, now: float) -> float:
+        """Отправка очередного кадра, если позволяет бюджет; возвращает время до следующей проверки"""
+        final = now >= animation.final_at or self._closing
+        if final:
+            index = None
+        else:
+            index = animation.due_frame(now)
+            if index is None:
+                return animation.next_due(now)
+
+        reserve = 0.0 if final else self.final_reserve
+        chat_bucket = self._chat_bucket(animation.chat_id, now)
+        wait = max(chat_bucket.delay(now), self._global_bucket.delay(now, reserve))
+        if wait > 0:
+            return wait
+        chat_bucket.try_consume(now)
+        self._global_bucket.try_consume(now, reserve)
+
+        if final:
+            dropped = len(animation.frames) - animation.next_frame
+            text, markup = animation.final_text, animation.final_markup
+        else:
+            dropped = index - animation.next_frame
+            text, markup = animation.frames[index][1], None
+            animation.next_frame = index + 1
+        self.frames_dropped += dropped
+        animation.in_flight = True
+        task = asyncio.create_task(self._send(animation, text, markup, final))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+        return 0.0 if final else animation.next_due(now)
+
+    async def _send(self, animation: _Animation, text: str, markup, final: bool):
+        try:
+            await self.bot.edit_message_text(
+                text,
+                chat_id=animation.chat_id,
+                message_id=animation.message_id,
+                parse_mode=ParseMode.HTML,
+                reply_markup=markup
+            )
+            self.frames_sent += 1
+            delivered = True
+        except RetryAfter as e:
+            self.retry_after_count += 1
+            delay = retry_after_seconds(e)
+            self._chat_bucket(animation.chat_id, time.monotonic()).pause(time.monotonic() + delay)
+            logger.warning(f"Animation flood control in chat {animation.chat_id}: retry after {delay}s")
+            delivered = False
+        except BadRequest as e:
+            # "Message is not modified" и удаленные сообщения повторять бесполезно
+            logger.debug(f"Animation frame rejected in chat {animation.chat_id}: {e}")
+            delivered = True
+        except TelegramError as e:
+            logger.error(f"Animation frame error in chat {animation.chat_id}: {e}")
+            delivered = False
+        finally:
+            animation.in_flight = False
+
+        if final:
+            if not delivered:
+                animation.final_failures += 1
+            if delivered or animation.final_failures >= FINAL_FRAME_RETRIES:
+                if not delivered:
+                    logger.error(f"Final spin frame lost in chat {animation.chat_id}")
+                self._animations.pop((animation.chat_id, animation.message_id), None)
+        elif not delivered:
+            self.frames_dropped += 1
+        self._wakeup.set()
+
+    def _prune_buckets(self, now: float):
+        active = {animation.chat_id for animation in self._animations.values()}
+        for chat_id in [c for c, b in self._chat_buckets.items() if c not in active and b.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            wait = 60.0
+            for animation in list(self._animations.values()):
+                if not animation.in_flight:
+                    wait = min(wait, self._step(animation, now))
+            if self._closing and not self._animations:
+                if self._sends:
+                    await asyncio.gather(*self._sends, return_exceptions=True)
+                return
+            if len(self._chat_buckets) > 2 * len(self._animations) + 1000:
+                self._prune_buckets(now)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0.01))
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,168 @@
+"""Помесячные партиции prizes и transactions и архивирование старых месяцев
+
+    python archive.py ensure                                  # партиции на 3 месяца вперед
+    python archive.py archive --keep-months 12 --out-dir ./archive
+
+archive отсоединяет партиции, целиком лежащие старше keep-months месяцев
+(DETACH CONCURRENTLY на PostgreSQL 14+), выгружает каждую потоковым COPY в
+<out-dir>/<партиция>.csv.gz и удаляет таблицу. Отсоединенная таблица сначала
+переименовывается в archive_<партиция>, поэтому прерванный запуск
+дорабатывается следующим.
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import datetime
+from typing import List, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ('prizes', 'transactions')
+ARCHIVE_PREFIX = 'archive_'
+# Начало месяца в UTC, чтобы границы не зависели от часового пояса сессии
+MONTH_START = "date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'"
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_y{start:%Y}m{start:%m}"
+
+
+def timestamp_literal(value: datetime) -> str:
+    return f"'{value.isoformat()}'::timestamptz"
+
+
+async def ensure_partitions(conn: asyncpg.Connection, table: str, months_ahead: int = 3) -> List[str]:
+    """Создание месячных партиций до months_ahead месяцев вперед
+
+    Партиции идут подряд от верхней границы последней существующей, поэтому
+    пропущенные месяцы (задача не запускалась) тоже получают партиции.
+    """
+    uppers = [upper for _, upper in await _partition_bounds(conn, table)]
+    months = await conn.fetch(f'''
+        SELECT start, start + interval '1 month' AS stop
+        FROM generate_series(COALESCE($2, {MONTH_START}), {MONTH_START} + make_interval(months => $1),
+                             interval '1 month') AS start
+    ''', months_ahead, max(uppers, default=None))
+    created = []
+    for row in months:
+        name = partition_name(table, row['start'])
+        await conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+            FOR VALUES FROM ({timestamp_literal(row['start'])}) TO ({timestamp_literal(row['stop'])})
+        ''')
+        created.append(name)
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+
+async def _partition_bounds(conn: asyncpg.Connection, table: str) -> List[Tuple[str, datetime]]:
+    """Партиции таблицы и их верхние границы"""
+    rows = await conn.fetch('''
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+        ORDER BY c.relname
+    ''', table)
+    bounds = []
+    for row in rows:
+        match = re.search(r"TO \('([^']+)'\)", row['bound'])
+        if match:
+            bounds.append((row['relname'], await conn.fetchval('SELECT $1::text::timestamptz', match.group(1))))
+    return bounds
+
+
+async def expired_partitions(conn: asyncpg.Connection, table: str, keep_months: int) -> List[Tuple[str, datetime]]:
+    """Партиции, верхняя граница которых не позже начала месяца keep_months назад"""
+    cutoff = await conn.fetchval(f"SELECT {MONTH_START} - make_interval(months => $1)", keep_months)
+    return [(name, upper) for name, upper in await _partition_bounds(conn, table) if upper <= cutoff]
+
+
+async def detach(conn: asyncpg.Connection, table: str, partition: str) -> str:
+    """Отсоединение партиции и переименование в archive_<партиция>"""
+    concurrently = ' CONCURRENTLY' if conn.get_server_version().major >= 14 else ''
+    await conn.execute(f'ALTER TABLE {table} DETACH PARTITION {partition}{concurrently}')
+    archived = ARCHIVE_PREFIX + partition
+    await conn.execute(f'ALTER TABLE {partition} RENAME TO {archived}')
+    return archived
+
+
+async def export_table(conn: asyncpg.Connection, name: str, out_dir: str) -> str:
+    """Потоковая выгрузка таблицы в <out_dir>/<имя>.csv.gz"""
+    path = os.path.join(out_dir, name[len(ARCHIVE_PREFIX):] + '.csv.gz')
+    tmp_path = path + '.part'
+    with gzip.open(tmp_path, 'wb') as f:
+        async def write(chunk):
+            f.write(chunk)
+        await conn.copy_from_table(name, output=write, format='csv', header=True)
+    # Файл появляется под итоговым именем только после полной выгрузки
+    os.replace(tmp_path, path)
+    return path
+
+
+async def archive(conn: asyncpg.Connection, keep_months: int, out_dir: str,
+                  drop: bool = True, dry_run: bool = False) -> List[str]:
+    """Отсоединение, выгрузка и удаление партиций старше keep_months месяцев"""
+    os.makedirs(out_dir, exist_ok=True)
+    pending = [row['relname'] for row in await conn.fetch(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE $1 ORDER BY relname",
+        ARCHIVE_PREFIX + '%'
+    )]
+    for table in PARTITIONED_TABLES:
+        for partition, upper in await expired_partitions(conn, table, keep_months):
+            logger.info(f"Archiving {partition} (rows before {upper:%Y-%m-%d})")
+            pending.append(partition if dry_run else await detach(conn, table, partition))
+    if dry_run:
+        return pending
+
+    exported = []
+    for name in pending:
+        path = await export_table(conn, name, out_dir)
+        if drop:
+            await conn.execute(f'DROP TABLE {name}')
+        logger.info(f"Exported {name} to {path}")
+        exported.append(path)
+    return exported
+
+
+async def _main(args):
+    conn = await asyncpg.connect(
+        dsn=os.getenv('DATABASE_DIRECT_URL') or os.getenv('DATABASE_URL'),
+        ssl=os.getenv('DB_SSL') or None
+    )
+    try:
+        if args.command == 'ensure':
+            for table in PARTITIONED_TABLES:
+                await ensure_partitions(conn, table, args.months_ahead)
+        else:
+            result = await archive(conn, args.keep_months, args.out_dir, not args.keep_tables, args.dry_run)
+            print('\n'.join(result) or "Nothing to archive")
+    finally:
+        await conn.close()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Обслуживание партиций prizes и transactions")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ensure = subparsers.add_parser('ensure', help="создать партиции на будущие месяцы")
+    ensure.add_argument('--months-ahead', type=int, default=3)
+    archive_parser = subparsers.add_parser('archive', help="выгрузить и удалить старые партиции")
+    archive_parser.add_argument('--keep-months', type=int, default=12)
+    archive_parser.add_argument('--out-dir', default='archive')
+    archive_parser.add_argument('--keep-tables', action='store_true', help="не удалять выгруженные таблицы")
+    archive_parser.add_argument('--dry-run', action='store_true', help="только показать партиции к архивации")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Прогон рассылки против фейкового Bot API
+
+Запуск (из корня репозитория, нужна локальная PostgreSQL):
+
+    python -m bench.broadcast --dsn postgresql://localhost/wheel_bench --users 20000 --blocked-ratio 0.05
+
+Создает синтетических пользователей, запускает рассылку, при --interrupt-after
+прерывает ее и продолжает с сохраненной позиции, как после перезапуска бота.
+Отчет показывает скорость, повторные доставки и пропущенных пользователей.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from bench.fake_bot_api import FakeBotAPI
+from bench.report import environment, write_report
+
+logger = logging.getLogger(__name__)
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(flood_ratio=args.flood_ratio, retry_after=args.retry_after,
+                     latency=args.api_latency, blocked_ratio=args.blocked_ratio, seed=args.seed)
+    await api.start()
+
+    os.environ['BOT_TOKEN'] = '123456:BENCH'
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+    from telegram import Bot
+
+    from broadcast import Broadcaster
+    from database import Database
+
+    db = Database()
+    await db.connect()
+    user_ids = range(args.user_id_base, args.user_id_base + args.users)
+    async with db.pool.acquire() as conn:
+        await conn.execute('''
+            INSERT INTO user_attempts (user_id)
+            SELECT generate_series($1::bigint, $2::bigint)
+            ON CONFLICT (user_id) DO UPDATE SET blocked_at = NULL
+        ''', user_ids.start, user_ids.stop - 1)
+
+    bot = Bot('123456:BENCH', base_url=api.base_url)
+    await bot.initialize()
+    broadcaster = Broadcaster(db, rate=args.rate, concurrency=args.concurrency,
+                              checkpoint_every=args.checkpoint_every)
+    broadcaster.start(bot)
+
+    started = time.perf_counter()
+    broadcast_id = await broadcaster.create('Bench broadcast', 0)
+    interrupted = False
+    if args.interrupt_after:
+        await asyncio.sleep(args.interrupt_after)
+        if broadcaster.is_running(broadcast_id):
+            await broadcaster.stop()
+            interrupted = True
+            await broadcaster.resume_all()
+    while broadcaster.is_running(broadcast_id):
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    broadcast = await db.get_broadcast(broadcast_id)
+
+    # Повторный прогон должен пропустить заблокировавших
+    async with db.pool.acquire() as conn:
+        marked = await conn.fetchval(
+            'SELECT count(*) FROM user_attempts WHERE user_id BETWEEN $1 AND $2 AND blocked_at IS NOT NULL',
+            user_ids.start, user_ids.stop - 1
+        )
+
+    await broadcaster.stop()
+    await bot.shutdown()
+    await db.close()
+    await api.stop()
+
+    delivered = [user_id for user_id in user_ids if api.sent_to[user_id]]
+    expected = [user_id for user_id in user_ids if not api.is_blocked(user_id)]
+    return {
+        'environment': environment(),
+        'parameters': vars(args),
+        'elapsed_seconds': round(elapsed, 3),
+        'messages_per_second': round(len(delivered) / elapsed, 2) if elapsed else None,
+        'interrupted': interrupted,
+        'broadcast': {key: broadcast[key] for key in ('status', 'sent', 'failed', 'blocked', 'last_user_id')},
+        'delivered_users': len(delivered),
+        'duplicate_deliveries': sum(api.sent_to[user_id] - 1 for user_id in delivered),
+        'missed_users': len(set(expected) - set(delivered)),
+        'marked_blocked': marked,
+        'bot_api': {
+            'calls': dict(api.calls),
+            'injected_429': dict(api.floods),
+            'forbidden': dict(api.forbidden),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон рассылки против фейкового Bot API")
+    parser.add_argument('--dsn', help="PostgreSQL DSN (по умолчанию DATABASE_URL)")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--user-id-base', type=int, default=9_500_000_000)
+    parser.add_argument('--rate', type=float, default=1000.0, help="сообщений в секунду")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--checkpoint-every', type=int, default=500)
+    parser.add_argument('--interrupt-after', type=float, default=0.0, help="прервать и продолжить через N секунд")
+    parser.add_argument('--blocked-ratio', type=float, default=0.05)
+    parser.add_argument('--flood-ratio', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--api-latency', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_broadcast.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    write_report(args.output, report)
+
+    print(f"Delivered {report['delivered_users']} in {report['elapsed_seconds']}s "
+          f"({report['messages_per_second']}/s), status {report['broadcast']['status']}")
+    print(f"Duplicates: {report['duplicate_deliveries']}, missed: {report['missed_users']}, "
+          f"marked blocked: {report['marked_blocked']}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
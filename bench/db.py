@@ -0,0 +1,314 @@
+"""Микробенчмарки методов Database против локальной PostgreSQL
+
+Запуск (из корня репозитория, база одноразовая — бенчмарк пишет в нее):
+
+    python -m bench.db --dsn postgresql://localhost/wheel_bench --users 1000000 --prizes-per-user 50
+    python -m bench.db --skip-seed --pool-sizes 5,10,20 --concurrency 1,16,64 --duration 10
+
+Первый запуск наполняет базу через generate_series пачками по --seed-chunk
+пользователей (призы за последний год, часть получена, транзакции в разных
+статусах) и выполняет VACUUM ANALYZE. Затем для каждого размера пула,
+уровня конкурентности и метода --concurrency задач вызывают метод в цикле
+--duration секунд после прогрева. Отчет: операции в секунду, перцентили
+задержек и ожидания пула, а также EXPLAIN (ANALYZE, BUFFERS) каждого
+запроса метода; пишущие запросы объясняются в откатываемой транзакции.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from typing import Callable, Dict, List
+
+from bench.loadtest import TimedPool
+from bench.report import environment, percentiles, write_report
+
+logger = logging.getLogger(__name__)
+
+METHODS = (
+    'get_user_attempts', 'update_user_attempts', 'process_referral',
+    'create_transaction', 'add_prize', 'get_unclaimed_prizes',
+)
+
+SEED_USERS = '''
+    INSERT INTO user_attempts (user_id, paid, used, last_bonus_date)
+    SELECT u, 5 + (random() * 20)::int, (random() * 5)::int, current_date - (random() * 30)::int
+    FROM generate_series($1::bigint, $2::bigint) AS u
+    ON CONFLICT (user_id) DO NOTHING
+'''
+# Случайный тип приза на строку; полученные призы — доля $4.
+# Ссылка на u в LATERAL не дает вычислить random() один раз на весь запрос
+SEED_PRIZES = '''
+    INSERT INTO prizes (user_id, prize_type, value, is_claimed, claimed_at, created_at)
+    SELECT u, p.prize_type, p.value, p.claimed, CASE WHEN p.claimed THEN p.created_at END, p.created_at
+    FROM generate_series($1::bigint, $2::bigint) AS u
+    CROSS JOIN LATERAL (
+        SELECT (ARRAY['money', 'money', 'discount', 'attempt'])[1 + floor(random() * 4)::int] AS prize_type,
+               (ARRAY['10', '50', '100', '500'])[1 + floor(random() * 4)::int] AS value,
+               random() < $4 AS claimed,
+               now() - random() * interval '365 days' AS created_at
+        FROM generate_series(1, $3) WHERE u IS NOT NULL
+    ) p
+'''
+SEED_TRANSACTIONS = '''
+    INSERT INTO transactions (user_id, amount, attempts, status, created_at)
+    SELECT u, 100 * n, n, (ARRAY['approved', 'approved', 'rejected', 'pending'])[1 + floor(random() * 4)::int],
+           now() - random() * interval '365 days'
+    FROM generate_series($1::bigint, $2::bigint) AS u
+    CROSS JOIN LATERAL (SELECT 1 + floor(random() * 5)::int AS n FROM generate_series(1, $3) WHERE u IS NOT NULL) t
+'''
+
+
+async def seed(conn, args) -> Dict:
+    """Наполнение базы синтетическими пользователями, призами и транзакциями"""
+    first, last = args.user_id_base, args.user_id_base + args.users - 1
+    existing = await conn.fetchval(
+        'SELECT count(*) FROM user_attempts WHERE user_id BETWEEN $1 AND $2', first, last
+    )
+    if existing and args.reseed:
+        for table in ('prizes', 'transactions', 'user_attempts'):
+            await conn.execute(f'DELETE FROM {table} WHERE user_id BETWEEN $1 AND $2', first, last)
+    elif existing == args.users:
+        return {'seeded': False}
+    elif existing:
+        raise RuntimeError(f"{existing} of {args.users} bench users already exist, rerun with --reseed")
+
+    started = time.perf_counter()
+    for chunk_start in range(first, last + 1, args.seed_chunk):
+        chunk_end = min(last, chunk_start + args.seed_chunk - 1)
+        async with conn.transaction():
+            await conn.execute(SEED_USERS, chunk_start, chunk_end)
+            await conn.execute(SEED_PRIZES, chunk_start, chunk_end, args.prizes_per_user, args.claimed_ratio)
+            await conn.execute(SEED_TRANSACTIONS, chunk_start, chunk_end, args.transactions_per_user)
+        logger.warning(f"Seeded users {chunk_start - first + 1}..{chunk_end - first + 1} of {args.users}")
+    for table in ('user_attempts', 'prizes', 'transactions'):
+        await conn.execute(f'VACUUM ANALYZE {table}')
+    return {'seeded': True, 'seed_seconds': round(time.perf_counter() - started, 3)}
+
+
+async def dataset(conn) -> Dict:
+    """Оценка объема таблиц по статистике планировщика"""
+    rows = await conn.fetch('''
+        SELECT relname, sum(reltuples)::bigint AS rows, sum(pg_total_relation_size(oid)) AS bytes
+        FROM (
+            SELECT c.relname, c.reltuples, c.oid FROM pg_class c
+            WHERE c.relname IN ('user_attempts', 'prizes', 'transactions') AND c.relkind IN ('r', 'p')
+            UNION ALL
+            SELECT p.relname, c.reltuples, c.oid FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname IN ('prizes', 'transactions')
+        ) t
+        GROUP BY relname
+    ''')
+    return {row['relname']: {'rows': row['rows'], 'mb': round(row['bytes'] / 2 ** 20, 1)} for row in rows}
+
+
+class Workload:
+    """Вызовы методов Database со случайными существующими пользователями"""
+
+    def __init__(self, db, args, referee_start: int):
+        from referral import encode_referral_code
+
+        self.db = db
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.encode = encode_referral_code
+        # Приглашенные — новые id за диапазоном наполнения, иначе реферал не засчитывается
+        self.referees = itertools.count(referee_start)
+
+    def user(self) -> int:
+        return self.random.randrange(self.args.user_id_base, self.args.user_id_base + self.args.users)
+
+    def operations(self) -> Dict[str, Callable]:
+        db = self.db
+        return {
+            'get_user_attempts': lambda: db.get_user_attempts(self.user()),
+            'update_user_attempts': lambda: db.update_user_attempts(self.user(), paid=1),
+            'process_referral': lambda: db.process_referral(next(self.referees), self.encode(self.user())),
+            'create_transaction': lambda: db.create_transaction(self.user(), 100, 1),
+            'add_prize': lambda: db.add_prize(self.user(), 'money', '100'),
+            'get_unclaimed_prizes': lambda: db.get_unclaimed_prizes(self.user(), limit=self.args.page_size),
+        }
+
+    def explain_targets(self, method: str) -> List:
+        """Запросы реестра, которые выполняет метод, с аргументами"""
+        from database import MAX_ID
+
+        user_id = self.user()
+        return {
+            'get_user_attempts': [('get_user_attempts', user_id)],
+            'update_user_attempts': [('update_user_attempts', user_id, 1, 0, None)],
+            'process_referral': [('process_referral', next(self.referees), user_id, None)],
+            'create_transaction': [('create_transaction', user_id, 100, 1, 'pending')],
+            'add_prize': [('add_prize', user_id, 'money', '100')],
+            'get_unclaimed_prizes': [
+                ('get_prizes_page', user_id, MAX_ID, self.args.page_size),
+                ('get_prize_summary', user_id),
+            ],
+        }[method]
+
+
+async def run_case(operation: Callable, pool: TimedPool, concurrency: int, duration: float, warmup: float) -> Dict:
+    """concurrency задач вызывают operation в цикле; замеры только после прогрева"""
+    latencies = []
+    errors = []
+    measuring = False
+    deadline = time.perf_counter() + warmup + duration
+
+    async def loop():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                await operation()
+            except Exception as e:
+                errors.append(repr(e))
+                continue
+            if measuring:
+                latencies.append(time.perf_counter() - started)
+
+    tasks = [asyncio.create_task(loop()) for _ in range(concurrency)]
+    await asyncio.sleep(warmup)
+    measuring = True
+    pool.waits.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {
+        'ops': len(latencies),
+        'ops_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': percentiles(latencies),
+        'pool_wait_ms': percentiles(pool.waits),
+        'errors': len(errors),
+        'error_samples': errors[:3],
+    }
+
+
+async def explain(pool, targets: List) -> List[Dict]:
+    """EXPLAIN (ANALYZE, BUFFERS) запросов в транзакции с откатом"""
+    from statements import STATEMENTS
+
+    plans = []
+    async with pool.acquire() as conn:
+        for name, *params in targets:
+            transaction = conn.transaction()
+            await transaction.start()
+            try:
+                result = await conn.fetchval(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {STATEMENTS[name]}', *params)
+            finally:
+                await transaction.rollback()
+            plan = json.loads(result)[0]
+            plans.append({
+                'statement': name,
+                'planning_ms': plan.get('Planning Time'),
+                'execution_ms': plan.get('Execution Time'),
+                'nodes': list(_plan_nodes(plan['Plan'])),
+                'plan': plan['Plan'],
+            })
+    return plans
+
+
+def _plan_nodes(node: Dict):
+    """Краткое описание узлов плана: тип и таблица или индекс"""
+    target = node.get('Index Name') or node.get('Relation Name')
+    yield f"{node['Node Type']} {target}" if target else node['Node Type']
+    for child in node.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+
+async def run(args) -> dict:
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+    # Замеряется база, а не кэш балансов и отложенная запись
+    os.environ['BALANCE_CACHE_SIZE'] = '0'
+    os.environ['WRITE_BEHIND_JOURNAL'] = '0'
+    from database import Database
+
+    methods = args.methods.split(',') if args.methods else list(METHODS)
+    pool_sizes = [int(size) for size in args.pool_sizes.split(',')]
+    concurrency_levels = [int(level) for level in args.concurrency.split(',')]
+
+    results = []
+    plans = {}
+    seed_info = {}
+    for pool_size in pool_sizes:
+        os.environ['DB_POOL_MIN'] = os.environ['DB_POOL_MAX'] = str(pool_size)
+        db = Database()
+        await db.connect()
+        if not seed_info:
+            conn = await db.connect_dedicated()
+            try:
+                seed_info = {'seeded': False} if args.skip_seed else await seed(conn, args)
+                seed_info['tables'] = await dataset(conn)
+                referee_start = await conn.fetchval(
+                    'SELECT coalesce(max(user_id), $1) + 1 FROM user_attempts WHERE user_id >= $1',
+                    args.user_id_base + args.users
+                )
+            finally:
+                await conn.close()
+            workload = Workload(db, args, referee_start)
+        workload.db = db
+        operations = workload.operations()
+        timed_pool = TimedPool(db.pool)
+        db.pool = timed_pool
+
+        for concurrency in concurrency_levels:
+            for method in methods:
+                result = await run_case(operations[method], timed_pool, concurrency, args.duration, args.warmup)
+                result.update(method=method, pool_size=pool_size, concurrency=concurrency)
+                results.append(result)
+                latency = result['latency_ms']
+                print(f"pool={pool_size:<3} c={concurrency:<4} {method:22} {result['ops_per_second']:>10} ops/s "
+                      f"p50={latency['p50']}ms p99={latency['p99']}ms errors={result['errors']}")
+
+        if args.explain and not plans:
+            for method in methods:
+                plans[method] = await explain(timed_pool, workload.explain_targets(method))
+        db.pool = timed_pool._pool
+        await db.close()
+
+    return {
+        'environment': environment(),
+        'parameters': vars(args),
+        'dataset': seed_info,
+        'results': results,
+        'explain': plans,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки методов Database")
+    parser.add_argument('--dsn', help="PostgreSQL DSN (по умолчанию DATABASE_URL)")
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--prizes-per-user', type=int, default=50)
+    parser.add_argument('--transactions-per-user', type=int, default=2)
+    parser.add_argument('--claimed-ratio', type=float, default=0.7, help="доля уже полученных призов")
+    parser.add_argument('--user-id-base', type=int, default=8_000_000_000)
+    parser.add_argument('--seed-chunk', type=int, default=20000, help="пользователей на транзакцию наполнения")
+    parser.add_argument('--skip-seed', action='store_true', help="не проверять и не наполнять базу")
+    parser.add_argument('--reseed', action='store_true', help="удалить и заново создать данные бенчмарка")
+    parser.add_argument('--methods', help=f"через запятую, по умолчанию все: {','.join(METHODS)}")
+    parser.add_argument('--pool-sizes', default='10', help="размеры пула через запятую")
+    parser.add_argument('--concurrency', default='1,8,32,128', help="уровни конкурентности через запятую")
+    parser.add_argument('--duration', type=float, default=5.0, help="секунд замера на случай")
+    parser.add_argument('--warmup', type=float, default=1.0, help="секунд прогрева на случай")
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--no-explain', dest='explain', action='store_false')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_db.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    write_report(args.output, report)
+
+    for method, plans in report['explain'].items():
+        for plan in plans:
+            print(f"{method}/{plan['statement']}: {plan['execution_ms']}ms  {' -> '.join(plan['nodes'])}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+from urllib.parse import parse_qs
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    'id': 100000001,
+    'is_bot': True,
+    'first_name': 'Wheel Bench',
+    'username': 'wheel_bench_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': False,
+}
+
+# Методы, на которые распространяются лимиты и блокировки
+LIMITED_METHODS = {'sendMessage', 'editMessageText', 'sendPhoto'}
+
+
+class FakeBotAPI:
+    """Локальная замена Telegram Bot API для нагрузочных тестов
+
+    Отвечает на вызовы бота правдоподобными объектами, считает вызовы по
+    методам, умеет отдавать 429 с retry_after и 403 для «заблокировавших»
+    бота пользователей. Боту передается base_url вида http://host:port/bot.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, flood_ratio: float = 0.0,
+                 retry_after: int = 1, latency: float = 0.0, blocked_chats: Iterable[int] = (),
+                 blocked_ratio: float = 0.0, seed: Optional[int] = None):
+        self.server = HTTPServer(self.handle, host, port)
+        self.flood_ratio = flood_ratio
+        self.retry_after = retry_after
+        self.latency = latency
+        self.blocked_chats = set(blocked_chats)
+        self.blocked_ratio = blocked_ratio
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.floods = Counter()
+        self.forbidden = Counter()
+        self.sent_to = Counter()
+        self._message_id = 1000
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}/bot"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    def reset(self):
+        """Сброс счетчиков между прогонами"""
+        self.calls.clear()
+        self.floods.clear()
+        self.forbidden.clear()
+        self.sent_to.clear()
+
+    def is_blocked(self, chat_id: int) -> bool:
+        if chat_id in self.blocked_chats:
+            return True
+        # Детерминированно по chat_id, чтобы повторные прогоны видели тех же пользователей
+        return self.blocked_ratio > 0 and random.Random(chat_id).random() < self.blocked_ratio
+
+    @staticmethod
+    def _params(request: Request) -> Dict:
+        content_type = request.headers.get('content-type', '')
+        if not request.body:
+            return {}
+        if content_type.startswith('application/json'):
+            return request.json()
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            params = {}
+            for key, values in parse_qs(request.body.decode(), keep_blank_values=True).items():
+                value = values[-1]
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+            return params
+        return {}
+
+    def _message(self, chat_id, text=None, message_id=None) -> Dict:
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if text is not None:
+            message['text'] = text
+        return message
+
+    async def handle(self, request: Request) -> Response:
+        # /bot<token>/<method>
+        method = request.path.rsplit('/', 1)[-1]
+        params = self._params(request)
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = params.get('chat_id')
+        if method in LIMITED_METHODS and chat_id is not None:
+            if self.is_blocked(int(chat_id)):
+                self.forbidden[method] += 1
+                return Response.json({
+                    'ok': False, 'error_code': 403,
+                    'description': 'Forbidden: bot was blocked by the user'
+                }, 403)
+            if self.flood_ratio and self.random.random() < self.flood_ratio:
+                self.floods[method] += 1
+                return Response.json({
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after}
+                }, 429)
+            self.sent_to[int(chat_id)] += 1
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method in ('sendMessage', 'sendPhoto'):
+            result = self._message(chat_id, params.get('text') or params.get('caption'))
+        elif method == 'editMessageText':
+            result = self._message(chat_id, params.get('text'), params.get('message_id'))
+        elif method == 'getUpdates':
+            await asyncio.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+            result = []
+        else:
+            result = True
+        return Response.json({'ok': True, 'result': result})
+
+
+async def _serve(args):
+    api = FakeBotAPI(args.host, args.port, args.flood_ratio, args.retry_after, args.latency,
+                     blocked_ratio=args.blocked_ratio)
+    await api.start()
+    print(f"Fake Bot API at {api.base_url} (set BOT_API_URL to this value)")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(dict(api.calls), 'floods:', dict(api.floods), 'forbidden:', dict(api.forbidden))
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--flood-ratio', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument('--blocked-ratio', type=float, default=0.0, help="доля пользователей, заблокировавших бота")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Сквозной нагрузочный тест бота
+
+Запуск (из корня репозитория, нужна локальная PostgreSQL):
+
+    python -m bench.loadtest --dsn postgresql://localhost/wheel_bench --users 2000
+
+Бот работает против FakeBotAPI; синтетические пользователи проходят
+/start → ежедневный бонус → покупка → вращения. Отчет с перцентилями
+задержек обработчиков, ожиданием пула и числом вызовов Bot API на
+вращение сохраняется в JSON вместе с хешем коммита.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import defaultdict
+
+from bench.fake_bot_api import BOT_USER, FakeBotAPI
+from bench.report import environment, percentiles, write_report
+
+logger = logging.getLogger(__name__)
+
+
+class TimedPool:
+    """Обертка над пулом asyncpg, замеряющая ожидание соединения"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.waits = []
+
+    def acquire(self, *args, **kwargs):
+        return _TimedAcquire(self, self._pool.acquire(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class _TimedAcquire:
+    def __init__(self, pool: TimedPool, context):
+        self.pool = pool
+        self.context = context
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        conn = await self.context.__aenter__()
+        self.pool.waits.append(time.perf_counter() - started)
+        return conn
+
+    async def __aexit__(self, *exc):
+        return await self.context.__aexit__(*exc)
+
+    def __await__(self):
+        # Как у asyncpg: conn = await pool.acquire(), освобождение через pool.release
+        return self.__aenter__().__await__()
+
+
+class UpdateFactory:
+    """Сборка JSON апдейтов Telegram для синтетических пользователей"""
+
+    def __init__(self):
+        self._update_id = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'language_code': 'ru'}
+
+    def command(self, user_id, text):
+        command = text.split()[0]
+        return {
+            'update_id': next(self._update_id),
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': self._user(user_id),
+                'text': text,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+            }
+        }
+
+    def callback(self, user_id, data):
+        update_id = next(self._update_id)
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': 1,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': BOT_USER,
+                    'text': 'menu',
+                },
+            }
+        }
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(flood_ratio=args.flood_ratio, retry_after=args.retry_after,
+                     latency=args.api_latency, seed=args.seed)
+    await api.start()
+
+    # Модуль бота читает настройки при импорте
+    os.environ['BOT_API_URL'] = api.base_url
+    os.environ['BOT_TOKEN'] = '123456:BENCH'
+    os.environ['ADMIN_ID'] = '0'
+    # Сценарий шлет апдейты подряд; лимитер с настройками по умолчанию отбросил бы
+    # часть вращений, а их время попало бы в замеры
+    os.environ['THROTTLE_RATE'] = str(args.throttle_rate)
+    os.environ['THROTTLE_BURST'] = str(args.throttle_burst)
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+    import wheel_of_fortune_bot as bot
+    from metrics import THROTTLED
+    from telegram import Update
+
+    await bot.init_db()
+    timed_pool = TimedPool(bot.db.pool)
+    bot.db.pool = timed_pool
+
+    errors = []
+
+    async def on_error(update, context):
+        errors.append(repr(context.error))
+
+    application = bot.build_application()
+    application.add_error_handler(on_error)
+    await application.initialize()
+    await application.start()
+    await bot.animator.start(application.bot)
+
+    factory = UpdateFactory()
+    latencies = defaultdict(list)
+    user_ids = range(args.user_id_base, args.user_id_base + args.users)
+
+    if args.seed_attempts:
+        for user_id in user_ids:
+            await bot.db.update_user_attempts(user_id, paid=args.seed_attempts)
+    api.reset()
+    timed_pool.waits.clear()
+    throttled_before = THROTTLED.value('message') + THROTTLED.value('callback')
+
+    async def process(step, data):
+        update = Update.de_json(data, application.bot)
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies[step].append(time.perf_counter() - started)
+
+    async def scenario(user_id):
+        await process('start', factory.command(user_id, '/start'))
+        await process('daily_bonus', factory.callback(user_id, 'daily_bonus'))
+        await process('buy', factory.callback(user_id, 'pay_1'))
+        for _ in range(args.spins_per_user):
+            await process('spin', factory.callback(user_id, 'spin_wheel'))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(user_id):
+        async with semaphore:
+            await scenario(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(user_id) for user_id in user_ids))
+    handlers_elapsed = time.perf_counter() - started
+    # Дожидаемся фоновой анимации, чтобы учесть все вызовы Bot API
+    while bot.animator.pending:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    await bot.animator.stop()
+    await application.stop()
+    await application.shutdown()
+    bot.db.pool = timed_pool._pool
+    await bot.db.close()
+    await api.stop()
+
+    spins = len(latencies['spin'])
+    throttled = THROTTLED.value('message') + THROTTLED.value('callback') - throttled_before
+    total_calls = sum(api.calls.values())
+    return {
+        'environment': environment(),
+        'parameters': vars(args),
+        'elapsed_seconds': round(elapsed, 3),
+        'handlers_elapsed_seconds': round(handlers_elapsed, 3),
+        'spins_per_second': round(spins / handlers_elapsed, 2) if handlers_elapsed else None,
+        'handler_latency_ms': {step: percentiles(samples) for step, samples in latencies.items()},
+        'all_handlers_latency_ms': percentiles([s for samples in latencies.values() for s in samples]),
+        'pool_wait_ms': percentiles(timed_pool.waits),
+        'bot_api': {
+            'calls': dict(api.calls),
+            'total_calls': total_calls,
+            'calls_per_spin': round(total_calls / spins, 3) if spins else None,
+            'edits_per_spin': round(api.calls['editMessageText'] / spins, 3) if spins else None,
+            'injected_429': dict(api.floods),
+        },
+        'animator': {
+            'frames_sent': bot.animator.frames_sent,
+            'frames_dropped': bot.animator.frames_dropped,
+            'retry_after': bot.animator.retry_after_count,
+        },
+        # Отброшенные лимитером апдейты тоже попадают в задержки; при ненуле отчет недостоверен
+        'throttled_updates': int(throttled),
+        'handler_errors': len(errors),
+        'handler_error_samples': errors[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота против фейкового Bot API")
+    parser.add_argument('--dsn', help="PostgreSQL DSN (по умолчанию DATABASE_URL)")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100, help="одновременно активных пользователей")
+    parser.add_argument('--spins-per-user', type=int, default=3)
+    parser.add_argument('--seed-attempts', type=int, default=3, help="попыток начислить каждому перед прогоном")
+    parser.add_argument('--user-id-base', type=int, default=9_000_000_000)
+    parser.add_argument('--flood-ratio', type=float, default=0.0, help="доля ответов 429 от Bot API")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--api-latency', type=float, default=0.0, help="задержка ответа Bot API, секунды")
+    parser.add_argument('--throttle-rate', type=float, default=1000.0, help="THROTTLE_RATE бота на время прогона (0 — без ограничения)")
+    parser.add_argument('--throttle-burst', type=float, default=1000.0, help="THROTTLE_BURST бота на время прогона")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    write_report(args.output, report)
+
+    print(f"Spins/sec: {report['spins_per_second']}  (elapsed {report['elapsed_seconds']}s)")
+    for step, stats in report['handler_latency_ms'].items():
+        print(f"  {step:12} p50={stats['p50']}ms p95={stats['p95']}ms p99={stats['p99']}ms n={stats['count']}")
+    pool = report['pool_wait_ms']
+    print(f"  pool wait    p50={pool['p50']}ms p95={pool['p95']}ms p99={pool['p99']}ms")
+    print(f"Bot API calls per spin: {report['bot_api']['calls_per_spin']}, errors: {report['handler_errors']}")
+    if report['throttled_updates']:
+        print(f"WARNING: {report['throttled_updates']} updates were dropped by the rate limiter, "
+              f"raise --throttle-rate/--throttle-burst")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
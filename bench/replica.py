@@ -0,0 +1,132 @@
+"""Проверка разделения чтения и записи на двух PostgreSQL с потоковой репликацией
+
+Запуск (из корня репозитория; реплика — hot standby основного сервера):
+
+    python -m bench.replica --dsn postgresql://localhost:5432/wheel_bench \
+        --replica-dsn postgresql://localhost:5433/wheel_bench --users 2000
+
+Для каждого пользователя выполняется запись и сразу чтение баланса (кэш
+балансов отключен). Прогон с закреплением за основным сервером
+(DB_READ_YOUR_WRITES) не должен давать устаревших чтений, контрольный
+прогон без закрепления показывает, сколько их было бы из-за отставания
+реплики. Отчет содержит отставание реплики и число соединений каждого пула.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from bench.loadtest import TimedPool
+from bench.report import environment, percentiles, write_report
+
+logger = logging.getLogger(__name__)
+
+
+async def replica_lag(db) -> dict:
+    """Состояние реплики: режим восстановления и отставание по последней транзакции"""
+    async with db.replica_pool.acquire() as conn:
+        row = await conn.fetchrow('''
+            SELECT pg_is_in_recovery() AS in_recovery,
+                   extract(epoch FROM now() - pg_last_xact_replay_timestamp()) AS lag_seconds
+        ''')
+    return {'in_recovery': row['in_recovery'], 'lag_seconds': row['lag_seconds']}
+
+
+async def write_then_read(db, user_ids, concurrency: int, pin_seconds: float) -> dict:
+    """Запись +1 попытки и немедленное чтение; устаревшее чтение — баланс без этой записи"""
+    db.read_your_writes = pin_seconds
+    db._primary_until.clear()
+    primary, replica = TimedPool(db.pool), TimedPool(db.replica_pool)
+    db.pool, db.replica_pool = primary, replica
+
+    stale = []
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(user_id):
+        async with semaphore:
+            await db.update_user_attempts(user_id, paid=1)
+            async with db.pool.acquire() as conn:
+                expected = await conn.fetchval('SELECT paid FROM user_attempts WHERE user_id = $1', user_id)
+            started = time.perf_counter()
+            attempts = await db.get_user_attempts(user_id)
+            latencies.append(time.perf_counter() - started)
+            if attempts['paid'] != expected:
+                stale.append(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(check(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    db.pool, db.replica_pool = primary._pool, replica._pool
+    return {
+        'pin_seconds': pin_seconds,
+        'elapsed_seconds': round(elapsed, 3),
+        'stale_reads': len(stale),
+        'stale_samples': stale[:5],
+        'read_latency_ms': percentiles(latencies),
+        # Каждая проверка берет из основного пула два соединения: запись и эталонное чтение
+        'primary_acquires': len(primary.waits),
+        'replica_acquires': len(replica.waits),
+    }
+
+
+async def run(args) -> dict:
+    if args.dsn:
+        os.environ['DATABASE_URL'] = args.dsn
+    os.environ['DATABASE_REPLICA_URL'] = args.replica_dsn
+    # Чтения должны доходить до базы, а не до кэша балансов
+    os.environ['BALANCE_CACHE_SIZE'] = '0'
+    from database import Database
+
+    db = Database()
+    await db.connect()
+    if not db.replica_pool:
+        raise RuntimeError("Replica pool is not available, check --replica-dsn")
+    try:
+        user_ids = range(args.user_id_base, args.user_id_base + args.users)
+        lag_before = await replica_lag(db)
+        pinned = await write_then_read(db, user_ids, args.concurrency, args.pin_seconds)
+        unpinned = await write_then_read(db, user_ids, args.concurrency, 0.0)
+        # Даем реплике догнать основной сервер перед замером
+        await asyncio.sleep(args.settle)
+        lag_after = await replica_lag(db)
+    finally:
+        await db.close()
+    return {
+        'environment': environment(),
+        'parameters': vars(args),
+        'replica_before': lag_before,
+        'replica_after': lag_after,
+        'pinned': pinned,
+        'unpinned': unpinned,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка чтения с реплики и read-your-writes")
+    parser.add_argument('--dsn', help="основной сервер (по умолчанию DATABASE_URL)")
+    parser.add_argument('--replica-dsn', required=True, help="hot standby основного сервера")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--user-id-base', type=int, default=9_800_000_000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--pin-seconds', type=float, default=5.0)
+    parser.add_argument('--settle', type=float, default=1.0)
+    parser.add_argument('--output', default='bench_replica.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    write_report(args.output, report)
+
+    for mode in ('pinned', 'unpinned'):
+        result = report[mode]
+        latency = result['read_latency_ms']
+        print(f"{mode:9} stale reads: {result['stale_reads']}/{args.users}, "
+              f"replica reads: {result['replica_acquires']}, read p50={latency['p50']}ms p99={latency['p99']}ms")
+    print(f"Replica lag after run: {report['replica_after']['lag_seconds']}s")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
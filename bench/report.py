@@ -0,0 +1,44 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, Sequence
+
+
+def percentiles(samples: Sequence[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """Перцентили выборки в миллисекундах (samples в секундах)"""
+    if not samples:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        result[f"p{p}"] = round(ordered[index] * 1000, 3)
+    result['mean'] = round(sum(ordered) / len(ordered) * 1000, 3)
+    result['count'] = len(ordered)
+    return result
+
+
+def git_revision() -> Dict:
+    """Текущий коммит и признак незакоммиченных изменений"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def environment() -> Dict:
+    """Метаданные запуска для сравнения результатов между коммитами"""
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'git': git_revision(),
+    }
+
+
+def write_report(path: str, report: Dict):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
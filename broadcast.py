@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from animation import TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+SEND_RETRIES = 3
+
+
+class _Progress:
+    """Водяной знак: наибольший user_id, до которого все отправки завершены"""
+
+    def __init__(self, last_user_id: int):
+        self.last_user_id = last_user_id
+        self._in_flight = OrderedDict()
+
+    def started(self, user_id: int):
+        self._in_flight[user_id] = False
+
+    def finished(self, user_id: int):
+        self._in_flight[user_id] = True
+        while self._in_flight:
+            user_id, done = next(iter(self._in_flight.items()))
+            if not done:
+                break
+            self._in_flight.popitem(last=False)
+            self.last_user_id = user_id
+
+
+class Broadcaster:
+    """Массовая рассылка с ограничением скорости и продолжением после сбоя
+
+    Получатели читаются курсором по возрастанию user_id, сообщения уходят
+    не чаще rate в секунду и не более concurrency одновременно. Позиция
+    сохраняется каждые checkpoint_every отправок: после перезапуска рассылка
+    продолжается с последнего сохраненного user_id (пользователи между
+    сохранением и сбоем могут получить сообщение повторно). Заблокировавшие
+    бота помечаются и пропускаются следующими рассылками. Пользователи, чьи
+    попытки исчерпаны на flood control, повторяются в конце прохода; до
+    этого водяной знак их не переходит, и после сбоя они не теряются.
+    """
+
+    def __init__(self, db, rate: float = 20.0, concurrency: int = 10,
+                 checkpoint_every: int = 500, retry_blocked_days: int = 30):
+        self.db = db
+        self.bot = None
+        self.rate = rate
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.retry_blocked_days = retry_blocked_days
+        self._bucket = TokenBucket(rate, max(1.0, rate / 5))
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def start(self, bot):
+        self.bot = bot
+
+    async def stop(self):
+        """Остановка рассылок с сохранением позиции"""
+        for task in self._tasks.values():
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def create(self, text: str, created_by: int) -> int:
+        """Создание и запуск новой рассылки"""
+        broadcast_id = await self.db.create_broadcast(text, created_by)
+        self._launch(broadcast_id, text, 0, {'sent': 0, 'failed': 0, 'blocked': 0})
+        return broadcast_id
+
+    async def resume_all(self) -> List[int]:
+        """Продолжение незавершенных рассылок после перезапуска"""
+        resumed = []
+        for row in await self.db.get_running_broadcasts():
+            if row['id'] in self._tasks:
+                continue
+            logger.info(f"Resuming broadcast {row['id']} after user {row['last_user_id']}")
+            self._launch(row['id'], row['text'], row['last_user_id'],
+                         {'sent': row['sent'], 'failed': row['failed'], 'blocked': row['blocked']})
+            resumed.append(row['id'])
+        return resumed
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Отмена рассылки"""
+        task = self._tasks.get(broadcast_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        await self.db.save_broadcast_progress(
+            broadcast_id, broadcast['last_user_id'], broadcast['sent'],
+            broadcast['failed'], broadcast['blocked'], 'cancelled'
+        )
+        return True
+
+    def is_running(self, broadcast_id: int) -> bool:
+        return broadcast_id in self._tasks
+
+    def _launch(self, broadcast_id: int, text: str, after_user_id: int, counters: Dict):
+        task = asyncio.create_task(self._run(broadcast_id, text, after_user_id, counters))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _acquire_token(self):
+        while True:
+            now = time.monotonic()
+            delay = self._bucket.delay(now)
+            if delay <= 0 and self._bucket.try_consume(now):
+                return
+            await asyncio.sleep(max(delay, 0.001))
+
+    async def send(self, chat_id: int, text: str) -> str:
+        """Отправка одного сообщения: 'sent', 'blocked', 'failed' или 'throttled'
+
+        'throttled' — все попытки закончились на RetryAfter, сообщение стоит
+        отправить позже.
+        """
+        throttled = False
+        for _ in range(SEND_RETRIES):
+            await self._acquire_token()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
+                return 'sent'
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                self._bucket.pause(time.monotonic() + delay)
+                logger.warning(f"Broadcast flood control: retry after {delay}s")
+                throttled = True
+            except Forbidden:
+                return 'blocked'
+            except BadRequest as e:
+                logger.debug(f"Broadcast to {chat_id} rejected: {e}")
+                return 'failed'
+            except TelegramError as e:
+                logger.warning(f"Broadcast to {chat_id} failed: {e}")
+                await asyncio.sleep(1)
+                throttled = False
+        return 'throttled' if throttled else 'failed'
+
+    async def notify(self, user_ids: Iterable[int], text: str) -> Dict[str, int]:
+        """Разовая отправка небольшой группе пользователей с тем же лимитом"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {'sent': 0, 'failed': 0, 'blocked': 0}
+
+        async def deliver(user_id):
+            async with semaphore:
+                result = await self.send(user_id, text)
+                results['failed' if result == 'throttled' else result] += 1
+
+        await asyncio.gather(*(deliver(user_id) for user_id in user_ids))
+        return results
+
+    async def _run(self, broadcast_id: int, text: str, after_user_id: int, counters: Dict):
+        progress = _Progress(after_user_id)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        blocked: List[int] = []
+        throttled: List[int] = []
+        since_checkpoint = 0
+        in_flight = set()
+
+        async def checkpoint(status='running'):
+            nonlocal blocked, since_checkpoint
+            batch, blocked = blocked, []
+            since_checkpoint = 0
+            await self.db.mark_users_blocked(batch)
+            await self.db.save_broadcast_progress(
+                broadcast_id, progress.last_user_id, counters['sent'],
+                counters['failed'], counters['blocked'], status
+            )
+
+        async def deliver(user_id, final):
+            nonlocal since_checkpoint
+            try:
+                result = await self.send(user_id, text)
+            except asyncio.CancelledError:
+                # Неотправленный пользователь не сдвигает водяной знак
+                semaphore.release()
+                raise
+            except Exception as e:
+                logger.error(f"Broadcast to {user_id} crashed: {e}")
+                result = 'failed'
+            if result == 'throttled' and not final:
+                # Не завершен: водяной знак остановится на нем до повтора
+                throttled.append(user_id)
+                semaphore.release()
+                return
+            if result == 'throttled':
+                result = 'failed'
+            counters[result] += 1
+            if result == 'blocked':
+                blocked.append(user_id)
+            progress.finished(user_id)
+            since_checkpoint += 1
+            semaphore.release()
+
+        async def launch(user_id, final=False):
+            await semaphore.acquire()
+            task = asyncio.create_task(deliver(user_id, final))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            if since_checkpoint >= self.checkpoint_every:
+                await checkpoint()
+
+        recipients = self.db.iter_broadcast_recipients(after_user_id, self.retry_blocked_days)
+        try:
+            async for user_id in recipients:
+                progress.started(user_id)
+                await launch(user_id)
+            if in_flight:
+                await asyncio.gather(*in_flight)
+            # Повтор упершихся в flood control: send дождется снятия паузы
+            retry, throttled = throttled, []
+            for user_id in retry:
+                await launch(user_id, final=True)
+            if in_flight:
+                await asyncio.gather(*in_flight)
+            await checkpoint('done')
+            logger.info(f"Broadcast {broadcast_id} finished: {counters}")
+        except asyncio.CancelledError:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            await self._safe_checkpoint(broadcast_id, checkpoint)
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped at user {progress.last_user_id}: {e}")
+            await self._safe_checkpoint(broadcast_id, checkpoint)
+        finally:
+            await recipients.aclose()
+
+    @staticmethod
+    async def _safe_checkpoint(broadcast_id: int, checkpoint):
+        try:
+            await checkpoint()
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} progress was not saved: {e}")
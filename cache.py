@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+
+class BalanceCache:
+    """Ограниченный LRU-кэш балансов пользователей с TTL
+
+    Хранит paid, used и last_bonus_date. Заполняется при чтении и
+    обновляется сквозной записью из методов Database, которые меняют баланс.
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._owns: Optional[Callable[[int], bool]] = None
+        self._forward: Optional[Callable[[int], None]] = None
+        self.forwarded = 0
+
+    def set_owner(self, owns: Callable[[int], bool], forward: Callable[[int], None]) -> None:
+        """Многопроцессный режим: кэшируются только свои пользователи
+
+        Запись баланса чужого пользователя (подтверждение платежа, бонус
+        пригласившему) не кэшируется, а передается владельцу через forward
+        для инвалидации его копии (и закрепления за основным сервером, если
+        чтения идут с реплики).
+        """
+        self._owns = owns
+        self._forward = forward
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        """Баланс из кэша или None"""
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        _, paid, used, last_bonus_date = entry
+        return {
+            'paid': paid,
+            'used': used,
+            'remaining': paid - used,
+            'last_bonus_date': last_bonus_date
+        }
+
+    def set(self, user_id: int, paid: int, used: int, last_bonus_date, ttl: Optional[float] = None) -> None:
+        """Сохранение актуального баланса; ttl — срок короче общего"""
+        if self._owns is not None and not self._owns(user_id):
+            self.forwarded += 1
+            self._forward(user_id)
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[user_id] = (time.monotonic() + ttl, paid, used, last_bonus_date)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set_row(self, row) -> None:
+        """Сохранение баланса из строки user_attempts (user_id, paid, used, last_bonus_date)"""
+        self.set(row['user_id'], row['paid'], row['used'], row['last_bonus_date'])
+
+    def invalidate(self, user_id: int) -> None:
+        """Удаление пользователя из кэша"""
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
@@ -1,17 +1,63 @@
 import os
+import time
+import asyncio
 import asyncpg
 from dotenv import load_dotenv
 import logging
-from datetime import datetime
-import random
-from typing import Optional, Dict, List
+from datetime import date, datetime, timezone
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, Tuple
+from zoneinfo import ZoneInfo
+from journal import WriteBehindJournal
+from cache import BalanceCache
+from archive import PARTITIONED_TABLES, ensure_partitions
+from migrations import migrate
+from metrics import DB_POOL_WAIT, REGISTRY, observe_db
+from referral import decode_referral_code
+from statements import READ_STATEMENTS, STATEMENTS, PreparedConnection
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Верхняя граница SERIAL для keyset-пагинации «с начала»
+MAX_ID = 2 ** 31 - 1
+
 class Database:
     def __init__(self):
         self.pool = None
+        self.replica_pool = None
+        self.journal = None
+        # Таблицы лидеров (leaderboard.Leaderboards) обновляются при вращениях и рефералах
+        self.leaderboards = None
+        self._dsn = None
+        self._ssl = None
+        
+        # Пул: размеры, таймауты и кэш выражений из окружения
+        self.pool_min_size = int(os.getenv('DB_POOL_MIN', 2))
+        self.pool_max_size = int(os.getenv('DB_POOL_MAX', 10))
+        self.connect_timeout = float(os.getenv('DB_CONNECT_TIMEOUT', 30))
+        self.command_timeout = float(os.getenv('DB_COMMAND_TIMEOUT', 30)) or None
+        self.max_inactive_lifetime = float(os.getenv('DB_MAX_INACTIVE_LIFETIME', 300))
+        # Реестр целиком помещается в кэш выражений, иначе прогрев вытесняется
+        self.statement_cache_size = max(int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100)), len(STATEMENTS))
+        # PgBouncer в режиме transaction pooling не поддерживает именованные выражения
+        self.pgbouncer = os.getenv('DB_PGBOUNCER', '0') == '1'
+        self.ssl = os.getenv('DB_SSL') or None
+        
+        # Реплика для чтений, допускающих отставание; после записи пользователь
+        # на read_your_writes секунд закрепляется за основным сервером
+        self.replica_url = os.getenv('DATABASE_REPLICA_URL')
+        self.replica_pool_max_size = int(os.getenv('DB_REPLICA_POOL_MAX', self.pool_max_size))
+        self.read_your_writes = float(os.getenv('DB_READ_YOUR_WRITES', 5))
+        self._primary_until: Dict[int, float] = {}
+        self._pins_prune_at = 1024
+        
+        # Кэш балансов: строки user_attempts меняет только этот процесс
+        cache_size = int(os.getenv('BALANCE_CACHE_SIZE', 100000))
+        self.cache = BalanceCache(
+            max_size=cache_size,
+            ttl=float(os.getenv('BALANCE_CACHE_TTL', 300))
+        ) if cache_size > 0 else None
 
     async def connect(self):
         """Установка соединения с PostgreSQL"""
@@ -22,19 +68,53 @@ class Database:
                 if not database_url:
                     raise ValueError("DATABASE_URL not set in .env")
                 
-                if 'railway' in database_url:
-                    database_url = database_url.replace('postgresql://', 'postgres://')
-                
-                ssl_setting = 'require' if 'railway' in database_url else None
+                # Миграции и долгие задачи идут мимо PgBouncer, если задан прямой адрес
+                self._dsn = os.getenv('DATABASE_DIRECT_URL') or database_url
+                self._ssl = self.ssl
                 
+                # Миграции до создания пула: init пула готовит запросы по актуальной схеме
+                await self.migrate()
                 self.pool = await asyncpg.create_pool(
                     dsn=database_url,
-                    min_size=1,
-                    max_size=10,
-                    timeout=30,
-                    ssl=ssl_setting
+                    min_size=self.pool_min_size,
+                    max_size=self.pool_max_size,
+                    timeout=self.connect_timeout,
+                    command_timeout=self.command_timeout,
+                    max_inactive_connection_lifetime=self.max_inactive_lifetime,
+                    statement_cache_size=0 if self.pgbouncer else self.statement_cache_size,
+                    max_cached_statement_lifetime=0,
+                    connection_class=PreparedConnection,
+                    init=self._init_connection,
+                    ssl=self.ssl
                 )
-                await self.create_tables()
+                if self.replica_url and not self.replica_pool:
+                    try:
+                        self.replica_pool = await asyncpg.create_pool(
+                            dsn=self.replica_url,
+                            min_size=min(self.pool_min_size, self.replica_pool_max_size),
+                            max_size=self.replica_pool_max_size,
+                            timeout=self.connect_timeout,
+                            command_timeout=self.command_timeout,
+                            max_inactive_connection_lifetime=self.max_inactive_lifetime,
+                            statement_cache_size=0 if self.pgbouncer else self.statement_cache_size,
+                            max_cached_statement_lifetime=0,
+                            connection_class=PreparedConnection,
+                            init=self._init_replica_connection,
+                            ssl=self.ssl
+                        )
+                        logger.info("Read replica pool established")
+                    except Exception as e:
+                        # Без реплики бот работает, все запросы идут на основной сервер
+                        logger.error(f"Read replica connection error, using primary only: {e}")
+                
+                # Отложенная пакетная запись призов и транзакций
+                if os.getenv('WRITE_BEHIND_JOURNAL', '0') == '1':
+                    self.journal = WriteBehindJournal(
+                        self.pool,
+                        max_rows=int(os.getenv('JOURNAL_MAX_ROWS', 500)),
+                        flush_interval=float(os.getenv('JOURNAL_FLUSH_INTERVAL', 1.0))
+                    )
+                    await self.journal.start()
                 logger.info("Database connection established")
                 return True
             except Exception as e:
@@ -43,63 +123,165 @@ class Database:
                     raise
                 await asyncio.sleep(2 ** attempt)
 
-    async def create_tables(self):
-        """Создание таблиц в PostgreSQL"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS user_attempts (
-                    user_id BIGINT PRIMARY KEY, 
-                    paid INTEGER DEFAULT 0, 
-                    used INTEGER DEFAULT 0,
-                    last_bonus_date TEXT,
-                    referral_code TEXT UNIQUE,
-                    referred_by BIGINT DEFAULT NULL,
-                    referrals_count INTEGER DEFAULT 0
-                )
-            ''')
+    async def connect_dedicated(self, read: bool = False) -> asyncpg.Connection:
+        """Отдельное соединение вне пула для долгих фоновых задач; read=True — к реплике, если она задана"""
+        return await asyncpg.connect(
+            dsn=self.replica_url if read and self.replica_url else self._dsn,
+            ssl=self._ssl, timeout=self.connect_timeout,
+            statement_cache_size=0 if self.pgbouncer else self.statement_cache_size
+        )
 
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS payment_methods (
-                    id SERIAL PRIMARY KEY,
-                    name TEXT NOT NULL UNIQUE,
-                    details TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            ''')
+    async def _init_connection(self, conn: PreparedConnection):
+        """Подготовка запросов реестра на новом соединении пула"""
+        if not self.pgbouncer:
+            await conn.prepare_registry()
 
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    amount INTEGER NOT NULL,
-                    attempts INTEGER NOT NULL,
-                    status TEXT NOT NULL,
-                    receipt_id TEXT,
-                    admin_id BIGINT,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT
-                )
-            ''')
+    async def _init_replica_connection(self, conn: PreparedConnection):
+        """На реплике готовятся только читающие запросы реестра"""
+        if not self.pgbouncer:
+            await conn.prepare_registry(READ_STATEMENTS)
 
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS prizes (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    prize_type TEXT NOT NULL,
-                    value TEXT NOT NULL,
-                    is_claimed BOOLEAN DEFAULT FALSE,
-                    created_at TEXT NOT NULL
-                )
-            ''')
+    async def _run(self, conn, method: str, name: str, *args):
+        """Выполнение запроса реестра: подготовленного или текстом в режиме PgBouncer"""
+        # Кэш выражений asyncpg сам переподготавливает запрос после смены схемы
+        return await getattr(conn, method)(STATEMENTS[name], *args)
+
+    @asynccontextmanager
+    async def _acquire(self, read: bool = False, user_id: Optional[int] = None):
+        """Соединение из пула с замером времени ожидания
+
+        read=True — запрос допускает отставание реплики: он идет в пул реплики,
+        если пользователь не закреплен за основным сервером после своей записи.
+        При недоступной реплике используется основной пул.
+        """
+        pool = self.pool
+        if read and self.replica_pool and not self._pinned(user_id):
+            pool = self.replica_pool
+        started = time.perf_counter()
+        try:
+            conn = await pool.acquire()
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+            if pool is self.pool:
+                raise
+            logger.warning(f"Replica unavailable, reading from primary: {e}")
+            pool = self.pool
+            conn = await pool.acquire()
+        DB_POOL_WAIT.observe(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    def _pin(self, *user_ids: int):
+        """Закрепление пользователей за основным сервером после записи"""
+        if not self.replica_pool or not self.read_your_writes:
+            return
+        now = time.monotonic()
+        until = now + self.read_your_writes
+        for user_id in user_ids:
+            self._primary_until[user_id] = until
+        if len(self._primary_until) > self._pins_prune_at:
+            self._primary_until = {
+                user_id: deadline for user_id, deadline in self._primary_until.items() if deadline > now
+            }
+            self._pins_prune_at = max(1024, 2 * len(self._primary_until))
+
+    def _pinned(self, user_id: Optional[int]) -> bool:
+        return user_id is not None and self._primary_until.get(user_id, 0.0) > time.monotonic()
+
+    def invalidate_user(self, user_id: int):
+        """Баланс изменен другим процессом: сброс кэша и закрепление за основным сервером"""
+        if self.cache:
+            self.cache.invalidate(user_id)
+        self._pin(user_id)
+
+    def register_metrics(self):
+        """Метрики пула, кэша и журнала"""
+        REGISTRY.callback(
+            'wheelbot_db_pool_connections', 'asyncpg pool connections by state',
+            lambda: {
+                'size': self.pool.get_size(),
+                'idle': self.pool.get_idle_size(),
+                'in_use': self.pool.get_size() - self.pool.get_idle_size(),
+                'max': self.pool.get_max_size()
+            } if self.pool else None,
+            labels=['state']
+        )
+        if self.replica_url:
+            REGISTRY.callback(
+                'wheelbot_db_replica_pool_connections', 'asyncpg replica pool connections by state',
+                lambda: {
+                    'size': self.replica_pool.get_size(),
+                    'idle': self.replica_pool.get_idle_size(),
+                    'max': self.replica_pool.get_max_size()
+                } if self.replica_pool else None,
+                labels=['state']
+            )
+            REGISTRY.callback('wheelbot_db_primary_pinned_users', 'Users pinned to the primary after a write',
+                              lambda: len(self._primary_until))
+        if self.cache:
+            REGISTRY.callback(
+                'wheelbot_balance_cache_requests_total', 'Balance cache lookups by result',
+                lambda: {'hit': self.cache.hits, 'miss': self.cache.misses},
+                labels=['result'], type='counter'
+            )
+            REGISTRY.callback('wheelbot_balance_cache_size', 'Cached balances', lambda: len(self.cache._entries))
+        REGISTRY.callback(
+            'wheelbot_journal_buffered_rows', 'Rows waiting in the write-behind journal',
+            lambda: self.journal.size if self.journal else None
+        )
+
+    async def close(self):
+        """Сброс журнала и закрытие пула соединений"""
+        if self.journal:
+            try:
+                await self.journal.close()
+            except Exception as e:
+                logger.error(f"Journal final flush error: {e}")
+            self.journal = None
+        if self.replica_pool:
+            await self.replica_pool.close()
+            self.replica_pool = None
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def migrate(self):
+        """Применение миграций схемы на отдельном соединении"""
+        conn = await self.connect_dedicated()
+        try:
+            version = await migrate(conn)
+            logger.info(f"Database schema version {version}")
+        finally:
+            await conn.close()
+
+    async def ensure_partitions(self, months_ahead: int = 3) -> List[str]:
+        """Создание недостающих месячных партиций prizes и transactions"""
+        created = []
+        async with self._acquire() as conn:
+            for table in PARTITIONED_TABLES:
+                created += await ensure_partitions(conn, table, months_ahead)
+        return created
 
     # User Attempts Methods
+    @observe_db
     async def get_user_attempts(self, user_id: int) -> Dict:
         """Получение попыток пользователя"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT paid, used, last_bonus_date FROM user_attempts WHERE user_id = $1',
-                user_id
-            )
+        if self.cache:
+            cached = self.cache.get(user_id)
+            if cached:
+                return cached
+        # Чтение с реплики кэшируется не дольше окна read-your-writes: запись
+        # из другого процесса могла еще не дойти до реплики
+        from_replica = self.replica_pool is not None and not self._pinned(user_id)
+        ttl = (self.read_your_writes or None) if from_replica else None
+        async with self._acquire(read=True, user_id=user_id) as conn:
+            row = await self._run(conn, 'fetchrow', 'get_user_attempts', user_id)
+            if self.cache:
+                if row:
+                    self.cache.set(user_id, row['paid'], row['used'], row['last_bonus_date'], ttl)
+                else:
+                    self.cache.set(user_id, 0, 0, None, ttl)
             if row:
                 return {
                     'paid': row['paid'],
@@ -109,114 +291,90 @@ class Database:
                 }
             return {'paid': 0, 'used': 0, 'remaining': 0, 'last_bonus_date': None}
 
-    async def update_user_attempts(self, user_id: int, paid: int = 0, used: int = 0, last_bonus_date: Optional[str] = None) -> bool:
+    @observe_db
+    async def update_user_attempts(self, user_id: int, paid: int = 0, used: int = 0, last_bonus_date: Optional[date] = None) -> bool:
         """Обновление попыток пользователя"""
-        async with self.pool.acquire() as conn:
-            async with conn.transaction():
-                await conn.execute('''
-                    INSERT INTO user_attempts (user_id) 
-                    VALUES ($1)
-                    ON CONFLICT (user_id) DO NOTHING
-                ''', user_id)
-                
-                updates = []
-                params = []
-                param_count = 1
-                
-                if paid != 0:
-                    updates.append(f"paid = paid + ${param_count}")
-                    params.append(paid)
-                    param_count += 1
-                
-                if used != 0:
-                    updates.append(f"used = used + ${param_count}")
-                    params.append(used)
-                    param_count += 1
-                
-                if last_bonus_date:
-                    updates.append(f"last_bonus_date = ${param_count}")
-                    params.append(last_bonus_date)
-                    param_count += 1
-                
-                if updates:
-                    query = f'''
-                        UPDATE user_attempts 
-                        SET {', '.join(updates)}
-                        WHERE user_id = ${param_count}
-                    '''
-                    params.append(user_id)
-                    await conn.execute(query, *params)
-                return True
+        async with self._acquire() as conn:
+            row = await self._run(conn, 'fetchrow', 'update_user_attempts',
+                                  user_id, paid, used, last_bonus_date)
+        self._pin(user_id)
+        if self.cache:
+            self.cache.set_row(row)
+        return True
 
-    async def generate_referral_code(self, user_id: int) -> str:
-        """Генерация реферального кода"""
-        code = f"REF{user_id}{random.randint(1000, 9999)}"
-        async with self.pool.acquire() as conn:
-            await conn.execute(
-                'UPDATE user_attempts SET referral_code = $1 WHERE user_id = $2',
-                code, user_id
-            )
-        return code
+    @observe_db
+    async def claim_daily_bonus(self, user_id: int, tz: str, bonus: int = 1) -> Tuple[bool, Dict]:
+        """Атомарное начисление ежедневного бонуса по дате в часовом поясе tz"""
+        # Повторный запрос в тот же день отсекается по кэшу без обращения к БД
+        if self.cache:
+            cached = self.cache.get(user_id)
+            if cached and cached['last_bonus_date'] == datetime.now(ZoneInfo(tz)).date():
+                return False, cached
+        
+        async with self._acquire() as conn:
+            row = await self._run(conn, 'fetchrow', 'claim_daily_bonus', user_id, bonus, tz)
+        
+        if not row:
+            # Строку создал параллельный запрос после снимка — бонус уже выдан
+            if self.cache:
+                self.cache.invalidate(user_id)
+            self._pin(user_id)
+            return False, await self.get_user_attempts(user_id)
+        if row['granted']:
+            self._pin(user_id)
+        if self.cache:
+            self.cache.set_row(row)
+        return row['granted'], {
+            'paid': row['paid'],
+            'used': row['used'],
+            'remaining': row['paid'] - row['used'],
+            'last_bonus_date': row['last_bonus_date']
+        }
 
+    @observe_db
     async def get_referral_info(self, user_id: int) -> Optional[Dict]:
         """Получение реферальной информации"""
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(
-                '''SELECT referral_code, referred_by, referrals_count 
-                   FROM user_attempts WHERE user_id = $1''',
-                user_id
-            )
+        async with self._acquire(read=True, user_id=user_id) as conn:
+            row = await self._run(conn, 'fetchrow', 'get_referral_info', user_id)
             if row:
                 return {
-                    'code': row['referral_code'],
                     'referred_by': row['referred_by'],
                     'count': row['referrals_count']
                 }
             return None
 
+    @observe_db
     async def process_referral(self, user_id: int, referral_code: str) -> bool:
-        """Обработка реферала"""
-        async with self.pool.acquire() as conn:
-            async with conn.transaction():
-                referrer = await conn.fetchrow(
-                    'SELECT user_id FROM user_attempts WHERE referral_code = $1',
-                    referral_code
-                )
-                if not referrer:
-                    return False
-                
-                referrer_id = referrer['user_id']
-                
-                await conn.execute(
-                    'UPDATE user_attempts SET referred_by = $1 WHERE user_id = $2',
-                    referrer_id, user_id
-                )
-                
-                await conn.execute('''
-                    UPDATE user_attempts 
-                    SET referrals_count = referrals_count + 1,
-                        paid = paid + 1 
-                    WHERE user_id = $1
-                ''', referrer_id)
-                
-                await conn.execute(
-                    'UPDATE user_attempts SET paid = paid + 1 WHERE user_id = $1',
-                    user_id
-                )
-                
-                return True
+        """Регистрация по реферальному коду одним идемпотентным запросом"""
+        referrer_id, legacy_code = decode_referral_code(referral_code)
+        if referrer_id is None or referrer_id == user_id:
+            return False
+        
+        async with self._acquire() as conn:
+            rows = await self._run(conn, 'fetch', 'process_referral', user_id, referrer_id, legacy_code)
+        
+        if self.cache:
+            for row in rows:
+                self.cache.set_row(row)
+        if rows:
+            self._pin(user_id, referrer_id)
+        if rows and self.leaderboards:
+            self.leaderboards.record_referral(referrer_id)
+        return bool(rows)
 
     # Payment Methods
+    @observe_db
     async def get_payment_methods(self) -> List:
         """Получение активных способов оплаты"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire(read=True) as conn:
             return await conn.fetch(
                 'SELECT id, name, details FROM payment_methods WHERE is_active = TRUE'
             )
 
+    @observe_db
     async def add_payment_method(self, name: str, details: str) -> bool:
         """Добавление способа оплаты"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             try:
                 await conn.execute(
                     'INSERT INTO payment_methods (name, details) VALUES ($1, $2)',
@@ -227,36 +385,298 @@ class Database:
                 return False
 
     # Transactions
-    async def create_transaction(self, user_id: int, amount: int, attempts: int, status: str = 'pending') -> int:
-        """Создание транзакции"""
+    @observe_db
+    async def create_transaction(self, user_id: int, amount: int, attempts: int, status: str = 'pending') -> Optional[int]:
+        """Создание транзакции (без id, если включен журнал)"""
         if amount <= 0 or amount > 10000:  # Максимальная сумма 10,000 руб
             raise ValueError("Invalid amount")
         if attempts <= 0:
             raise ValueError("Invalid attempts count")
+        
+        if self.journal:
+            self.journal.add('transactions', (user_id, amount, attempts, status, datetime.now(timezone.utc)))
+            return None
             
-        async with self.pool.acquire() as conn:
-            return await conn.fetchval('''
-                INSERT INTO transactions 
-                (user_id, amount, attempts, status, created_at) 
-                VALUES ($1, $2, $3, $4, $5)
-                RETURNING id
-            ''', user_id, amount, attempts, status, datetime.now().isoformat())
+        async with self._acquire() as conn:
+            return await self._run(conn, 'fetchval', 'create_transaction', user_id, amount, attempts, status)
+
+    @observe_db
+    async def attach_receipt(self, user_id: int, receipt_id: str) -> Optional[Dict]:
+        """Привязка чека к последней ожидающей транзакции пользователя"""
+        if self.journal:
+            # Транзакция могла еще не дойти до базы
+            await self.journal.flush()
+        async with self._acquire() as conn:
+            row = await self._run(conn, 'fetchrow', 'attach_receipt', user_id, receipt_id)
+            return dict(row) if row else None
+
+    @observe_db
+    async def get_pending_receipts(self, after_id: int = 0, limit: int = 10) -> Tuple[List, int]:
+        """Страница очереди чеков после after_id и общее число ожидающих"""
+        async with self._acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT id, user_id, amount, attempts, receipt_id, created_at
+                FROM transactions
+                WHERE status = 'pending' AND receipt_id IS NOT NULL AND id > $1
+                ORDER BY id
+                LIMIT $2
+            ''', after_id, limit)
+            total = await conn.fetchval(
+                "SELECT count(*) FROM transactions WHERE status = 'pending' AND receipt_id IS NOT NULL"
+            )
+            return rows, total
+
+    @observe_db
+    async def approve_transactions(self, transaction_ids: List[int], admin_id: int) -> List:
+        """Подтверждение пачки транзакций и начисление попыток одним запросом"""
+        if not transaction_ids:
+            return []
+        async with self._acquire() as conn:
+            # Условие status = 'pending' не дает начислить дважды при повторном нажатии
+            rows = await conn.fetch('''
+                WITH approved AS (
+                    UPDATE transactions
+                    SET status = 'approved', admin_id = $2, updated_at = now()
+                    WHERE id = ANY($1::int[]) AND status = 'pending'
+                    RETURNING user_id, attempts
+                ),
+                credit AS (
+                    SELECT user_id, sum(attempts)::int AS attempts FROM approved GROUP BY user_id
+                ),
+                credited AS (
+                    INSERT INTO user_attempts (user_id, paid)
+                    SELECT user_id, attempts FROM credit
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET paid = user_attempts.paid + EXCLUDED.paid
+                    RETURNING user_id, paid, used, last_bonus_date
+                )
+                SELECT credited.*, credit.attempts AS credited
+                FROM credited JOIN credit USING (user_id)
+            ''', transaction_ids, admin_id)
+        if self.cache:
+            for row in rows:
+                self.cache.set_row(row)
+        self._pin(*(row['user_id'] for row in rows))
+        return rows
+
+    @observe_db
+    async def reject_transactions(self, transaction_ids: List[int], admin_id: int) -> List[int]:
+        """Отклонение пачки транзакций; возвращает пользователей, чьи платежи отклонены"""
+        if not transaction_ids:
+            return []
+        async with self._acquire() as conn:
+            rows = await conn.fetch('''
+                UPDATE transactions
+                SET status = 'rejected', admin_id = $2, updated_at = now()
+                WHERE id = ANY($1::int[]) AND status = 'pending'
+                RETURNING user_id
+            ''', transaction_ids, admin_id)
+            return list({row['user_id'] for row in rows})
 
     # Prizes
+    @observe_db
     async def add_prize(self, user_id: int, prize_type: str, value: str) -> None:
         """Добавление приза"""
-        async with self.pool.acquire() as conn:
+        if self.journal:
+            async with self._acquire() as conn:
+                await self._run(conn, 'execute', 'mark_unclaimed', user_id)
+            self.journal.add('prizes', (user_id, prize_type, value, False, None, datetime.now(timezone.utc)))
+            return
+        async with self._acquire() as conn:
+            await self._run(conn, 'execute', 'add_prize', user_id, prize_type, value)
+        self._pin(user_id)
+
+    @observe_db
+    async def spin(self, user_id: int, prize_type: str, value: str) -> Optional[int]:
+        """Списание попытки и запись приза одним запросом; выигранные попытки зачисляются сразу"""
+        credit = int(value) if prize_type == 'attempt' else 0
+        if self.journal:
+            # Баланс списывается синхронно, приз уходит в журнал
+            async with self._acquire() as conn:
+                row = await self._run(conn, 'fetchrow', 'spend_attempt', user_id, credit)
+            if row:
+                # Выигранные попытки уже зачислены: приз пишется полученным, как в запросе spin
+                now = datetime.now(timezone.utc)
+                self.journal.add('prizes', (user_id, prize_type, value, credit > 0,
+                                            now if credit > 0 else None, now))
+        else:
+            async with self._acquire() as conn:
+                row = await self._run(conn, 'fetchrow', 'spin', user_id, prize_type, value, credit)
+        
+        if not row:
+            if self.cache:
+                self.cache.invalidate(user_id)
+            return None
+        if self.cache:
+            self.cache.set_row(row)
+        self._pin(user_id)
+        if self.leaderboards:
+            self.leaderboards.record_prize(user_id, prize_type, value)
+        return row['paid'] - row['used']
+
+    @observe_db
+    async def get_unclaimed_prizes(self, user_id: int, before_id: Optional[int] = None,
+                                   limit: int = 10) -> Tuple[List, List]:
+        """Страница неполученных призов (новые сначала) и итоги по типам"""
+        if self.journal:
+            # Последние призы могут ждать в журнале
+            await self.journal.flush()
+        async with self._acquire(read=True, user_id=user_id) as conn:
+            # Граница по created_at ограничивает запросы свежими партициями
+            since = await self._run(conn, 'fetchval', 'get_unclaimed_since', user_id)
+            if since is None:
+                return [], []
+            rows = await self._run(conn, 'fetch', 'get_prizes_page', user_id, before_id or MAX_ID, limit, since)
+            summary = await self._run(conn, 'fetch', 'get_prize_summary', user_id, since)
+            return rows, summary
+
+    @observe_db
+    async def claim_all_prizes(self, user_id: int) -> List:
+        """Отметка всех призов пользователя полученными; итоги по типам"""
+        if self.journal:
+            await self.journal.flush()
+        async with self._acquire() as conn:
+            since = await self._run(conn, 'fetchval', 'get_unclaimed_since', user_id)
+            if since is None:
+                return []
+            claimed = await self._run(conn, 'fetch', 'claim_all_prizes', user_id, since)
+        self._pin(user_id)
+        return claimed
+
+    # Statistics
+    @observe_db
+    async def get_stats(self) -> Dict:
+        """Общие и сегодняшние счетчики статистики"""
+        async with self._acquire(read=True) as conn:
+            rows = await conn.fetch('''
+                SELECT 'total' AS scope, metric, sum(value)::bigint AS value
+                FROM stats_counters GROUP BY metric
+                UNION ALL
+                SELECT 'today', metric, sum(value)::bigint
+                FROM stats_daily WHERE day = current_date GROUP BY metric
+            ''')
+        stats = {'total': {}, 'today': {}}
+        for row in rows:
+            stats[row['scope']][row['metric']] = row['value']
+        return stats
+
+    @observe_db
+    async def get_daily_stats(self, days: int = 7) -> Dict:
+        """Дневные срезы счетчиков за последние дни"""
+        async with self._acquire(read=True) as conn:
+            rows = await conn.fetch('''
+                SELECT day, metric, sum(value)::bigint AS value
+                FROM stats_daily WHERE day > current_date - $1::int
+                GROUP BY day, metric ORDER BY day
+            ''', days)
+        daily = {}
+        for row in rows:
+            daily.setdefault(row['day'], {})[row['metric']] = row['value']
+        return daily
+
+    async def get_leaderboard_totals(self, week_start: datetime, day_start: datetime) -> Tuple[List, List]:
+        """Выигрыши по (user_id, prize_type, value) и приглашенные: all_count, week_count, day_count
+
+        Все окна считаются одним проходом по призам. Полный пересчет для таблиц
+        лидеров выполняется при запуске на отдельном соединении: агрегат за все
+        время может не уложиться в таймаут пула.
+        """
+        if self.journal:
+            await self.journal.flush()
+        conn = await self.connect_dedicated(read=True)
+        try:
+            prizes = await conn.fetch('''
+                SELECT user_id, prize_type, value, count(*) AS all_count,
+                       count(*) FILTER (WHERE created_at >= $1) AS week_count,
+                       count(*) FILTER (WHERE created_at >= $2) AS day_count
+                FROM prizes
+                GROUP BY user_id, prize_type, value
+            ''', week_start, day_start)
+            # Окна — по индексу referred_at, за все время — счетчик пригласившего
+            referrals = await conn.fetch('''
+                SELECT ua.user_id, ua.referrals_count AS all_count,
+                       coalesce(recent.week_count, 0) AS week_count,
+                       coalesce(recent.day_count, 0) AS day_count
+                FROM user_attempts ua
+                LEFT JOIN (
+                    SELECT referred_by AS user_id, count(*) AS week_count,
+                           count(*) FILTER (WHERE referred_at >= $2) AS day_count
+                    FROM user_attempts
+                    WHERE referred_at >= $1 AND referred_by IS NOT NULL
+                    GROUP BY referred_by
+                ) recent USING (user_id)
+                WHERE ua.referrals_count > 0
+            ''', week_start, day_start)
+        finally:
+            await conn.close()
+        return prizes, referrals
+
+    # Broadcasts
+    @observe_db
+    async def create_broadcast(self, text: str, created_by: int) -> int:
+        """Создание рассылки"""
+        async with self._acquire() as conn:
+            return await conn.fetchval(
+                'INSERT INTO broadcasts (text, created_by) VALUES ($1, $2) RETURNING id',
+                text, created_by
+            )
+
+    @observe_db
+    async def get_broadcast(self, broadcast_id: Optional[int] = None) -> Optional[Dict]:
+        """Рассылка по id или последняя"""
+        async with self._acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT * FROM broadcasts
+                WHERE $1::int IS NULL OR id = $1
+                ORDER BY id DESC LIMIT 1
+            ''', broadcast_id)
+            return dict(row) if row else None
+
+    @observe_db
+    async def get_running_broadcasts(self) -> List:
+        """Незавершенные рассылки для продолжения после перезапуска"""
+        async with self._acquire() as conn:
+            return await conn.fetch("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+
+    @observe_db
+    async def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int,
+                                      failed: int, blocked: int, status: str = 'running') -> None:
+        """Сохранение позиции рассылки"""
+        async with self._acquire() as conn:
             await conn.execute('''
-                INSERT INTO prizes 
-                (user_id, prize_type, value, created_at) 
-                VALUES ($1, $2, $3, $4)
-            ''', user_id, prize_type, value, datetime.now().isoformat())
-
-    async def get_unclaimed_prizes(self, user_id: int) -> List:
-        """Получение неполученных призов"""
-        async with self.pool.acquire() as conn:
-            return await conn.fetch(
-                '''SELECT id, prize_type, value FROM prizes 
-                   WHERE user_id = $1 AND is_claimed = FALSE''',
-                user_id
-            )
\ No newline at end of file
+                UPDATE broadcasts
+                SET last_user_id = $2, sent = $3, failed = $4, blocked = $5,
+                    status = $6, updated_at = now()
+                WHERE id = $1
+            ''', broadcast_id, last_user_id, sent, failed, blocked, status)
+
+    @observe_db
+    async def mark_users_blocked(self, user_ids: List[int]) -> None:
+        """Пометка пользователей, заблокировавших бота"""
+        if not user_ids:
+            return
+        async with self._acquire() as conn:
+            await conn.execute(
+                'UPDATE user_attempts SET blocked_at = now() WHERE user_id = ANY($1::bigint[])',
+                user_ids
+            )
+
+    async def iter_broadcast_recipients(self, after_user_id: int = 0, retry_blocked_days: int = 30,
+                                        chunk_size: int = 5000):
+        """Поток user_id по возрастанию, порциями по chunk_size"""
+        while True:
+            # Порция читается одним запросом, соединение возвращается в пул до
+            # отправки: рассылка не держит ни соединение, ни снимок базы
+            async with self._acquire(read=True) as conn:
+                rows = await conn.fetch('''
+                    SELECT user_id FROM user_attempts
+                    WHERE user_id > $1
+                      AND (blocked_at IS NULL OR blocked_at < now() - make_interval(days => $2))
+                    ORDER BY user_id
+                    LIMIT $3
+                ''', after_user_id, retry_blocked_days, chunk_size)
+            for row in rows:
+                yield row['user_id']
+            if len(rows) < chunk_size:
+                return
+            after_user_id = rows[-1]['user_id']
@@ -0,0 +1,226 @@
+"""Выгрузка prizes, transactions и user_attempts для аналитики
+
+    python export.py --out-dir ./export                       # новые строки с прошлого запуска
+    python export.py --tables prizes --since 2026-01-01 --format parquet
+    python export.py --full                                   # все заново, состояние не учитывается
+
+Каждый фрагмент — отдельный COPY (SELECT ...) TO STDOUT по диапазону
+ключа, поток пишется сразу в <out-dir>/<таблица>/<таблица>_<от>_<до>.csv.gz,
+поэтому память не зависит от объема таблицы. prizes и transactions
+выгружаются инкрементально: последний выгруженный id хранится в файле
+состояния и обновляется после каждого фрагмента, прерванный запуск
+продолжается со следующего. Строки моложе --lag секунд откладываются до
+следующего запуска, чтобы не пропустить транзакции, закоммиченные позже
+строк с большими id. Изменения статуса уже выгруженных транзакций
+попадают только в --full. user_attempts (id Telegram не монотонны)
+всегда выгружается целиком.
+
+Формат parquet требует pyarrow; фрагмент сначала читается в память, так
+что ее расход ограничен --chunk-rows.
+
+Работает на отдельном соединении (DATABASE_DIRECT_URL или DATABASE_URL)
+и не занимает соединения пула бота.
+"""
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+class ExportTable(NamedTuple):
+    name: str
+    key: str
+    columns: str
+    # Инкрементальная выгрузка по возрастанию ключа
+    incremental: bool
+    # Колонка времени для --since и --lag
+    timestamp: Optional[str] = None
+
+
+TABLES = {
+    'prizes': ExportTable(
+        'prizes', 'id', 'id, user_id, prize_type, value, is_claimed, claimed_at, created_at',
+        incremental=True, timestamp='created_at'
+    ),
+    'transactions': ExportTable(
+        'transactions', 'id',
+        'id, user_id, amount, attempts, status, receipt_id IS NOT NULL AS has_receipt, admin_id, '
+        'created_at, updated_at',
+        incremental=True, timestamp='created_at'
+    ),
+    'user_attempts': ExportTable(
+        'user_attempts', 'user_id',
+        'user_id, paid, used, last_bonus_date, referred_by, referred_at, referrals_count, blocked_at',
+        incremental=False
+    ),
+}
+FORMATS = ('csv', 'parquet')
+
+
+def load_state(path: str) -> Dict[str, int]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path: str, state: Dict[str, int]):
+    # Запись через временный файл: прерывание не оставляет испорченное состояние
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def export_chunk(conn: asyncpg.Connection, query: str, args: List, path: str, fmt: str) -> int:
+    """COPY одного фрагмента в файл; возвращает число строк"""
+    tmp_path = path + '.part'
+    if fmt == 'parquet':
+        try:
+            import pyarrow.csv
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        buffer = io.BytesIO()
+        status = await conn.copy_from_query(query, *args, output=buffer, format='csv', header=True)
+        rows = int(status.split()[-1])
+        if rows:
+            buffer.seek(0)
+            pyarrow.parquet.write_table(pyarrow.csv.read_csv(buffer), tmp_path, compression='zstd')
+    else:
+        with gzip.open(tmp_path, 'wb') as f:
+            async def write(chunk):
+                f.write(chunk)
+            status = await conn.copy_from_query(query, *args, output=write, format='csv', header=True)
+        rows = int(status.split()[-1])
+
+    if rows:
+        os.replace(tmp_path, path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return rows
+
+
+async def export_table(conn: asyncpg.Connection, table: ExportTable, out_dir: str, after: int,
+                       chunk_rows: int, fmt: str, since: Optional[datetime] = None,
+                       lag: float = 0.0, on_chunk=None) -> int:
+    """Выгрузка строк с ключом больше after фрагментами по chunk_rows"""
+    directory = os.path.join(out_dir, table.name)
+    os.makedirs(directory, exist_ok=True)
+    ts = table.timestamp
+    if ts and since:
+        # Начало с первой строки после since: отсечение партиций и индекс по ключу
+        first = await conn.fetchval(f'SELECT min({table.key}) FROM {table.name} WHERE {ts} >= $1', since)
+        if first is None:
+            return 0
+        after = max(after, first - 1)
+
+    # Граница фрагмента по индексу ключа; строки моложе lag ждут следующего запуска
+    bound_query = f'''
+        SELECT max({table.key}) FROM (
+            SELECT {table.key}{f", {ts}" if ts else ""} FROM {table.name}
+            WHERE {table.key} > $1 ORDER BY {table.key} LIMIT $2
+        ) chunk
+    '''
+    bound_args = []
+    if ts and lag:
+        bound_query += f'WHERE {ts} < now() - make_interval(secs => $3)'
+        bound_args.append(lag)
+    copy_query = f'SELECT {table.columns} FROM {table.name} WHERE {table.key} > $1 AND {table.key} <= $2'
+    copy_args = []
+    if ts and since:
+        copy_query += f' AND {ts} >= $3'
+        copy_args.append(since)
+    copy_query += f' ORDER BY {table.key}'
+
+    total = 0
+    suffix = 'parquet' if fmt == 'parquet' else 'csv.gz'
+    while True:
+        upper = await conn.fetchval(bound_query, after, chunk_rows, *bound_args)
+        if upper is None:
+            break
+        path = os.path.join(directory, f"{table.name}_{after + 1}_{upper}.{suffix}")
+        rows = await export_chunk(conn, copy_query, [after, upper, *copy_args], path, fmt)
+        if rows:
+            total += rows
+            logger.info(f"Exported {rows} rows of {table.name} to {path}")
+        after = upper
+        if on_chunk:
+            on_chunk(after)
+    return total
+
+
+async def export(conn: asyncpg.Connection, tables: List[str], out_dir: str, state_path: str,
+                 chunk_rows: int = 500000, fmt: str = 'csv', since: Optional[datetime] = None,
+                 lag: float = 60.0, full: bool = False) -> Dict[str, int]:
+    """Выгрузка выбранных таблиц; состояние сохраняется после каждого фрагмента"""
+    state = {} if full else load_state(state_path)
+    exported = {}
+    for name in tables:
+        table = TABLES[name]
+        if not table.incremental:
+            # Снимок целиком в отдельный каталог запуска
+            snapshot_dir = os.path.join(out_dir, datetime.now().strftime('%Y%m%d_%H%M%S'))
+            exported[name] = await export_table(conn, table, snapshot_dir, -1, chunk_rows, fmt)
+            continue
+
+        def checkpoint(after, name=name):
+            state[name] = after
+            save_state(state_path, state)
+
+        exported[name] = await export_table(
+            conn, table, out_dir, state.get(name, 0), chunk_rows, fmt, since, lag, checkpoint
+        )
+    return exported
+
+
+async def _main(args):
+    conn = await asyncpg.connect(
+        dsn=os.getenv('DATABASE_DIRECT_URL') or os.getenv('DATABASE_URL'),
+        ssl=os.getenv('DB_SSL') or None
+    )
+    try:
+        result = await export(
+            conn, args.tables.split(','), args.out_dir,
+            args.state or os.path.join(args.out_dir, 'export_state.json'),
+            args.chunk_rows, args.format, args.since, args.lag, args.full
+        )
+    finally:
+        await conn.close()
+    for name, rows in result.items():
+        print(f"{name}: {rows} rows")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Выгрузка данных для аналитики")
+    parser.add_argument('--tables', default=','.join(TABLES), help="таблицы через запятую")
+    parser.add_argument('--out-dir', default='export')
+    parser.add_argument('--state', help="файл состояния (по умолчанию <out-dir>/export_state.json)")
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--chunk-rows', type=int, default=500000, help="строк в одном файле")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="только строки не старше даты (prizes, transactions)")
+    parser.add_argument('--lag', type=float, default=60.0, help="не выгружать строки моложе N секунд")
+    parser.add_argument('--full', action='store_true', help="выгрузить все, не читая состояние")
+    args = parser.parse_args()
+    unknown = set(args.tables.split(',')) - set(TABLES)
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == '__main__':
+    main()
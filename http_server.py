@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_SIZE = 16 * 1024
+# Ожидание следующего запроса на keep-alive соединении и чтение/запись одного запроса
+IDLE_TIMEOUT = 75.0
+IO_TIMEOUT = 10.0
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Response:
+    __slots__ = ('status', 'body', 'content_type', 'headers')
+
+    def __init__(self, status: int = 200, body: bytes = b'', content_type: str = 'text/plain; charset=utf-8',
+                 headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+    @classmethod
+    def json(cls, data, status: int = 200) -> 'Response':
+        return cls(status, json.dumps(data).encode(), 'application/json')
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HTTPServer:
+    """Минимальный HTTP/1.1 сервер на asyncio для служебных эндпоинтов
+
+    Поддерживает keep-alive и тела с Content-Length; этого достаточно для
+    вебхуков Telegram, метрик и локальных тестовых стендов. Соединение
+    закрывается, если запрос не начался за idle_timeout секунд или его
+    заголовки, тело либо отправка ответа заняли больше io_timeout секунд,
+    поэтому медленные клиенты не удерживают соединения.
+    """
+
+    def __init__(self, handler: Handler, host: str = '127.0.0.1', port: int = 8080,
+                 max_body_size: int = 1024 * 1024, idle_timeout: float = IDLE_TIMEOUT,
+                 io_timeout: float = IO_TIMEOUT):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        self.idle_timeout = idle_timeout
+        self.io_timeout = io_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        """Запуск сервера; при port=0 порт выбирается системой"""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, limit=MAX_HEADER_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        """Остановка сервера"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        # Первый байт ждем idle_timeout, остальное — не дольше io_timeout
+        first = await asyncio.wait_for(reader.readexactly(1), self.idle_timeout)
+        head = first + await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.io_timeout)
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        if 'chunked' in headers.get('transfer-encoding', ''):
+            raise _HTTPError(411)
+        length = int(headers.get('content-length', 0))
+        if length > self.max_body_size:
+            raise _HTTPError(413)
+        body = await asyncio.wait_for(reader.readexactly(length), self.io_timeout) if length else b''
+        return Request(method, target, headers, body)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, Response(413), close=True)
+                    break
+                except _HTTPError as e:
+                    await self._write(writer, Response(e.status), close=True)
+                    break
+                except ValueError:
+                    await self._write(writer, Response(400), close=True)
+                    break
+
+                try:
+                    response = await self.handler(request)
+                except Exception as e:
+                    logger.error(f"HTTP handler error on {request.path}: {e}")
+                    response = Response(500)
+                close = request.headers.get('connection', '').lower() == 'close'
+                await self._write(writer, response, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.TimeoutError):
+            # Клиент отключился или не читает ответ
+            pass
+        finally:
+            writer.close()
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response, close: bool):
+        headers = {
+            'Content-Type': response.content_type,
+            'Content-Length': str(len(response.body)),
+            'Connection': 'close' if close else 'keep-alive',
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'Unknown')}\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode('latin-1') + b'\r\n' + response.body)
+        await asyncio.wait_for(writer.drain(), self.io_timeout)
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
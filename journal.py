@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindJournal:
+    """Буфер строк призов и транзакций с пакетной записью через COPY
+
+    Строки копятся в памяти и сбрасываются одним COPY на таблицу, когда
+    набирается max_rows строк или проходит flush_interval секунд. При
+    ошибке записи строки возвращаются в буфер и уходят со следующим сбросом.
+    """
+
+    COLUMNS = {
+        'prizes': ('user_id', 'prize_type', 'value', 'is_claimed', 'claimed_at', 'created_at'),
+        'transactions': ('user_id', 'amount', 'attempts', 'status', 'created_at'),
+    }
+
+    def __init__(self, pool, max_rows: int = 500, flush_interval: float = 1.0):
+        self.pool = pool
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._buffers: Dict[str, List[Tuple]] = {table: [] for table in self.COLUMNS}
+        self._size = 0
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.rows_flushed = 0
+        self.flushes = 0
+
+    def add(self, table: str, record: Tuple):
+        """Добавление строки в буфер"""
+        self._buffers[table].append(record)
+        self._size += 1
+        if self._size >= self.max_rows:
+            self._full.set()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    async def start(self):
+        """Запуск фонового сброса по времени и объему"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Остановка фоновой задачи и финальный сброс буфера"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Запись всех накопленных строк"""
+        async with self._lock:
+            if not self._size:
+                return
+            batches = {table: rows for table, rows in self._buffers.items() if rows}
+            self._buffers = {table: [] for table in self.COLUMNS}
+            self._size = 0
+            self._full.clear()
+            try:
+                async with self.pool.acquire() as conn:
+                    async with conn.transaction():
+                        for table, rows in batches.items():
+                            await conn.copy_records_to_table(
+                                table, records=rows, columns=self.COLUMNS[table]
+                            )
+            except Exception:
+                # Возвращаем строки в начало буфера, чтобы не потерять их
+                for table, rows in batches.items():
+                    self._buffers[table][:0] = rows
+                    self._size += len(rows)
+                raise
+            flushed = sum(len(rows) for rows in batches.values())
+            self.rows_flushed += flushed
+            self.flushes += 1
+            logger.debug(f"Journal flushed {flushed} rows")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Journal flush error ({self._size} rows buffered): {e}")
+                await asyncio.sleep(self.flush_interval)
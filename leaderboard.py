@@ -0,0 +1,225 @@
+"""Таблицы лидеров: победители (выигрыш в рублях) и пригласившие
+
+Для каждого вида и окна (день, неделя, все время) в памяти хранится
+RankedScores: очки пользователей, дерево Фенвика по значениям очков для
+места за O(log) и отсортированный топ. Очки только растут, поэтому топ
+обновляется вставкой одной записи. Дневное и недельное окна при смене
+периода просто начинаются заново, историю пересчитывать не нужно. Полный
+пересчет из БД выполняется только при запуске, одним проходом по призам
+для всех окон; в многопроцессном режиме его делает один процесс и
+передает итоги остальным.
+"""
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+WINNERS = 'winners'
+REFERRERS = 'referrers'
+KINDS = (WINNERS, REFERRERS)
+DAY = 'day'
+WEEK = 'week'
+ALL_TIME = 'all'
+WINDOWS = (DAY, WEEK, ALL_TIME)
+
+
+class RankedScores:
+    """Очки пользователей с местом за O(log max_score) и топом из top_size записей"""
+
+    __slots__ = ('top_size', '_scores', '_tree', '_top')
+
+    def __init__(self, top_size: int = 10):
+        self.top_size = top_size
+        self._scores: Dict[int, int] = {}
+        # Дерево Фенвика: число пользователей с очками score хранится по индексу score + 1
+        self._tree = array('q', [0] * 64)
+        # (-очки, user_id) по возрастанию, то есть лучшие первыми
+        self._top: List[Tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def add(self, user_id: int, points: int):
+        """Начисление очков пользователю"""
+        if points <= 0:
+            return
+        old = self._scores.get(user_id, 0)
+        new = old + points
+        self._scores[user_id] = new
+        if new + 1 >= len(self._tree):
+            self._rebuild_tree(new + 1)
+        else:
+            if old:
+                self._tree_add(old + 1, -1)
+            self._tree_add(new + 1, 1)
+        self._update_top(user_id, old, new)
+
+    def load(self, totals: Iterable[Tuple[int, int]]):
+        """Замена содержимого очками из БД: пары (user_id, очки)"""
+        self._scores = {user_id: points for user_id, points in totals if points > 0}
+        self._rebuild_tree(max(self._scores.values(), default=0) + 1)
+        self._top = sorted((-points, user_id) for user_id, points in self._scores.items())[:self.top_size]
+
+    def score(self, user_id: int) -> int:
+        return self._scores.get(user_id, 0)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место пользователя: 1 + число пользователей с большими очками"""
+        score = self._scores.get(user_id)
+        if not score:
+            return None
+        return len(self._scores) - self._prefix(score + 1) + 1
+
+    def top(self) -> List[Tuple[int, int]]:
+        """Лучшие пользователи: пары (user_id, очки)"""
+        return [(user_id, -points) for points, user_id in self._top]
+
+    def _tree_add(self, index: int, delta: int):
+        tree = self._tree
+        size = len(tree)
+        while index < size:
+            tree[index] += delta
+            index += index & -index
+
+    def _prefix(self, index: int) -> int:
+        """Число пользователей с очками меньше index"""
+        tree = self._tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def _rebuild_tree(self, max_index: int):
+        """Построение дерева за O(n + размер) с запасом вдвое"""
+        size = len(self._tree)
+        while size <= max_index:
+            size *= 2
+        tree = array('q', [0]) * size
+        for points in self._scores.values():
+            tree[points + 1] += 1
+        for index in range(1, size):
+            parent = index + (index & -index)
+            if parent < size:
+                tree[parent] += tree[index]
+        self._tree = tree
+
+    def _update_top(self, user_id: int, old: int, new: int):
+        top = self._top
+        if old:
+            index = bisect_left(top, (-old, user_id))
+            if index < len(top) and top[index] == (-old, user_id):
+                del top[index]
+        entry = (-new, user_id)
+        if len(top) < self.top_size or entry < top[-1]:
+            insort(top, entry)
+            if len(top) > self.top_size:
+                top.pop()
+
+
+class Leaderboards:
+    """Таблицы лидеров по видам и окнам с инкрементальным обновлением
+
+    payouts — стоимость приза (prize_type, value) в рублях, как в расчете
+    RTP колеса. В многопроцессном режиме каждое начисление передается
+    остальным процессам через forward, чтобы таблицы совпадали.
+    """
+
+    def __init__(self, payouts: Dict[Tuple[str, str], float], tz: str = 'UTC', top_size: int = 10):
+        self.payouts = payouts
+        self.tz = ZoneInfo(tz)
+        self.top_size = top_size
+        self.boards: Dict[str, Dict[str, RankedScores]] = {
+            kind: {window: RankedScores(top_size) for window in WINDOWS} for kind in KINDS
+        }
+        self._periods: Dict[str, Optional[datetime]] = {
+            window: self.period_start(window) for window in WINDOWS
+        }
+        self._forward: Optional[Callable[[str, int, int], None]] = None
+
+    def set_forward(self, forward: Callable[[str, int, int], None]) -> None:
+        """Передача начислений (вид, user_id, очки) другим процессам"""
+        self._forward = forward
+
+    def period_start(self, window: str, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Начало текущего дня или недели (с понедельника) в часовом поясе бонусов"""
+        if window == ALL_TIME:
+            return None
+        local = (now or datetime.now(timezone.utc)).astimezone(self.tz)
+        start = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        if window == WEEK:
+            start -= timedelta(days=local.weekday())
+        return start
+
+    def _roll(self, now: Optional[datetime] = None):
+        for window in (DAY, WEEK):
+            start = self.period_start(window, now)
+            if start != self._periods[window]:
+                self._periods[window] = start
+                for kind in KINDS:
+                    self.boards[kind][window] = RankedScores(self.top_size)
+
+    def add(self, kind: str, user_id: int, points: int, forward: bool = True):
+        """Начисление очков во всех окнах"""
+        if points <= 0:
+            return
+        self._roll()
+        for board in self.boards[kind].values():
+            board.add(user_id, points)
+        if forward and self._forward:
+            self._forward(kind, user_id, points)
+
+    def prize_points(self, prize_type: str, value: str) -> int:
+        return round(self.payouts.get((prize_type, value), 0))
+
+    def record_prize(self, user_id: int, prize_type: str, value: str):
+        self.add(WINNERS, user_id, self.prize_points(prize_type, value))
+
+    def record_referral(self, referrer_id: int):
+        self.add(REFERRERS, referrer_id, 1)
+
+    def top(self, kind: str, window: str) -> List[Tuple[int, int]]:
+        self._roll()
+        return self.boards[kind][window].top()
+
+    def rank(self, kind: str, window: str, user_id: int) -> Tuple[Optional[int], int]:
+        """Место и очки пользователя"""
+        self._roll()
+        board = self.boards[kind][window]
+        return board.rank(user_id), board.score(user_id)
+
+    async def rebuild(self, db) -> Dict:
+        """Пересчет всех таблиц из БД (при запуске); возвращает итоги для load в других процессах"""
+        self._roll()
+        prizes, referrals = await db.get_leaderboard_totals(self._periods[WEEK], self._periods[DAY])
+        totals: Dict[Tuple[str, str], Dict[int, int]] = {
+            (kind, window): {} for kind in KINDS for window in WINDOWS
+        }
+        for row in prizes:
+            points = self.prize_points(row['prize_type'], row['value'])
+            if not points:
+                continue
+            user_id = row['user_id']
+            for window in WINDOWS:
+                count = row[f'{window}_count']
+                if count:
+                    scores = totals[WINNERS, window]
+                    scores[user_id] = scores.get(user_id, 0) + points * count
+        for row in referrals:
+            for window in WINDOWS:
+                if row[f'{window}_count']:
+                    totals[REFERRERS, window][row['user_id']] = row[f'{window}_count']
+        snapshot = {
+            'periods': dict(self._periods),
+            'totals': {key: list(scores.items()) for key, scores in totals.items()},
+        }
+        self.load(snapshot)
+        return snapshot
+
+    def load(self, snapshot: Dict):
+        """Загрузка итогов rebuild; окна, период которых успел смениться, остаются пустыми"""
+        self._roll()
+        for (kind, window), scores in snapshot['totals'].items():
+            if snapshot['periods'][window] == self._periods[window]:
+                self.boards[kind][window].load(scores)
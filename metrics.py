@@ -0,0 +1,239 @@
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from telegram.request import HTTPXRequest
+
+from http_server import HTTPServer, Request, Response
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # По ключу меток: [счетчики корзин + переполнение, сумма, количество]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, *labels):
+        """Контекстный менеджер для замера длительности блока"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        lines = []
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """Значение, вычисляемое при сборе: число или словарь {метки: число}"""
+
+    def __init__(self, name, documentation, func: Callable, labels=(), type='gauge'):
+        super().__init__(name, documentation, labels)
+        self.type = type
+        self.func = func
+
+    def samples(self):
+        value = self.func()
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_labels(self.label_names, k if isinstance(k, tuple) else (k,))} {v}"
+                    for k, v in value.items()]
+        return [f"{self.name} {value}"]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name, documentation, func, labels=(), type='gauge') -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, func, labels, type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                samples = [f"# {metric.name} collection failed: {_escape(e)}"]
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    'wheelbot_handler_seconds', 'Handler latency by handler name', ['handler'])
+HANDLER_ERRORS = REGISTRY.counter(
+    'wheelbot_handler_errors_total', 'Handler exceptions by handler name', ['handler'])
+DB_LATENCY = REGISTRY.histogram(
+    'wheelbot_db_seconds', 'Database method latency by method', ['method'])
+DB_POOL_WAIT = REGISTRY.histogram(
+    'wheelbot_db_pool_acquire_seconds', 'Time spent waiting for a pooled connection')
+BOT_API_CALLS = REGISTRY.counter(
+    'wheelbot_bot_api_calls_total', 'Bot API calls by method and HTTP status', ['method', 'status'])
+BOT_API_LATENCY = REGISTRY.histogram(
+    'wheelbot_bot_api_seconds', 'Bot API call latency by method', ['method'])
+THROTTLED = REGISTRY.counter(
+    'wheelbot_throttled_updates_total', 'Updates rejected by the per-user rate limiter by kind', ['kind'])
+
+_STARTED = time.time()
+REGISTRY.callback('wheelbot_uptime_seconds', 'Process uptime', lambda: round(time.time() - _STARTED, 3))
+
+
+def observe_handler(func):
+    """Замер длительности и ошибок обработчика"""
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+def observe_db(func):
+    """Замер длительности метода Database"""
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest со счетчиками вызовов Bot API по методам и статусам"""
+
+    async def do_request(self, url: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(url, *args, **kwargs)
+        except Exception:
+            BOT_API_CALLS.inc(api_method, 'error')
+            raise
+        finally:
+            BOT_API_LATENCY.observe(time.perf_counter() - started, api_method)
+        BOT_API_CALLS.inc(api_method, str(status))
+        return status, payload
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics в текстовом формате Prometheus"""
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 9100, registry: Registry = REGISTRY):
+        self.registry = registry
+        self.server = HTTPServer(self.handle, host, port)
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def handle(self, request: Request) -> Response:
+        if request.path != '/metrics':
+            return Response(404)
+        return Response(200, self.registry.render().encode(), 'text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,526 @@
+import logging
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Union
+
+import asyncpg
+
+from archive import MONTH_START, ensure_partitions, timestamp_literal
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки, чтобы миграции не применялись параллельно
+MIGRATION_LOCK_KEY = 0x57484545
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    # Список SQL-команд или async-функция, принимающая соединение
+    apply: Union[List[str], Callable[[asyncpg.Connection], Awaitable[None]]]
+    transactional: bool = True
+
+
+# Индексы и statement-триггеры, которые переезжают на секционированную таблицу
+PARTITIONED_INDEXES = {
+    'prizes': [
+        ('prizes_user_id_idx', '(user_id, id)'),
+        ('prizes_unclaimed_idx', '(user_id, id) WHERE is_claimed = FALSE'),
+    ],
+    'transactions': [
+        ('transactions_user_status_idx', '(user_id, status, id)'),
+        ('transactions_pending_receipts_idx', "(id) WHERE status = 'pending' AND receipt_id IS NOT NULL"),
+    ],
+}
+PARTITIONED_TRIGGERS = {
+    'prizes': [
+        ('prizes_stats', 'INSERT', 'NEW TABLE AS new_rows', 'stats_on_prize_insert'),
+    ],
+    'transactions': [
+        ('transactions_stats_insert', 'INSERT', 'NEW TABLE AS new_rows', 'stats_on_transaction_insert'),
+        ('transactions_stats_update', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+         'stats_on_transaction_update'),
+    ],
+}
+
+# Денежный приз в счетчике округляется до рубля; нечисловое значение не
+# должно ронять вращение, поэтому приведение только после проверки формата
+MONEY_VALUE = "CASE WHEN value ~ '^[0-9]+(\\.[0-9]+)?$' THEN round(value::numeric)::bigint ELSE 0 END"
+
+STATS_ON_PRIZE_INSERT = f'''
+    CREATE OR REPLACE FUNCTION stats_on_prize_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM stats_apply(array_agg(metric), array_agg(shard), array_agg(day), array_agg(value))
+        FROM (
+            SELECT 'spins' AS metric, (user_id % 8)::smallint AS shard,
+                   created_at::date AS day, 1::bigint AS value
+            FROM new_rows
+            UNION ALL
+            SELECT 'prizes:' || prize_type, (user_id % 8)::smallint, created_at::date, 1
+            FROM new_rows
+            UNION ALL
+            SELECT 'prize_money', (user_id % 8)::smallint, created_at::date, {MONEY_VALUE}
+            FROM new_rows WHERE prize_type = 'money'
+        ) d;
+        RETURN NULL;
+    END $$
+'''
+
+
+# Колонки с текстовыми датами: (таблица, ключ, колонка, тип, NOT NULL, значение по умолчанию)
+RETYPED_COLUMNS = [
+    ('transactions', 'id', 'created_at', 'timestamptz', True, 'now()'),
+    ('transactions', 'id', 'updated_at', 'timestamptz', False, None),
+    ('prizes', 'id', 'created_at', 'timestamptz', True, 'now()'),
+    ('user_attempts', 'user_id', 'last_bonus_date', 'date', False, None),
+]
+RETYPE_BATCH_SIZE = 5000
+
+
+async def _retype_column(conn: asyncpg.Connection, table: str, key: str, column: str, type_: str,
+                         not_null: bool, default: Optional[str]):
+    """Смена типа колонки без перезаписи таблицы под эксклюзивной блокировкой
+
+    Рядом создается колонка <column>_new нужного типа, BEFORE-триггер
+    заполняет ее во вставляемых и изменяемых строках, а существующие строки
+    заполняются пачками по ключу в отдельных транзакциях. NOT NULL
+    опирается на проверенное VALIDATE ограничение CHECK и не сканирует
+    таблицу. Под эксклюзивной блокировкой остаются только удаление старой
+    колонки и переименование новой. Прерванный перевод продолжается
+    повторным запуском.
+    """
+    if await conn.fetchval('''
+        SELECT atttypid = $3::regtype FROM pg_attribute
+        WHERE attrelid = $1::regclass AND attname = $2 AND NOT attisdropped
+    ''', table, column, type_):
+        return
+    new = f'{column}_new'
+    sync = f'{table}_{column}_sync'
+    async with conn.transaction():
+        await conn.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {new} {type_}')
+        await conn.execute(f'''
+            CREATE OR REPLACE FUNCTION {sync}() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                NEW.{new} := NEW.{column}::{type_};
+                RETURN NEW;
+            END $$
+        ''')
+        await conn.execute(f'DROP TRIGGER IF EXISTS {sync} ON {table}')
+        await conn.execute(f'CREATE TRIGGER {sync} BEFORE INSERT OR UPDATE ON {table} '
+                           f'FOR EACH ROW EXECUTE FUNCTION {sync}()')
+        if not_null:
+            await conn.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {new}_not_null')
+            await conn.execute(f'ALTER TABLE {table} ADD CONSTRAINT {new}_not_null CHECK ({new} IS NOT NULL) NOT VALID')
+
+    last_key = await conn.fetchval(f'SELECT min({key}) - 1 FROM {table}')
+    while last_key is not None:
+        last_key = await conn.fetchval(f'''
+            WITH batch AS (
+                SELECT {key} FROM {table} WHERE {key} > $1 ORDER BY {key} LIMIT $2
+            ), filled AS (
+                UPDATE {table} t SET {new} = t.{column}::{type_}
+                FROM batch WHERE t.{key} = batch.{key} AND t.{new} IS NULL
+            )
+            SELECT max({key}) FROM batch
+        ''', last_key, RETYPE_BATCH_SIZE)
+
+    if not_null:
+        await conn.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {new}_not_null')
+    async with conn.transaction():
+        await conn.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        await conn.execute(f'DROP TRIGGER {sync} ON {table}')
+        await conn.execute(f'DROP FUNCTION {sync}()')
+        await conn.execute(f'ALTER TABLE {table} DROP COLUMN {column}')
+        await conn.execute(f'ALTER TABLE {table} RENAME COLUMN {new} TO {column}')
+        if not_null:
+            # Проверенный CHECK позволяет SET NOT NULL не сканировать таблицу
+            await conn.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL')
+            await conn.execute(f'ALTER TABLE {table} DROP CONSTRAINT {new}_not_null')
+        if default:
+            await conn.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT {default}')
+
+
+async def _retype_text_dates(conn: asyncpg.Connection):
+    for spec in RETYPED_COLUMNS:
+        await _retype_column(conn, *spec)
+
+
+async def _partition_by_month(conn: asyncpg.Connection, table: str):
+    """Перевод таблицы на помесячные партиции без долгих блокировок
+
+    Существующая таблица становится партицией <table>_legacy для всех строк
+    до начала следующего месяца после текущего. Проверка диапазона
+    добавляется как NOT VALID и проверяется VALIDATE, не блокирующим запись,
+    а уникальный индекс под новый первичный ключ строится CONCURRENTLY и
+    под блокировкой заменяет старый ключ по id. Поэтому ATTACH PARTITION не
+    сканирует таблицу и подхватывает готовые индексы, а под эксклюзивной
+    блокировкой выполняются только переименования, замена ключа и создание
+    пустой родительской таблицы.
+    """
+    if await conn.fetchval('SELECT relkind FROM pg_class WHERE oid = to_regclass($1)', table) == 'p':
+        return
+    legacy = f'{table}_legacy'
+    # Запас в месяц, чтобы строки, вставленные во время миграции, прошли проверку
+    bound = timestamp_literal(await conn.fetchval(f"SELECT {MONTH_START} + interval '2 months'"))
+
+    await conn.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {legacy}_range')
+    await conn.execute(f'''
+        ALTER TABLE {table} ADD CONSTRAINT {legacy}_range
+        CHECK (created_at IS NOT NULL AND created_at < {bound}) NOT VALID
+    ''')
+    await conn.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {legacy}_range')
+
+    key_index = f'{legacy}_id_created_at_key'
+    if await conn.fetchval('SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)', key_index):
+        # Остаток прерванного CREATE INDEX CONCURRENTLY
+        await conn.execute(f'DROP INDEX CONCURRENTLY {key_index}')
+    await conn.execute(f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {key_index} ON {table} (id, created_at)')
+
+    sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", table)
+    async with conn.transaction():
+        await conn.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        await conn.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        # Первичный ключ партиции — заранее построенный индекс (id, created_at):
+        # ATTACH сопоставит его с ключом родителя вместо построения нового
+        await conn.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT {table}_pkey')
+        await conn.execute(f'ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_pkey PRIMARY KEY USING INDEX {key_index}')
+        for name, _ in PARTITIONED_INDEXES[table]:
+            await conn.execute(f'ALTER INDEX IF EXISTS {name} RENAME TO {legacy}{name[len(table):]}')
+        # Триггеры с transition-таблицами допустимы только на родительской таблице
+        for name, *_ in PARTITIONED_TRIGGERS[table]:
+            await conn.execute(f'DROP TRIGGER IF EXISTS {name} ON {legacy}')
+
+        await conn.execute(f'''
+            CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS, PRIMARY KEY (id, created_at))
+            PARTITION BY RANGE (created_at)
+        ''')
+        await conn.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+        for name, definition in PARTITIONED_INDEXES[table]:
+            await conn.execute(f'CREATE INDEX {name} ON {table} {definition}')
+        # Совпадающие индексы партиции присоединяются к индексам родителя без перестроения
+        await conn.execute(f'ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ({bound})')
+        await conn.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT {legacy}_range')
+
+        for name, event, transition, function in PARTITIONED_TRIGGERS[table]:
+            await conn.execute(f'''
+                CREATE TRIGGER {name} AFTER {event} ON {table}
+                REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+            ''')
+
+
+async def _partition_prizes_and_transactions(conn: asyncpg.Connection):
+    for table in ('prizes', 'transactions'):
+        await _partition_by_month(conn, table)
+        await ensure_partitions(conn, table)
+
+
+MIGRATIONS = [
+    Migration(1, "baseline tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_attempts (
+            user_id BIGINT PRIMARY KEY,
+            paid INTEGER DEFAULT 0,
+            used INTEGER DEFAULT 0,
+            last_bonus_date TEXT,
+            referral_code TEXT UNIQUE,
+            referred_by BIGINT DEFAULT NULL,
+            referrals_count INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS payment_methods (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            details TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            amount INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            receipt_id TEXT,
+            admin_id BIGINT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS prizes (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            prize_type TEXT NOT NULL,
+            value TEXT NOT NULL,
+            is_claimed BOOLEAN DEFAULT FALSE,
+            created_at TEXT NOT NULL
+        )
+        ''',
+    ]),
+    # Заполнение пачками идет в отдельных транзакциях
+    Migration(2, "typed timestamps and dates", _retype_text_dates, transactional=False),
+    Migration(3, "hot-path indexes", [
+        # Призы пользователя и неполученные призы (get_unclaimed_prizes)
+        'CREATE INDEX IF NOT EXISTS prizes_user_id_idx ON prizes (user_id, id)',
+        'CREATE INDEX IF NOT EXISTS prizes_unclaimed_idx ON prizes (user_id, id) WHERE is_claimed = FALSE',
+        # Транзакции пользователя по статусу
+        'CREATE INDEX IF NOT EXISTS transactions_user_status_idx ON transactions (user_id, status, id)',
+    ]),
+    Migration(4, "incremental statistics counters", [
+        # Счетчики разбиты на шарды по user_id, чтобы параллельные записи
+        # не упирались в блокировку одной строки
+        '''
+        CREATE TABLE stats_counters (
+            metric TEXT NOT NULL,
+            shard SMALLINT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, shard)
+        )
+        ''',
+        '''
+        CREATE TABLE stats_daily (
+            day DATE NOT NULL,
+            metric TEXT NOT NULL,
+            shard SMALLINT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, metric, shard)
+        )
+        ''',
+        '''
+        CREATE FUNCTION stats_apply(p_metric TEXT[], p_shard SMALLINT[], p_day DATE[], p_delta BIGINT[])
+        RETURNS void LANGUAGE sql AS $$
+            WITH delta AS (
+                SELECT metric, shard, day, sum(value) AS value
+                FROM unnest(p_metric, p_shard, p_day, p_delta) AS d (metric, shard, day, value)
+                GROUP BY metric, shard, day
+            ), totals AS (
+                INSERT INTO stats_counters AS c (metric, shard, value)
+                SELECT metric, shard, sum(value) FROM delta
+                GROUP BY metric, shard ORDER BY metric, shard
+                ON CONFLICT (metric, shard) DO UPDATE SET value = c.value + EXCLUDED.value
+            )
+            INSERT INTO stats_daily AS c (day, metric, shard, value)
+            SELECT day, metric, shard, value FROM delta
+            ORDER BY day, metric, shard
+            ON CONFLICT (day, metric, shard) DO UPDATE SET value = c.value + EXCLUDED.value
+        $$
+        ''',
+        '''
+        CREATE FUNCTION stats_on_user_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM stats_apply(array_agg('users'::text), array_agg((user_id % 8)::smallint),
+                                array_agg(current_date), array_agg(1::bigint))
+            FROM new_rows;
+            RETURN NULL;
+        END $$
+        ''',
+        STATS_ON_PRIZE_INSERT,
+        '''
+        CREATE FUNCTION stats_on_transaction_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM stats_apply(array_agg(metric), array_agg(shard), array_agg(day), array_agg(value))
+            FROM (
+                SELECT 'transactions:' || status AS metric, (user_id % 8)::smallint AS shard,
+                       created_at::date AS day, 1::bigint AS value
+                FROM new_rows
+                UNION ALL
+                SELECT 'revenue:' || status, (user_id % 8)::smallint, created_at::date, amount
+                FROM new_rows
+            ) d;
+            RETURN NULL;
+        END $$
+        ''',
+        '''
+        CREATE FUNCTION stats_on_transaction_update() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            -- Смена статуса переносит сумму со старого статуса на новый
+            PERFORM stats_apply(array_agg(metric), array_agg(shard), array_agg(current_date), array_agg(value))
+            FROM (
+                SELECT 'transactions:' || o.status AS metric, (o.user_id % 8)::smallint AS shard, -1::bigint AS value
+                FROM old_rows o JOIN new_rows n USING (id) WHERE o.status <> n.status
+                UNION ALL
+                SELECT 'revenue:' || o.status, (o.user_id % 8)::smallint, -o.amount
+                FROM old_rows o JOIN new_rows n USING (id) WHERE o.status <> n.status
+                UNION ALL
+                SELECT 'transactions:' || n.status, (n.user_id % 8)::smallint, 1
+                FROM old_rows o JOIN new_rows n USING (id) WHERE o.status <> n.status
+                UNION ALL
+                SELECT 'revenue:' || n.status, (n.user_id % 8)::smallint, n.amount
+                FROM old_rows o JOIN new_rows n USING (id) WHERE o.status <> n.status
+            ) d;
+            RETURN NULL;
+        END $$
+        ''',
+        '''
+        CREATE TRIGGER user_attempts_stats AFTER INSERT ON user_attempts
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION stats_on_user_insert()
+        ''',
+        '''
+        CREATE TRIGGER prizes_stats AFTER INSERT ON prizes
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION stats_on_prize_insert()
+        ''',
+        '''
+        CREATE TRIGGER transactions_stats_insert AFTER INSERT ON transactions
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION stats_on_transaction_insert()
+        ''',
+        '''
+        CREATE TRIGGER transactions_stats_update AFTER UPDATE ON transactions
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION stats_on_transaction_update()
+        ''',
+        # Начальное заполнение по уже накопленным данным. Триггеры созданы выше
+        # в той же транзакции и блокируют конкурентную запись до коммита.
+        f'''
+        INSERT INTO stats_daily (day, metric, shard, value)
+        SELECT day, metric, shard, sum(value) FROM (
+            SELECT created_at::date AS day, 'spins' AS metric, (user_id % 8)::smallint AS shard, 1::bigint AS value
+            FROM prizes
+            UNION ALL
+            SELECT created_at::date, 'prizes:' || prize_type, (user_id % 8)::smallint, 1 FROM prizes
+            UNION ALL
+            SELECT created_at::date, 'prize_money', (user_id % 8)::smallint, {MONEY_VALUE}
+            FROM prizes WHERE prize_type = 'money'
+            UNION ALL
+            SELECT created_at::date, 'transactions:' || status, (user_id % 8)::smallint, 1 FROM transactions
+            UNION ALL
+            SELECT created_at::date, 'revenue:' || status, (user_id % 8)::smallint, amount FROM transactions
+        ) d
+        GROUP BY day, metric, shard
+        ''',
+        '''
+        INSERT INTO stats_counters (metric, shard, value)
+        SELECT metric, shard, sum(value) FROM (
+            SELECT metric, shard, value FROM stats_daily
+            UNION ALL
+            SELECT 'users', (user_id % 8)::smallint, 1 FROM user_attempts
+        ) d
+        GROUP BY metric, shard
+        ''',
+    ]),
+    Migration(5, "broadcasts and blocked users", [
+        'ALTER TABLE user_attempts ADD COLUMN IF NOT EXISTS blocked_at TIMESTAMPTZ',
+        '''
+        CREATE TABLE broadcasts (
+            id SERIAL PRIMARY KEY,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            created_by BIGINT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ
+        )
+        ''',
+        "CREATE INDEX broadcasts_running_idx ON broadcasts (id) WHERE status = 'running'",
+    ]),
+    Migration(6, "pending receipts queue", [
+        # Очередь проверки: только ожидающие транзакции с приложенным чеком
+        '''
+        CREATE INDEX transactions_pending_receipts_idx ON transactions (id)
+        WHERE status = 'pending' AND receipt_id IS NOT NULL
+        ''',
+    ]),
+    Migration(7, "claimed prizes and auto-credited attempt prizes", [
+        'ALTER TABLE prizes ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ',
+        # Выигранные ранее попытки зачисляются на баланс, как теперь делает spin
+        '''
+        WITH claimed AS (
+            UPDATE prizes
+            SET is_claimed = TRUE, claimed_at = now()
+            WHERE prize_type = 'attempt' AND is_claimed = FALSE AND value ~ '^[0-9]+$'
+            RETURNING user_id, value::int AS attempts
+        ), credit AS (
+            SELECT user_id, sum(attempts) AS attempts FROM claimed GROUP BY user_id
+        )
+        UPDATE user_attempts ua
+        SET paid = ua.paid + credit.attempts
+        FROM credit
+        WHERE ua.user_id = credit.user_id
+        ''',
+    ]),
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    Migration(8, "monthly partitions for prizes and transactions",
+              _partition_prizes_and_transactions, transactional=False),
+    Migration(9, "referral timestamps for leaderboards", [
+        'ALTER TABLE user_attempts ADD COLUMN IF NOT EXISTS referred_at TIMESTAMPTZ',
+        # Пересчет дневной и недельной таблиц пригласивших читает только свежие рефералы
+        'CREATE INDEX IF NOT EXISTS user_attempts_referred_at_idx ON user_attempts (referred_at) '
+        'WHERE referred_at IS NOT NULL',
+    ]),
+    # Базы, где миграция 4 создала триггер с value::bigint, падавшим на дробных суммах
+    Migration(10, "fractional money prizes in statistics", [STATS_ON_PRIZE_INSERT]),
+    Migration(11, "lower bound of unclaimed prize dates", [
+        'ALTER TABLE user_attempts ADD COLUMN IF NOT EXISTS unclaimed_since TIMESTAMPTZ',
+        # Запас в сутки, как у границы, которую ставит бот
+        '''
+        UPDATE user_attempts ua
+        SET unclaimed_since = p.since
+        FROM (
+            SELECT user_id, min(created_at) - interval '1 day' AS since
+            FROM prizes WHERE is_claimed = FALSE
+            GROUP BY user_id
+        ) p
+        WHERE ua.user_id = p.user_id
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def schema_version(conn: asyncpg.Connection) -> int:
+    """Текущая версия схемы (0 для пустой базы)"""
+    try:
+        return await conn.fetchval('SELECT max(version) FROM schema_migrations') or 0
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def migrate(conn: asyncpg.Connection) -> int:
+    """Применение недостающих миграций; при актуальной схеме — один запрос"""
+    version = await schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_KEY)
+    try:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        # Другой процесс мог применить миграции, пока мы ждали блокировку
+        version = await schema_version(conn)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            logger.info(f"Applying migration {migration.version}: {migration.description}")
+            if migration.transactional:
+                async with conn.transaction():
+                    await _apply(conn, migration)
+            else:
+                await _apply(conn, migration)
+            version = migration.version
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_KEY)
+    return version
+
+
+async def _apply(conn: asyncpg.Connection, migration: Migration):
+    if callable(migration.apply):
+        await migration.apply(conn)
+    else:
+        for statement in migration.apply:
+            await conn.execute(statement)
+    await conn.execute(
+        'INSERT INTO schema_migrations (version, description) VALUES ($1, $2)',
+        migration.version, migration.description
+    )
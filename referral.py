@@ -0,0 +1,78 @@
+import hashlib
+import hmac
+import os
+from functools import lru_cache
+from typing import Optional, Tuple
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BODY_LENGTH = 11      # 62^11 > 2^64
+CHECK_LENGTH = 2
+ROUNDS = 4
+MASK32 = 0xFFFFFFFF
+MAX_USER_ID = 1 << 53  # идентификаторы Telegram помещаются в 52 бита
+
+
+@lru_cache(maxsize=1)
+def _key() -> bytes:
+    # Без отдельного секрета коды привязаны к токену бота и стабильны между перезапусками
+    secret = os.getenv('REFERRAL_SECRET') or os.getenv('BOT_TOKEN') or 'wheelbot'
+    return hashlib.sha256(secret.encode()).digest()
+
+
+def _round(value: int, round_index: int) -> int:
+    digest = hmac.new(_key(), bytes([round_index]) + value.to_bytes(4, 'big'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], 'big')
+
+
+def _permute(value: int) -> int:
+    """Ключевая перестановка 64-битного числа (сеть Фейстеля)"""
+    left, right = value >> 32, value & MASK32
+    for i in range(ROUNDS):
+        left, right = right, left ^ _round(right, i)
+    return (left << 32) | right
+
+
+def _unpermute(value: int) -> int:
+    left, right = value >> 32, value & MASK32
+    for i in reversed(range(ROUNDS)):
+        left, right = right ^ _round(left, i), left
+    return (left << 32) | right
+
+
+def _base62(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 62)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def _checksum(user_id: int) -> str:
+    digest = hmac.new(_key(), b'check' + user_id.to_bytes(8, 'big'), hashlib.sha256).digest()
+    return _base62(int.from_bytes(digest[:4], 'big'), CHECK_LENGTH)
+
+
+def encode_referral_code(user_id: int) -> str:
+    """Реферальный код пользователя: вычисляется из user_id и не хранится в БД"""
+    if not 0 < user_id < MAX_USER_ID:
+        raise ValueError("user_id out of range")
+    return _base62(_permute(user_id), BODY_LENGTH) + _checksum(user_id)
+
+
+def decode_referral_code(code: str) -> Tuple[Optional[int], Optional[str]]:
+    """user_id владельца кода и старый сохраненный код (REF...), если код старого формата"""
+    # Старые коды вида REF{user_id}{4 цифры} хранятся в user_attempts.referral_code
+    if code.startswith('REF') and code[3:].isdigit() and len(code) > 7:
+        return int(code[3:-4]), code
+
+    if len(code) != BODY_LENGTH + CHECK_LENGTH or any(c not in ALPHABET for c in code):
+        return None, None
+    value = 0
+    for c in code[:BODY_LENGTH]:
+        value = value * 62 + ALPHABET.index(c)
+    if value >> 64:
+        return None, None
+    user_id = _unpermute(value)
+    if not 0 < user_id < MAX_USER_ID or not hmac.compare_digest(_checksum(user_id), code[BODY_LENGTH:]):
+        return None, None
+    return user_id, None
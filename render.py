@@ -0,0 +1,155 @@
+"""Предсобранные клавиатуры, шаблоны сообщений и кадры анимации колеса
+
+Клавиатуры и тексты строятся один раз при импорте: InlineKeyboardMarkup в
+PTB неизменяем, поэтому один объект безопасно отдавать во все обработчики.
+В шаблоны подставляются только числа (оператор %), кадры вращения
+вычисляются один раз для конфигурации колеса.
+"""
+from typing import Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from leaderboard import ALL_TIME, DAY, REFERRERS, WEEK, WINNERS
+from wheel import Wheel
+
+WELCOME = (
+    "🎡 Добро пожаловать в <b>Колесо Фортуны</b>!\n\n"
+    "💎 Крутите колесо и выигрывайте призы!\n"
+    "💰 Попытки можно купить, получить за рефералов или ежедневный бонус."
+)
+PLAY_MENU = "🎰 <b>Игровое меню</b>\n\n🔄 Доступно попыток: <b>%d</b>\n\nВыберите действие:"
+ATTEMPTS = (
+    "ℹ️ <b>Ваши попытки</b>\n\n"
+    "💰 Куплено: <b>%d</b>\n"
+    "🔄 Использовано: <b>%d</b>\n"
+    "🎯 Осталось: <b>%d</b>"
+)
+DAILY_BONUS = (
+    "🎁 <b>Ежедневный бонус</b>\n\n"
+    "✅ Вы получили <b>%d</b> бесплатную попытку!\n\n"
+    "🔄 Теперь у вас <b>%d</b> попыток."
+)
+REFERRAL_INFO = (
+    "👥 <b>Реферальная программа</b>\n\n"
+    "🔗 Ваша реферальная ссылка:\n<code>%s</code>\n\n"
+    "👤 Приглашено друзей: <b>%d</b>\n\n"
+    "💎 За каждого друга вы получаете <b>+1 попытку</b>!"
+)
+BUY_ATTEMPTS = "💰 <b>Покупка попыток</b>\n\nВыберите количество попыток:"
+PAYMENT = (
+    "💳 <b>Оплата %d попыток</b>\n\n"
+    "💰 Сумма: <b>%d руб</b>\n\n"
+    "Отправьте скриншот чека об оплате для подтверждения."
+)
+ADMIN_PANEL = "🛠 <b>Панель администратора</b>"
+
+SPIN_HEADER = "🎡 <b>Колесо Фортуны</b>\n\n" + " " * 8 + "👆\n"
+SPIN_FRAMES = 15
+
+
+def _keyboard(*rows) -> InlineKeyboardMarkup:
+    """Клавиатура из строк пар (текст, callback_data)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=data) for text, data in row]
+        for row in rows
+    ])
+
+
+_START_ROWS = (
+    (("🎰 Начать игру", "play"),),
+    (("ℹ️ Мои попытки", "check_attempts"),),
+    (("🏆 Мои призы", "my_prizes"),),
+    (("🏅 Лидеры", "leaders"),),
+    (("🎁 Ежедневный бонус", "daily_bonus"),),
+    (("👥 Реферальная программа", "referral_info"),),
+)
+START_KEYBOARD = _keyboard(*_START_ROWS)
+ADMIN_START_KEYBOARD = _keyboard(*_START_ROWS, (("🛠 Панель администратора", "admin_panel"),))
+PLAY_KEYBOARD = _keyboard(
+    (("🔄 Крутить колесо (1 попытка)", "spin_wheel"),),
+    (("💰 Купить еще попыток", "buy_attempts"),),
+    (("🔙 Назад", "back_to_start"),),
+)
+PAYMENT_KEYBOARD = _keyboard(
+    (("1 попытка — 50 руб", "pay_1"),),
+    (("3 попытки — 130 руб (↘️10%)", "pay_3"),),
+    (("5 попыток — 200 руб (↘️20%)", "pay_5"),),
+    (("10 попыток — 350 руб (↘️30%)", "pay_10"),),
+    (("🔙 Назад", "back_to_start"),),
+)
+ADMIN_KEYBOARD = _keyboard(
+    (("📊 Статистика", "admin_stats"),),
+    (("💳 Управление платежами", "admin_payments"),),
+    (("🔙 Назад", "back_to_start"),),
+)
+PRIZES_KEYBOARD = _keyboard(
+    (("✅ Забрать все", "claim_prizes"),),
+    (("🔙 Назад", "back_to_start"),),
+)
+PRIZES_NEXT_KEYBOARD = _keyboard(
+    (("✅ Забрать все", "claim_prizes"),),
+    (("➡️ Далее", "prizes_next"),),
+    (("🔙 Назад", "back_to_start"),),
+)
+
+
+class WheelFrames:
+    """Тексты вращения колеса, вычисленные один раз для конфигурации
+
+    Кадр k показывает сектора, повернутые на k + 1 позиций вправо; все
+    повороты и тексты кадров с задержками хранятся в кортежах. Итоговое
+    сообщение заготовлено для каждого сектора, в него подставляется только
+    остаток попыток.
+    """
+
+    def __init__(self, wheel: Wheel, frames: int = SPIN_FRAMES):
+        emojis = list(wheel.emojis)
+        size = len(emojis)
+        self.rotations: Tuple[str, ...] = tuple(
+            ' '.join(emojis[size - k:] + emojis[:size - k]) for k in range(size)
+        )
+        self.first: str = f"{SPIN_HEADER}{self.rotations[0]}\n\n🌀 Крутим колесо..."
+        self.frames: Tuple[Tuple[str, float], ...] = tuple(
+            (
+                f"{SPIN_HEADER}{self.rotations[(frame + 1) % size]}\n\n"
+                f"{'🌀' * (frame % 3 + 1)} Крутим колесо...",
+                0.15 + max(0, frame - 10) * 0.1
+            )
+            for frame in range(frames)
+        )
+        # % в названиях секторов экранируется: подставляется только число
+        self._results: Tuple[str, ...] = tuple(
+            f"🎉 <b>Поздравляем!</b>\n\n🏆 Вы выиграли: <b>{segment.name.replace('%', '%%')}</b>\n\n"
+            "🔄 Осталось попыток: <b>%d</b>\n\n"
+            "Хотите крутить еще?"
+            for segment in wheel.segments
+        )
+
+    def result(self, index: int, remaining: int) -> str:
+        """Итоговое сообщение для сектора index"""
+        return self._results[index] % remaining
+
+
+LEADERBOARD_KINDS = ((WINNERS, "🏆 Победители"), (REFERRERS, "👥 Пригласившие"))
+LEADERBOARD_WINDOWS = ((DAY, "День"), (WEEK, "Неделя"), (ALL_TIME, "Все время"))
+LEADERBOARD_UNITS = {WINNERS: " руб", REFERRERS: ""}
+MEDALS = ("🥇", "🥈", "🥉")
+
+
+def _leaders_keyboard(kind: str, window: str) -> InlineKeyboardMarkup:
+    # Текущий вид и окно отмечены точкой
+    return _keyboard(
+        tuple((("• " if k == kind else "") + title, f"leaders_{k}_{window}") for k, title in LEADERBOARD_KINDS),
+        tuple((("• " if w == window else "") + title, f"leaders_{kind}_{w}") for w, title in LEADERBOARD_WINDOWS),
+        (("🔙 Назад", "back_to_start"),),
+    )
+
+
+LEADERS_KEYBOARDS = {
+    (kind, window): _leaders_keyboard(kind, window)
+    for kind, _ in LEADERBOARD_KINDS for window, _ in LEADERBOARD_WINDOWS
+}
+LEADERS_TITLES = {
+    (kind, window): f"🏅 <b>{kind_title}</b> — {window_title.lower()}\n\n"
+    for kind, kind_title in LEADERBOARD_KINDS for window, window_title in LEADERBOARD_WINDOWS
+}
@@ -0,0 +1,70 @@
+import asyncio
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import Dict, Hashable
+
+
+class _Slot:
+    __slots__ = ('lock', 'holders')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+
+class UserScheduler:
+    """Конкурентная обработка апдейтов разных пользователей с порядком внутри пользователя
+
+    Апдейты одного пользователя выполняются строго по очереди в порядке
+    поступления (asyncio.Lock отдает блокировку в порядке ожидания), разные
+    пользователи — параллельно, не более concurrency одновременно. Слот
+    пользователя удаляется, когда его никто не держит и не ждет, поэтому
+    память зависит от числа активных, а не всех пользователей. Ожидающий
+    своей очереди апдейт не занимает место в общем лимите.
+    """
+
+    def __init__(self, concurrency: int = 32):
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._slots: Dict[Hashable, _Slot] = {}
+        self.running = 0
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        """Выполнение блока в очереди пользователя key"""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+        slot.holders += 1
+        try:
+            async with slot.lock:
+                async with self._semaphore:
+                    self.running += 1
+                    try:
+                        yield
+                    finally:
+                        self.running -= 1
+        finally:
+            slot.holders -= 1
+            if not slot.holders:
+                del self._slots[key]
+
+    @property
+    def active_users(self) -> int:
+        """Пользователи с выполняющимися или ожидающими апдейтами"""
+        return len(self._slots)
+
+    @property
+    def waiting(self) -> int:
+        return sum(slot.holders for slot in self._slots.values()) - self.running
+
+    def wrap(self, handler):
+        """Обертка обработчика PTB (update, context) в очередь effective_user"""
+        @wraps(handler)
+        async def wrapper(update, context):
+            user = update.effective_user
+            if user is None:
+                return await handler(update, context)
+            async with self.hold(user.id):
+                return await handler(update, context)
+        return wrapper
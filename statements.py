@@ -0,0 +1,200 @@
+"""Реестр запросов горячего пути
+
+Запросы фиксированной формы готовятся (PREPARE) в кэше выражений asyncpg
+на каждом соединении пула при его создании, поэтому вызов не тратит время
+на разбор и планирование текста. Кэш пула без срока жизни записей и больше
+реестра, так что запросы остаются подготовленными. Объекты
+PreparedStatement не хранятся: asyncpg делает их недействительными после
+возврата соединения в пул. В режиме PgBouncer (DB_PGBOUNCER=1) те же
+тексты выполняются без именованных подготовленных выражений.
+"""
+from typing import Dict, Iterable, Optional
+
+import asyncpg
+
+STATEMENTS: Dict[str, str] = {
+    'get_user_attempts': 'SELECT paid, used, last_bonus_date FROM user_attempts WHERE user_id = $1',
+
+    # Одна форма для любого сочетания аргументов: нулевые приращения ничего не меняют
+    'update_user_attempts': '''
+        INSERT INTO user_attempts AS ua (user_id, paid, used, last_bonus_date)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id) DO UPDATE
+        SET paid = ua.paid + EXCLUDED.paid,
+            used = ua.used + EXCLUDED.used,
+            last_bonus_date = COALESCE(EXCLUDED.last_bonus_date, ua.last_bonus_date)
+        RETURNING user_id, paid, used, last_bonus_date
+    ''',
+
+    'claim_daily_bonus': '''
+        WITH claim AS (
+            INSERT INTO user_attempts AS ua (user_id, paid, last_bonus_date)
+            VALUES ($1, $2, (now() AT TIME ZONE $3)::date)
+            ON CONFLICT (user_id) DO UPDATE
+            SET paid = ua.paid + EXCLUDED.paid,
+                last_bonus_date = EXCLUDED.last_bonus_date
+            WHERE ua.last_bonus_date IS NULL
+               OR ua.last_bonus_date < EXCLUDED.last_bonus_date
+            RETURNING user_id, paid, used, last_bonus_date
+        )
+        SELECT TRUE AS granted, user_id, paid, used, last_bonus_date FROM claim
+        UNION ALL
+        SELECT FALSE, user_id, paid, used, last_bonus_date FROM user_attempts
+        WHERE user_id = $1 AND NOT EXISTS (SELECT 1 FROM claim)
+    ''',
+
+    'get_referral_info': 'SELECT referred_by, referrals_count FROM user_attempts WHERE user_id = $1',
+
+    # Приглашенный получает бонус только один раз (пока referred_by пуст),
+    # пригласивший — только если бонус получил приглашенный.
+    # Старые коды дополнительно сверяются с сохраненным referral_code.
+    # Встречное приглашение (пригласивший сам приглашен этим пользователем)
+    # не засчитывается, иначе двое получают бонусы друг от друга.
+    'process_referral': '''
+        WITH referrer_ok AS (
+            SELECT 1 WHERE ($3::text IS NULL OR EXISTS (
+                SELECT 1 FROM user_attempts WHERE user_id = $2 AND referral_code = $3
+            )) AND NOT EXISTS (
+                SELECT 1 FROM user_attempts WHERE user_id = $2 AND referred_by = $1
+            )
+        ), referee AS (
+            INSERT INTO user_attempts AS ua (user_id, paid, referred_by, referred_at)
+            SELECT $1, 1, $2, now() FROM referrer_ok
+            ON CONFLICT (user_id) DO UPDATE
+            SET paid = ua.paid + 1,
+                referred_by = EXCLUDED.referred_by,
+                referred_at = EXCLUDED.referred_at
+            WHERE ua.referred_by IS NULL
+            RETURNING user_id, paid, used, last_bonus_date
+        ), referrer AS (
+            INSERT INTO user_attempts AS ua (user_id, paid, referrals_count)
+            SELECT $2, 1, 1 FROM referee
+            ON CONFLICT (user_id) DO UPDATE
+            SET paid = ua.paid + 1,
+                referrals_count = ua.referrals_count + 1
+            RETURNING user_id, paid, used, last_bonus_date
+        )
+        SELECT * FROM referee
+        UNION ALL
+        SELECT * FROM referrer
+    ''',
+
+    'create_transaction': '''
+        INSERT INTO transactions (user_id, amount, attempts, status)
+        VALUES ($1, $2, $3, $4)
+        RETURNING id
+    ''',
+
+    'attach_receipt': '''
+        UPDATE transactions
+        SET receipt_id = $2, updated_at = now()
+        WHERE id = (
+            SELECT id FROM transactions
+            WHERE user_id = $1 AND status = 'pending'
+            ORDER BY id DESC LIMIT 1
+        )
+        RETURNING id, amount, attempts
+    ''',
+
+    # user_attempts.unclaimed_since — нижняя граница created_at неполученных
+    # призов пользователя (NULL — таких призов нет). Запросы неполученных
+    # призов передают ее параметром, и планировщик отбрасывает старые месячные
+    # партиции. Для строк журнала, время которых берется на стороне бота, и
+    # для призов, записываемых параллельно с claim_all_prizes, граница
+    # ставится с запасом в сутки.
+    'add_prize': '''
+        WITH prize AS (
+            INSERT INTO prizes (user_id, prize_type, value) VALUES ($1, $2, $3)
+        )
+        UPDATE user_attempts SET unclaimed_since = COALESCE(unclaimed_since, now())
+        WHERE user_id = $1
+    ''',
+
+    # Приз уходит в журнал: граница сдвигается заранее
+    'mark_unclaimed': '''
+        UPDATE user_attempts SET unclaimed_since = now() - interval '1 day'
+        WHERE user_id = $1 AND unclaimed_since IS NULL
+    ''',
+
+    # Списание попытки без записи приза (приз уходит в журнал);
+    # $2 — выигранные попытки, начисляются тем же UPDATE
+    'spend_attempt': '''
+        UPDATE user_attempts
+        SET used = used + 1, paid = paid + $2,
+            unclaimed_since = CASE WHEN $2 > 0 THEN unclaimed_since
+                                   ELSE COALESCE(unclaimed_since, now() - interval '1 day') END
+        WHERE user_id = $1 AND paid - used > 0
+        RETURNING user_id, paid, used, last_bonus_date
+    ''',
+
+    # Выигранные попытки ($4) сразу зачисляются, а приз записывается полученным
+    'spin': '''
+        WITH spent AS (
+            UPDATE user_attempts
+            SET used = used + 1, paid = paid + $4,
+                unclaimed_since = CASE WHEN $4 > 0 THEN unclaimed_since
+                                       ELSE COALESCE(unclaimed_since, now()) END
+            WHERE user_id = $1 AND paid - used > 0
+            RETURNING user_id, paid, used, last_bonus_date
+        ), prize AS (
+            INSERT INTO prizes
+            (user_id, prize_type, value, is_claimed, claimed_at)
+            SELECT $1, $2, $3, $4 > 0, CASE WHEN $4 > 0 THEN now() END FROM spent
+        )
+        SELECT user_id, paid, used, last_bonus_date FROM spent
+    ''',
+
+    'get_unclaimed_since': 'SELECT unclaimed_since FROM user_attempts WHERE user_id = $1',
+
+    # Страница неполученных призов, новые сначала (частичный индекс prizes_unclaimed_idx);
+    # $4 — unclaimed_since
+    'get_prizes_page': '''
+        SELECT id, prize_type, value, created_at FROM prizes
+        WHERE user_id = $1 AND is_claimed = FALSE AND id < $2 AND created_at >= $4
+        ORDER BY id DESC
+        LIMIT $3
+    ''',
+
+    # Итоги по типам: количество и сумма числовых значений
+    'get_prize_summary': '''
+        SELECT prize_type, count(*) AS count,
+               sum(CASE WHEN value ~ '^[0-9]+(\\.[0-9]+)?$' THEN value::numeric END) AS total
+        FROM prizes
+        WHERE user_id = $1 AND is_claimed = FALSE AND created_at >= $2
+        GROUP BY prize_type
+    ''',
+
+    # После получения всех призов граница переносится к текущему моменту
+    'claim_all_prizes': '''
+        WITH claimed AS (
+            UPDATE prizes
+            SET is_claimed = TRUE, claimed_at = now()
+            WHERE user_id = $1 AND is_claimed = FALSE AND created_at >= $2
+            RETURNING prize_type, value
+        ), bound AS (
+            UPDATE user_attempts SET unclaimed_since = now() - interval '1 day'
+            WHERE user_id = $1
+        )
+        SELECT prize_type, count(*) AS count,
+               sum(CASE WHEN value ~ '^[0-9]+(\\.[0-9]+)?$' THEN value::numeric END) AS total
+        FROM claimed
+        GROUP BY prize_type
+    ''',
+}
+
+
+# Запросы без записи: только их можно направлять на реплику
+READ_STATEMENTS = ('get_user_attempts', 'get_referral_info', 'get_unclaimed_since', 'get_prizes_page',
+                   'get_prize_summary')
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Соединение asyncpg с подготовленными запросами реестра"""
+
+    __slots__ = ()
+
+    async def prepare_registry(self, names: Optional[Iterable[str]] = None):
+        """Подготовка запросов реестра в кэше выражений (init пула); по умолчанию всех"""
+        for name in names or STATEMENTS:
+            # Тот же путь, что у conn.fetch(текст): выражение попадает в кэш соединения
+            await self._get_statement(STATEMENTS[name], None)
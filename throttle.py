@@ -0,0 +1,103 @@
+import time
+from array import array
+from typing import Dict, List, Optional
+
+ALLOW = 0
+REJECT = 1
+# Первый отказ после разрешенного запроса: пользователю можно показать подсказку
+REJECT_NOTIFY = 2
+
+
+class UserThrottle:
+    """Компактный ограничитель частоты запросов по пользователям
+
+    У каждого пользователя token bucket на rate запросов в секунду с запасом
+    burst. Состояние хранится в параллельных массивах array по номеру слота,
+    словарь отображает user_id в слот, освобожденные слоты переиспользуются.
+    Запись, не обновлявшаяся idle_ttl секунд, эквивалентна полному ведру и
+    удаляется: каждый вызов check проверяет несколько слотов по кругу, так
+    что очистка идет постепенно и не блокирует цикл событий. rate = 0
+    выключает ограничение: check всегда разрешает запрос.
+    """
+
+    __slots__ = ('rate', 'burst', 'idle_ttl', 'sweep_step', '_slots', '_owners', '_tokens',
+                 '_updated', '_notified', '_free', '_cursor', 'allowed', 'rejected', 'evicted')
+
+    def __init__(self, rate: float = 2.0, burst: float = 5.0, idle_ttl: Optional[float] = None,
+                 sweep_step: int = 2):
+        if rate < 0:
+            raise ValueError(f"Throttle rate must be non-negative (0 disables throttling), got {rate}")
+        self.rate = rate
+        self.burst = burst
+        # После burst / rate секунд простоя ведро снова полное
+        self.idle_ttl = max(idle_ttl or 0.0, burst / rate if rate else 0.0)
+        self.sweep_step = sweep_step
+        self._slots: Dict[int, int] = {}
+        self._owners = array('q')
+        self._tokens = array('d')
+        self._updated = array('d')
+        self._notified = array('b')
+        self._free: List[int] = []
+        self._cursor = 0
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def check(self, user_id: int, now: Optional[float] = None, cost: float = 1.0) -> int:
+        """ALLOW, REJECT или REJECT_NOTIFY для очередного запроса пользователя"""
+        if not self.rate:
+            self.allowed += 1
+            return ALLOW
+        if now is None:
+            now = time.monotonic()
+        self._sweep(now)
+
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._allocate(user_id)
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, self._tokens[slot] + (now - self._updated[slot]) * self.rate)
+        self._updated[slot] = now
+
+        if tokens >= cost:
+            self._tokens[slot] = tokens - cost
+            self._notified[slot] = 0
+            self.allowed += 1
+            return ALLOW
+        self._tokens[slot] = tokens
+        self.rejected += 1
+        if self._notified[slot]:
+            return REJECT
+        self._notified[slot] = 1
+        return REJECT_NOTIFY
+
+    def _allocate(self, user_id: int) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._owners[slot] = user_id
+        else:
+            slot = len(self._owners)
+            self._owners.append(user_id)
+            self._tokens.append(0.0)
+            self._updated.append(0.0)
+            self._notified.append(0)
+        self._slots[user_id] = slot
+        return slot
+
+    def _sweep(self, now: float):
+        size = len(self._owners)
+        if not size:
+            return
+        deadline = now - self.idle_ttl
+        for _ in range(min(self.sweep_step, size)):
+            slot = self._cursor
+            self._cursor = (slot + 1) % size
+            if self._owners[slot] >= 0 and self._updated[slot] < deadline:
+                del self._slots[self._owners[slot]]
+                self._owners[slot] = -1
+                self._free.append(slot)
+                self.evicted += 1
@@ -0,0 +1,77 @@
+import hmac
+import logging
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class WebhookServer:
+    """Прием апдейтов Telegram через вебхук вместо long polling
+
+    Проверяет секретный токен из заголовка X-Telegram-Bot-Api-Secret-Token
+    (без токена сервер не создается: иначе любой, кто знает путь, может
+    подделать апдейт от администратора) и передает апдейты в очередь
+    Application. Если задан webhook_url,
+    при старте регистрирует вебхук в Bot API; без него сервер можно
+    проверять локально, отправляя POST с JSON апдейта.
+    """
+
+    def __init__(self, application: Application, listen: str = '0.0.0.0', port: int = 8443,
+                 url_path: str = '/webhook', secret_token: Optional[str] = None,
+                 webhook_url: Optional[str] = None, max_connections: int = 40):
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET must be set in webhook mode")
+        self.application = application
+        self.url_path = '/' + url_path.lstrip('/')
+        self.secret_token = secret_token
+        self.webhook_url = webhook_url
+        self.max_connections = max_connections
+        self.server = HTTPServer(self.handle, listen, port)
+        self.updates_received = 0
+        self.updates_rejected = 0
+
+    async def start(self):
+        """Запуск HTTP-сервера и регистрация вебхука"""
+        await self.server.start()
+        if self.webhook_url:
+            await self.application.bot.set_webhook(
+                url=self.webhook_url,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=self.max_connections
+            )
+            logger.info(f"Webhook registered at {self.webhook_url}")
+
+    async def stop(self):
+        """Остановка HTTP-сервера"""
+        await self.server.stop()
+
+    async def handle(self, request: Request) -> Response:
+        if request.path != self.url_path:
+            return Response(404)
+        if request.method != 'POST':
+            return Response(405)
+        if not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ''), self.secret_token
+        ):
+            self.updates_rejected += 1
+            return Response(403)
+
+        try:
+            update = Update.de_json(request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Malformed webhook update: {e}")
+            return Response(400)
+        if update is None:
+            return Response(400)
+
+        self.updates_received += 1
+        await self.application.update_queue.put(update)
+        return Response(200)
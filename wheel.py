@@ -0,0 +1,187 @@
+import argparse
+import json
+import random
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Цена одной попытки в рублях — база для расчета RTP
+ATTEMPT_PRICE = 50
+# Формат суммы денежного приза, который понимают запросы статистики и призов
+MONEY_VALUE = re.compile(r'[0-9]+(\.[0-9]+)?')
+# Число попыток в призе: зачисляется на баланс целым числом
+ATTEMPT_VALUE = re.compile(r'[0-9]+')
+
+
+class Segment(NamedTuple):
+    emoji: str
+    name: str
+    prize_type: str
+    value: str
+    weight: float
+    payout: float
+
+
+def default_payout(prize_type: str, value: str) -> float:
+    """Стоимость приза в рублях для расчета отдачи"""
+    if prize_type == 'money':
+        return float(value)
+    if prize_type == 'attempt':
+        return float(value) * ATTEMPT_PRICE
+    if prize_type == 'discount':
+        return ATTEMPT_PRICE * float(value) / 100
+    return 0.0
+
+
+DEFAULT_SEGMENTS = [
+    # emoji, название, тип, значение, вес
+    ("🍒", "10 рублей", "money", "10", 15),
+    ("🍋", "20 рублей", "money", "20", 15),
+    ("🍊", "Бесплатная попытка", "attempt", "1", 15),
+    ("🍇", "5 рублей", "money", "5", 15),
+    ("🍉", "Конфетка", "other", "candy", 10),
+    ("💰", "100 рублей", "money", "100", 5),
+    ("🎁", "Подарок", "other", "gift", 5),
+    ("⭐", "5 бесплатных попыток", "attempt", "5", 10),
+    ("🍀", "Скидка 10% на след. игру", "discount", "10", 10),
+]
+
+
+class Wheel:
+    """Конфигурация колеса с выбором сектора за O(1) по alias-таблице
+
+    Таблица строится один раз при загрузке конфигурации (метод Уолкера/Воуза),
+    после чего каждый розыгрыш — одно случайное число и одно сравнение.
+    """
+
+    def __init__(self, segments: Iterable[Segment]):
+        self.segments: List[Segment] = list(segments)
+        if not self.segments:
+            raise ValueError("Wheel needs at least one segment")
+        for segment in self.segments:
+            if segment.prize_type == 'money' and not MONEY_VALUE.fullmatch(segment.value):
+                raise ValueError(f"Money prize value must be a plain decimal number: {segment.value!r}")
+            if segment.prize_type == 'attempt' and not ATTEMPT_VALUE.fullmatch(segment.value):
+                raise ValueError(f"Attempt prize value must be a plain integer: {segment.value!r}")
+        weights = [segment.weight for segment in self.segments]
+        if any(weight < 0 for weight in weights) or sum(weights) <= 0:
+            raise ValueError("Segment weights must be non-negative with a positive sum")
+        self.emojis = tuple(segment.emoji for segment in self.segments)
+        self.probabilities = tuple(weight / sum(weights) for weight in weights)
+        self._prob, self._alias = self._build_alias_table(self.probabilities)
+
+    @staticmethod
+    def _build_alias_table(probabilities):
+        n = len(probabilities)
+        scaled = [p * n for p in probabilities]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        return tuple(prob), tuple(alias)
+
+    @classmethod
+    def from_dicts(cls, items: Iterable[Dict]) -> 'Wheel':
+        """Колесо из списка словарей (JSON-конфиг или строки БД)"""
+        segments = []
+        for item in items:
+            prize_type, value = item['prize_type'], str(item['value'])
+            payout = item.get('payout')
+            segments.append(Segment(
+                item['emoji'], item['name'], prize_type, value, float(item['weight']),
+                default_payout(prize_type, value) if payout is None else float(payout)
+            ))
+        return cls(segments)
+
+    @classmethod
+    def from_config(cls, path: Optional[str] = None) -> 'Wheel':
+        """Колесо из JSON-файла или стандартная конфигурация"""
+        if path:
+            with open(path, encoding='utf-8') as f:
+                return cls.from_dicts(json.load(f))
+        return cls.from_dicts(
+            {'emoji': e, 'name': n, 'prize_type': t, 'value': v, 'weight': w}
+            for e, n, t, v, w in DEFAULT_SEGMENTS
+        )
+
+    def draw_index(self, rng: random.Random = random) -> int:
+        """Индекс выпавшего сектора"""
+        i = int(rng.random() * len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+    def draw(self, rng: random.Random = random) -> Segment:
+        """Розыгрыш сектора"""
+        return self.segments[self.draw_index(rng)]
+
+    def expected_payout(self) -> float:
+        """Точное матожидание выплаты за вращение"""
+        return sum(p * s.payout for p, s in zip(self.probabilities, self.segments))
+
+    def payout_variance(self) -> float:
+        """Точная дисперсия выплаты за вращение"""
+        mean = self.expected_payout()
+        return sum(p * (s.payout - mean) ** 2 for p, s in zip(self.probabilities, self.segments))
+
+    def simulate(self, spins: int, seed: Optional[int] = None, batch_size: int = 1_000_000) -> Dict:
+        """Monte Carlo: векторная симуляция вращений на NumPy"""
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("Simulation requires numpy (pip install numpy)")
+
+        rng = np.random.default_rng(seed)
+        prob = np.asarray(self._prob)
+        alias = np.asarray(self._alias)
+        payouts = np.asarray([s.payout for s in self.segments])
+        counts = np.zeros(len(self.segments), dtype=np.int64)
+        total = 0.0
+        total_sq = 0.0
+
+        done = 0
+        while done < spins:
+            n = min(batch_size, spins - done)
+            column = rng.integers(0, len(prob), size=n)
+            index = np.where(rng.random(n) < prob[column], column, alias[column])
+            counts += np.bincount(index, minlength=len(prob))
+            values = payouts[index]
+            total += float(values.sum())
+            total_sq += float(np.square(values).sum())
+            done += n
+
+        mean = total / spins
+        variance = total_sq / spins - mean ** 2
+        return {
+            'spins': spins,
+            'mean_payout': mean,
+            'variance': variance,
+            'std': variance ** 0.5,
+            'rtp': mean / ATTEMPT_PRICE,
+            'frequencies': {s.emoji: int(c) / spins for s, c in zip(self.segments, counts)},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Расчет отдачи (RTP) конфигурации колеса")
+    parser.add_argument('--config', help="JSON с секторами колеса")
+    parser.add_argument('--spins', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    wheel = Wheel.from_config(args.config)
+    expected = wheel.expected_payout()
+    print(f"Expected payout: {expected:.4f} rub, RTP {expected / ATTEMPT_PRICE:.2%}, "
+          f"variance {wheel.payout_variance():.4f}")
+    result = wheel.simulate(args.spins, args.seed)
+    print(f"Simulated {result['spins']} spins: payout {result['mean_payout']:.4f} rub, "
+          f"RTP {result['rtp']:.2%}, variance {result['variance']:.4f}, std {result['std']:.4f}")
+    for segment, p in zip(wheel.segments, wheel.probabilities):
+        print(f"  {segment.emoji} {segment.name}: p={p:.4f}, observed={result['frequencies'][segment.emoji]:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,10 @@
 import logging
 import os
-import random
 import asyncio
-from datetime import datetime, timedelta
+from functools import wraps
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,18 +16,92 @@ from telegram.ext import (
 )
 from dotenv import load_dotenv
 from database import Database
+from animation import SpinAnimator
+from webhook import WebhookServer
+from wheel import Wheel
+import render
+from render import WheelFrames
+from metrics import REGISTRY, THROTTLED, InstrumentedRequest, MetricsServer, observe_handler
+from referral import encode_referral_code
+from broadcast import Broadcaster
+from scheduler import UserScheduler
+from throttle import ALLOW, REJECT_NOTIFY, UserThrottle
+from leaderboard import DAY, KINDS, WINDOWS, WINNERS, Leaderboards
 
 # Инициализация
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_API_URL = os.getenv("BOT_API_URL")
 ADMIN_ID = int(os.getenv("ADMIN_ID", 0))
 DAILY_BONUS = 1
+BONUS_TIMEZONE = os.getenv("BONUS_TIMEZONE", "UTC")
 MAX_ATTEMPTS_PER_SPIN = 1
 MAX_PAYMENT_AMOUNT = 10000
+PRIZE_TYPE_NAMES = {
+    "money": "Деньги",
+    "attempt": "Попытки",
+    "discount": "Скидки",
+    "other": "Подарки"
+}
+ANIMATION_GLOBAL_RATE = float(os.getenv("ANIMATION_GLOBAL_RATE", 25))
+ANIMATION_CHAT_RATE = float(os.getenv("ANIMATION_CHAT_RATE", 1))
+
+# Прием апдейтов: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Апдейты в обработке у PTB (включая ждущие своей очереди) и одновременно выполняемые обработчики
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 256))
+HANDLER_CONCURRENCY = int(os.getenv("HANDLER_CONCURRENCY", 32))
+
+# Ограничение частоты апдейтов одного пользователя (в секунду и запас; 0 — выключено)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", 2))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", 5))
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", 8443)))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Метрики в формате Prometheus (0 — выключены)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
+# Массовые рассылки
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 20))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 10))
+# Размер топа в таблицах лидеров
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", 10))
+# Помесячные партиции prizes и transactions создаются на столько месяцев вперед
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+
+# Очередь проверки чеков
+RECEIPT_PAGE_SIZE = int(os.getenv("RECEIPT_PAGE_SIZE", 10))
+MAX_APPROVE_BATCH = 1000
+
+# Конфигурация колеса загружается один раз
+wheel = Wheel.from_config(os.getenv("WHEEL_CONFIG"))
+PRIZE_NAMES = {(segment.prize_type, segment.value): segment.name for segment in wheel.segments}
+# Кадры вращения и итоговые тексты строятся один раз для конфигурации колеса
+wheel_frames = WheelFrames(wheel)
+PRIZES_PAGE_SIZE = 10
 
 # Инициализация базы данных
 db = Database()
 
+# Таблицы лидеров в памяти: очки победителей — стоимость призов в рублях
+leaderboards = Leaderboards(
+    {(segment.prize_type, segment.value): segment.payout for segment in wheel.segments},
+    tz=BONUS_TIMEZONE, top_size=LEADERBOARD_SIZE
+)
+db.leaderboards = leaderboards
+
+# Анимация колеса в фоне, с учетом лимитов Bot API
+animator = SpinAnimator(global_rate=ANIMATION_GLOBAL_RATE, chat_rate=ANIMATION_CHAT_RATE)
+broadcaster = Broadcaster(db, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY)
+
+# Апдейты одного пользователя — по очереди, разных пользователей — параллельно
+scheduler = UserScheduler(HANDLER_CONCURRENCY)
+throttle = UserThrottle(THROTTLE_RATE, THROTTLE_BURST)
+
 # Настройка логирования
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -35,46 +109,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def init_db():
-    """Инициализация подключения к БД"""
+async def init_db(rebuild_leaderboards: bool = True):
+    """Инициализация подключения к БД и таблиц лидеров; возвращает итоги пересчета или None"""
     await db.connect()
+    if not rebuild_leaderboards:
+        return None
+    try:
+        return await leaderboards.rebuild(db)
+    except Exception as e:
+        logger.error(f"Leaderboard rebuild failed: {e}")
+        return None
 
-# Клавиатуры
+async def maintain_partitions():
+    """Партиции на будущие месяцы: создаются заранее, чтобы вставка не упала на границе месяца"""
+    try:
+        await db.ensure_partitions(PARTITION_MONTHS_AHEAD)
+    except Exception as e:
+        logger.error(f"Partition maintenance failed: {e}")
+
+# Клавиатуры собраны заранее в render; здесь только выбор варианта
 def get_start_keyboard(user_id=None):
-    buttons = [
-        [InlineKeyboardButton("🎰 Начать игру", callback_data="play")],
-        [InlineKeyboardButton("ℹ️ Мои попытки", callback_data="check_attempts")],
-        [InlineKeyboardButton("🎁 Ежедневный бонус", callback_data="daily_bonus")],
-        [InlineKeyboardButton("👥 Реферальная программа", callback_data="referral_info")]
-    ]
-    if user_id == ADMIN_ID:
-        buttons.append([InlineKeyboardButton("🛠 Панель администратора", callback_data="admin_panel")])
-    return InlineKeyboardMarkup(buttons)
-
-def get_play_keyboard(user_id):
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🔄 Крутить колесо (1 попытка)", callback_data="spin_wheel")],
-        [InlineKeyboardButton("💰 Купить еще попыток", callback_data="buy_attempts")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_to_start")]
-    ])
-
-def get_payment_keyboard():
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("1 попытка — 50 руб", callback_data="pay_1")],
-        [InlineKeyboardButton("3 попытки — 130 руб (↘️10%)", callback_data="pay_3")],
-        [InlineKeyboardButton("5 попыток — 200 руб (↘️20%)", callback_data="pay_5")],
-        [InlineKeyboardButton("10 попыток — 350 руб (↘️30%)", callback_data="pay_10")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_to_start")]
-    ])
-
-def get_admin_keyboard():
-    return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton("💳 Управление платежами", callback_data="admin_payments")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_to_start")]
-    ])
+    return render.ADMIN_START_KEYBOARD if user_id == ADMIN_ID else render.START_KEYBOARD
+
+def throttled(handler):
+    """Отсечение слишком частых апдейтов до очереди пользователя и запросов к БД"""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        verdict = throttle.check(user.id) if user else ALLOW
+        if verdict == ALLOW:
+            return await handler(update, context)
+        
+        query = update.callback_query
+        THROTTLED.inc("callback" if query else "message")
+        # Подсказка только на первый отказ подряд, остальные нажатия отбрасываются молча
+        if query and verdict == REJECT_NOTIFY:
+            await query.answer("⏳ Слишком часто, подождите немного")
+    return wrapper
 
 # Обработчики команд
+@observe_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     args = context.args
@@ -87,190 +161,232 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode=ParseMode.HTML
             )
     
-    ref_info = await db.get_referral_info(user.id)
-    if ref_info and not ref_info['code']:
-        await db.generate_referral_code(user.id)
-    
     await update.message.reply_text(
-        "🎡 Добро пожаловать в <b>Колесо Фортуны</b>!\n\n"
-        "💎 Крутите колесо и выигрывайте призы!\n"
-        "💰 Попытки можно купить, получить за рефералов или ежедневный бонус.",
+        render.WELCOME,
         parse_mode=ParseMode.HTML,
         reply_markup=get_start_keyboard(user.id)
     )
 
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     data = query.data
+    answered = None
     
     if data == "play":
-        await show_play_menu(query)
+        answered = await show_play_menu(query)
     elif data == "check_attempts":
-        await check_attempts(query)
+        answered = await check_attempts(query)
     elif data == "daily_bonus":
-        await daily_bonus(query)
+        answered = await daily_bonus(query)
     elif data == "referral_info":
-        await referral_info(query)
+        answered = await referral_info(query)
     elif data == "buy_attempts":
-        await buy_attempts(query)
+        answered = await buy_attempts(query)
     elif data == "spin_wheel":
-        await spin_wheel(query)
+        answered = await spin_wheel(query)
     elif data == "back_to_start":
-        await back_to_start(query)
+        answered = await back_to_start(query)
+    elif data == "my_prizes":
+        answered = await my_prizes(query, context)
+    elif data == "prizes_next":
+        answered = await my_prizes(query, context, context.user_data.get("prizes_cursor"))
+    elif data == "claim_prizes":
+        answered = await claim_prizes(query, context)
+    elif data == "leaders":
+        answered = await show_leaders(query)
+    elif data.startswith("leaders_"):
+        _, kind, window = data.split("_", 2)
+        if kind in KINDS and window in WINDOWS:
+            answered = await show_leaders(query, kind, window)
     elif data.startswith("pay_"):
         attempts = int(data.split("_")[1])
-        await process_payment(query, attempts)
+        answered = await process_payment(query, attempts)
     elif data == "admin_panel" and query.from_user.id == ADMIN_ID:
-        await admin_panel(query)
+        answered = await admin_panel(query)
     elif data == "admin_stats" and query.from_user.id == ADMIN_ID:
-        await admin_stats(query)
+        answered = await admin_stats(query)
+    elif data == "admin_payments" and query.from_user.id == ADMIN_ID:
+        answered = await admin_payments(query, context)
+    elif data == "receipts_next" and query.from_user.id == ADMIN_ID:
+        answered = await admin_payments(query, context, context.user_data.get("receipts_cursor", 0))
+    elif data == "receipts_approve_page" and query.from_user.id == ADMIN_ID:
+        answered = await approve_receipts(query, context, context.user_data.get("receipts_page", []))
+    elif data.startswith("receipt_ok_") and query.from_user.id == ADMIN_ID:
+        answered = await approve_receipts(query, context, [int(data[11:])])
+    elif data.startswith("receipt_no_") and query.from_user.id == ADMIN_ID:
+        answered = await reject_receipt(query, context, int(data[11:]))
+    
+    # Обработчики с show_alert отвечают сами: повторный answer() Telegram отклоняет
+    if not answered:
+        await query.answer()
 
+@observe_handler
 async def show_play_menu(query):
     user_id = query.from_user.id
     attempts = await db.get_user_attempts(user_id)
     await query.edit_message_text(
-        f"🎰 <b>Игровое меню</b>\n\n"
-        f"🔄 Доступно попыток: <b>{attempts['remaining']}</b>\n\n"
-        "Выберите действие:",
+        render.PLAY_MENU % attempts['remaining'],
         parse_mode=ParseMode.HTML,
-        reply_markup=get_play_keyboard(user_id)
+        reply_markup=render.PLAY_KEYBOARD
     )
 
+@observe_handler
 async def check_attempts(query):
     user_id = query.from_user.id
     attempts = await db.get_user_attempts(user_id)
     await query.edit_message_text(
-        f"ℹ️ <b>Ваши попытки</b>\n\n"
-        f"💰 Куплено: <b>{attempts['paid']}</b>\n"
-        f"🔄 Использовано: <b>{attempts['used']}</b>\n"
-        f"🎯 Осталось: <b>{attempts['remaining']}</b>",
+        render.ATTEMPTS % (attempts['paid'], attempts['used'], attempts['remaining']),
         parse_mode=ParseMode.HTML,
         reply_markup=get_start_keyboard(user_id)
     )
 
+@observe_handler
 async def daily_bonus(query):
     user_id = query.from_user.id
-    attempts = await db.get_user_attempts(user_id)
-    today = datetime.now().date().isoformat()
+    granted, attempts = await db.claim_daily_bonus(user_id, BONUS_TIMEZONE, DAILY_BONUS)
     
-    if attempts['last_bonus_date'] == today:
+    if not granted:
         await query.answer("❌ Вы уже получали бонус сегодня!", show_alert=True)
-        return
-    
-    await db.update_user_attempts(
-        user_id=user_id,
-        paid=DAILY_BONUS,
-        last_bonus_date=today
-    )
+        return True
     
     await query.edit_message_text(
-        f"🎁 <b>Ежедневный бонус</b>\n\n"
-        f"✅ Вы получили <b>{DAILY_BONUS}</b> бесплатную попытку!\n\n"
-        f"🔄 Теперь у вас <b>{attempts['remaining'] + DAILY_BONUS}</b> попыток.",
+        render.DAILY_BONUS % (DAILY_BONUS, attempts['remaining']),
         parse_mode=ParseMode.HTML,
         reply_markup=get_start_keyboard(user_id)
     )
 
+@observe_handler
 async def referral_info(query):
     user_id = query.from_user.id
     ref_info = await db.get_referral_info(user_id)
     
-    if not ref_info or not ref_info['code']:
-        ref_code = await db.generate_referral_code(user_id)
-    else:
-        ref_code = ref_info['code']
-    
-    ref_link = f"https://t.me/{context.bot.username}?start=ref{ref_code}"
+    # Код вычисляется из user_id, хранить его не нужно
+    ref_link = f"https://t.me/{query.get_bot().username}?start=ref{encode_referral_code(user_id)}"
     
     await query.edit_message_text(
-        f"👥 <b>Реферальная программа</b>\n\n"
-        f"🔗 Ваша реферальная ссылка:\n<code>{ref_link}</code>\n\n"
-        f"👤 Приглашено друзей: <b>{ref_info['count'] if ref_info else 0}</b>\n\n"
-        "💎 За каждого друга вы получаете <b>+1 попытку</b>!",
+        render.REFERRAL_INFO % (ref_link, ref_info['count'] if ref_info else 0),
         parse_mode=ParseMode.HTML,
         reply_markup=get_start_keyboard(user_id)
     )
 
+@observe_handler
 async def buy_attempts(query):
     await query.edit_message_text(
-        "💰 <b>Покупка попыток</b>\n\n"
-        "Выберите количество попыток:",
+        render.BUY_ATTEMPTS,
         parse_mode=ParseMode.HTML,
-        reply_markup=get_payment_keyboard()
+        reply_markup=render.PAYMENT_KEYBOARD
     )
 
+@observe_handler
 async def spin_wheel(query):
     user_id = query.from_user.id
-    attempts = await db.get_user_attempts(user_id)
     
-    if attempts['remaining'] <= 0:
-        await query.answer("❌ У вас нет доступных попыток!", show_alert=True)
-        return
-    
-    if not await db.update_user_attempts(user_id=user_id, used=1):
-        await query.answer("❌ Ошибка при использовании попытки", show_alert=True)
-        return
+    index = wheel.draw_index()
+    segment = wheel.segments[index]
     
-    wheel_segments = ["🍒", "🍋", "🍊", "🍇", "🍉", "💰", "🎁", "⭐", "🍀"]
-    segment_weights = [15, 15, 15, 15, 10, 5, 5, 10, 10]
+    # Списание попытки и запись приза — один атомарный запрос
+    remaining = await db.spin(user_id, segment.prize_type, segment.value)
+    if remaining is None:
+        await query.answer("❌ У вас нет доступных попыток!", show_alert=True)
+        return True
     
-    selected_index = random.choices(range(len(wheel_segments)), weights=segment_weights, k=1)[0]
-    selected_segment = wheel_segments[selected_index]
+    message = await query.message.reply_text(wheel_frames.first, parse_mode=ParseMode.HTML)
     
-    prize_mapping = {
-        "🍒": ("10 рублей", "money", "10"),
-        "🍋": ("20 рублей", "money", "20"),
-        "🍊": ("Бесплатная попытка", "attempt", "1"),
-        "🍇": ("5 рублей", "money", "5"),
-        "🍉": ("Конфетка", "other", "candy"),
-        "💰": ("100 рублей", "money", "100"),
-        "🎁": ("Подарок", "other", "gift"),
-        "⭐": ("5 бесплатных попыток", "attempt", "5"),
-        "🍀": ("Скидка 10% на след. игру", "discount", "10")
-    }
-    prize_name, prize_type, prize_value = prize_mapping.get(selected_segment, ("Ничего", "other", "none"))
+    # Анимация вращения колеса: готовые кадры отправляет фоновый планировщик
+    animator.animate(
+        message.chat_id,
+        message.message_id,
+        wheel_frames.frames,
+        wheel_frames.result(index, remaining),
+        render.PLAY_KEYBOARD
+    )
+
+def format_prize_totals(summary) -> str:
+    lines = []
+    for row in sorted(summary, key=lambda row: row['prize_type']):
+        name = PRIZE_TYPE_NAMES.get(row['prize_type'], row['prize_type'])
+        if row['prize_type'] == "money":
+            lines.append(f"  • {name}: <b>{row['total'] or 0:g} руб</b> ({row['count']})")
+        else:
+            lines.append(f"  • {name}: <b>{row['count']}</b>")
+    return "\n".join(lines)
+
+@observe_handler
+async def my_prizes(query, context, before_id=None):
+    """Неполученные призы постранично; курсор страницы в user_data"""
+    user_id = query.from_user.id
+    rows, summary = await db.get_unclaimed_prizes(user_id, before_id, PRIZES_PAGE_SIZE)
     
-    await db.add_prize(user_id, prize_type, prize_value)
+    if not summary:
+        await query.edit_message_text(
+            "🏆 <b>Мои призы</b>\n\nНеполученных призов нет. Крутите колесо!",
+            parse_mode=ParseMode.HTML,
+            reply_markup=get_start_keyboard(user_id)
+        )
+        return
     
-    message = await query.message.reply_text(
-        "🎡 <b>Колесо Фортуны</b>\n\n"
-        f"{' ' * 8}👆\n"
-        f"{' '.join(wheel_segments)}\n\n"
-        "🌀 Крутим колесо...",
-        parse_mode=ParseMode.HTML
+    total = sum(row['count'] for row in summary)
+    context.user_data["prizes_cursor"] = rows[-1]['id'] if rows else None
+    items = "\n".join(
+        f"{row['created_at']:%d.%m %H:%M} — "
+        f"{PRIZE_NAMES.get((row['prize_type'], row['value']), row['value'])}"
+        for row in rows
     )
+    await query.edit_message_text(
+        f"🏆 <b>Мои призы: {total}</b>\n\n{format_prize_totals(summary)}\n\n{items}",
+        parse_mode=ParseMode.HTML,
+        reply_markup=render.PRIZES_NEXT_KEYBOARD if len(rows) == PRIZES_PAGE_SIZE else render.PRIZES_KEYBOARD
+    )
+
+@observe_handler
+async def claim_prizes(query, context):
+    user_id = query.from_user.id
+    claimed = await db.claim_all_prizes(user_id)
+    if not claimed:
+        await query.answer("Неполученных призов нет", show_alert=True)
+        return True
     
-    # Анимация вращения колеса
-    for frame in range(15):
-        wheel_segments.insert(0, wheel_segments.pop())
-        delay = 0.15 + (max(0, frame - 10) * 0.1)
-        await message.edit_text(
-            f"🎡 <b>Колесо Фортуны</b>\n\n{' ' * 8}👆\n{' '.join(wheel_segments)}\n\n"
-            f"{'🌀' * (frame % 3 + 1)} Крутим колесо...",
+    totals = format_prize_totals(claimed)
+    await query.edit_message_text(
+        f"✅ <b>Призы получены!</b>\n\n{totals}\n\n"
+        "Администратор свяжется с вами для выдачи денежных призов и подарков.",
+        parse_mode=ParseMode.HTML,
+        reply_markup=get_start_keyboard(user_id)
+    )
+    if ADMIN_ID:
+        await context.bot.send_message(
+            chat_id=ADMIN_ID,
+            text=f"🏆 Пользователь <code>{user_id}</code> забрал призы:\n{totals}",
             parse_mode=ParseMode.HTML
         )
-        await asyncio.sleep(delay)
-    
-    # Финальный результат
-    attempts = await db.get_user_attempts(user_id)
-    await message.edit_text(
-        f"🎉 <b>Поздравляем!</b>\n\n🏆 Вы выиграли: <b>{prize_name}</b>\n\n"
-        f"🔄 Осталось попыток: <b>{attempts['remaining']}</b>\n\n"
-        "Хотите крутить еще?",
+
+@observe_handler
+async def show_leaders(query, kind=WINNERS, window=DAY):
+    """Топ таблицы лидеров и место игрока; данные в памяти, без запросов к БД"""
+    user_id = query.from_user.id
+    unit = render.LEADERBOARD_UNITS[kind]
+    lines = "\n".join(
+        f"{render.MEDALS[place - 1] if place <= len(render.MEDALS) else f'{place}.'} "
+        f"Игрок •••{leader_id % 10000:04d}{' (вы)' if leader_id == user_id else ''} — <b>{points}{unit}</b>"
+        for place, (leader_id, points) in enumerate(leaderboards.top(kind, window), 1)
+    ) or "Пока никого нет."
+    rank, score = leaderboards.rank(kind, window, user_id)
+    mine = f"📍 Ваше место: <b>{rank}</b> ({score}{unit})" if rank else "📍 Вас пока нет в рейтинге"
+    await query.edit_message_text(
+        f"{render.LEADERS_TITLES[kind, window]}{lines}\n\n{mine}",
         parse_mode=ParseMode.HTML,
-        reply_markup=get_play_keyboard(user_id)
+        reply_markup=render.LEADERS_KEYBOARDS[kind, window]
     )
 
+@observe_handler
 async def back_to_start(query):
     await query.edit_message_text(
-        "🎡 Добро пожаловать в <b>Колесо Фортуны</b>!\n\n"
-        "💎 Крутите колесо и выигрывайте призы!\n"
-        "💰 Попытки можно купить, получить за рефералов или ежедневный бонус.",
+        render.WELCOME,
         parse_mode=ParseMode.HTML,
         reply_markup=get_start_keyboard(query.from_user.id)
     )
 
+@observe_handler
 async def process_payment(query, attempts):
     user_id = query.from_user.id
     prices = {1: 50, 3: 130, 5: 200, 10: 350}
@@ -279,18 +395,27 @@ async def process_payment(query, attempts):
     try:
         transaction_id = await db.create_transaction(user_id, amount, attempts)
         await query.edit_message_text(
-            f"💳 <b>Оплата {attempts} попыток</b>\n\n"
-            f"💰 Сумма: <b>{amount} руб</b>\n\n"
-            "Отправьте скриншот чека об оплате для подтверждения.",
+            render.PAYMENT % (attempts, amount),
             parse_mode=ParseMode.HTML
         )
     except Exception as e:
         logger.error(f"Payment error: {e}")
         await query.answer("❌ Ошибка при создании платежа", show_alert=True)
+        return True
 
+@observe_handler
 async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.photo:
         photo = update.message.photo[-1]
+        user_id = update.message.from_user.id
+        transaction = await db.attach_receipt(user_id, photo.file_id)
+        if transaction is None:
+            await update.message.reply_text(
+                "❌ Нет ожидающего платежа. Сначала выберите количество попыток в меню покупки.",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
         await update.message.reply_text(
             "✅ Чек получен! Администратор проверит оплату и начислит попытки в течение 24 часов.",
             parse_mode=ParseMode.HTML
@@ -301,53 +426,286 @@ async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await context.bot.send_photo(
                 chat_id=ADMIN_ID,
                 photo=photo.file_id,
-                caption=f"Новый чек от пользователя {update.message.from_user.id}"
+                caption=f"Новый чек #{transaction['id']} от пользователя {user_id}: "
+                        f"{transaction['amount']} руб, {transaction['attempts']} попыток"
             )
 
+@observe_handler
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <текст> — запуск рассылки всем пользователям"""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    text = update.message.text_html.partition(" ")[2].strip()
+    if not text:
+        await update.message.reply_text("Использование: /broadcast <текст сообщения>")
+        return
+    
+    # Предпросмотр администратору заодно проверяет HTML-разметку
+    try:
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+    except BadRequest as e:
+        await update.message.reply_text(f"❌ Сообщение не отправлено: {e}")
+        return
+    
+    broadcast_id = await broadcaster.create(text, update.effective_user.id)
+    await update.message.reply_text(
+        f"📣 Рассылка #{broadcast_id} запущена.\n"
+        f"Статус: /broadcast_status {broadcast_id}\nОтмена: /broadcast_cancel {broadcast_id}"
+    )
+
+@observe_handler
+async def broadcast_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast_status [id] — прогресс рассылки"""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    broadcast_id = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+    broadcast = await db.get_broadcast(broadcast_id)
+    if not broadcast:
+        await update.message.reply_text("Рассылок пока не было.")
+        return
+    status = "выполняется" if broadcaster.is_running(broadcast['id']) else broadcast['status']
+    await update.message.reply_text(
+        f"📣 <b>Рассылка #{broadcast['id']}</b> — {status}\n\n"
+        f"✅ Доставлено: <b>{broadcast['sent']}</b>\n"
+        f"🚫 Заблокировали бота: <b>{broadcast['blocked']}</b>\n"
+        f"⚠️ Ошибки: <b>{broadcast['failed']}</b>\n"
+        f"📍 Последний user_id: <code>{broadcast['last_user_id']}</code>",
+        parse_mode=ParseMode.HTML
+    )
+
+@observe_handler
+async def broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast_cancel <id> — остановка рассылки"""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Использование: /broadcast_cancel <id>")
+        return
+    if await broadcaster.cancel(int(context.args[0])):
+        await update.message.reply_text("⏹ Рассылка остановлена.")
+    else:
+        await update.message.reply_text("Рассылка не выполняется.")
+
+@observe_handler
 async def admin_panel(query):
     if query.from_user.id != ADMIN_ID:
         await query.answer("❌ Доступ запрещен", show_alert=True)
-        return
+        return True
     
     await query.edit_message_text(
-        "🛠 <b>Панель администратора</b>",
+        render.ADMIN_PANEL,
         parse_mode=ParseMode.HTML,
-        reply_markup=get_admin_keyboard()
+        reply_markup=render.ADMIN_KEYBOARD
     )
 
+@observe_handler
 async def admin_stats(query):
     if query.from_user.id != ADMIN_ID:
         await query.answer("❌ Доступ запрещен", show_alert=True)
-        return
+        return True
     
-    # Здесь можно добавить реальную статистику из БД
+    # Счетчики поддерживаются триггерами, чтение — несколько строк
+    stats = await db.get_stats()
+    total, today = stats['total'], stats['today']
+    prizes = "\n".join(
+        f"  • {PRIZE_TYPE_NAMES.get(metric[7:], metric[7:])}: <b>{value}</b>"
+        for metric, value in sorted(total.items()) if metric.startswith("prizes:")
+    ) or "  • нет"
     await query.edit_message_text(
         "📊 <b>Статистика</b>\n\n"
-        "👤 Всего пользователей: <b>100</b>\n"
-        "💰 Общий доход: <b>5000 руб</b>\n"
-        "🎰 Всего игр: <b>250</b>",
+        f"👤 Всего пользователей: <b>{total.get('users', 0)}</b>\n"
+        f"💰 Общий доход: <b>{total.get('revenue:approved', 0)} руб</b>\n"
+        f"⏳ Ожидает подтверждения: <b>{total.get('revenue:pending', 0)} руб</b>\n"
+        f"🎰 Всего игр: <b>{total.get('spins', 0)}</b>\n"
+        f"💸 Выиграно денег: <b>{total.get('prize_money', 0)} руб</b>\n\n"
+        f"🏆 Призы по типам:\n{prizes}\n\n"
+        "📅 <b>Сегодня</b>\n"
+        f"👤 Новых пользователей: <b>{today.get('users', 0)}</b>\n"
+        f"🎰 Игр: <b>{today.get('spins', 0)}</b>\n"
+        f"💰 Доход: <b>{today.get('revenue:approved', 0)} руб</b>",
+        parse_mode=ParseMode.HTML,
+        reply_markup=render.ADMIN_KEYBOARD
+    )
+
+def get_receipts_keyboard(rows, has_next: bool):
+    keyboard = [
+        [
+            InlineKeyboardButton(f"✅ #{row['id']}", callback_data=f"receipt_ok_{row['id']}"),
+            InlineKeyboardButton(f"❌ #{row['id']}", callback_data=f"receipt_no_{row['id']}")
+        ]
+        for row in rows
+    ]
+    if rows:
+        keyboard.append([InlineKeyboardButton("✅ Подтвердить все на странице", callback_data="receipts_approve_page")])
+    if has_next:
+        keyboard.append([InlineKeyboardButton("➡️ Далее", callback_data="receipts_next")])
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")])
+    return InlineKeyboardMarkup(keyboard)
+
+@observe_handler
+async def admin_payments(query, context, after_id: int = 0):
+    """Страница очереди чеков; позиция хранится в user_data администратора"""
+    rows, total = await db.get_pending_receipts(after_id, RECEIPT_PAGE_SIZE)
+    if not rows and after_id:
+        # Дошли до конца очереди — начинаем сначала
+        rows, total = await db.get_pending_receipts(0, RECEIPT_PAGE_SIZE)
+    
+    context.user_data["receipts_page"] = [row['id'] for row in rows]
+    context.user_data["receipts_cursor"] = rows[-1]['id'] if rows else 0
+    
+    items = "\n".join(
+        f"#{row['id']} • <code>{row['user_id']}</code> • {row['amount']} руб • "
+        f"{row['attempts']} поп. • {row['created_at']:%d.%m %H:%M}"
+        for row in rows
+    ) or "Очередь пуста."
+    await query.edit_message_text(
+        f"💳 <b>Чеки на проверке: {total}</b>\n\n{items}",
         parse_mode=ParseMode.HTML,
-        reply_markup=get_admin_keyboard()
+        reply_markup=get_receipts_keyboard(rows, total > len(rows))
     )
 
+async def credit_approved(context, transaction_ids, admin_id: int) -> int:
+    """Подтверждение платежей и уведомление пользователей в фоне"""
+    credited = await db.approve_transactions(transaction_ids, admin_id)
+    if credited:
+        context.application.create_task(broadcaster.notify(
+            [row['user_id'] for row in credited],
+            "✅ Оплата подтверждена! Попытки начислены — можно крутить колесо."
+        ))
+    return len(credited)
+
+@observe_handler
+async def approve_receipts(query, context, transaction_ids):
+    users = await credit_approved(context, transaction_ids, query.from_user.id)
+    logger.info(f"Admin approved {len(transaction_ids)} receipts for {users} users")
+    await admin_payments(query, context, 0)
+
+@observe_handler
+async def reject_receipt(query, context, transaction_id: int):
+    rejected = await db.reject_transactions([transaction_id], query.from_user.id)
+    if rejected:
+        context.application.create_task(broadcaster.notify(
+            rejected, "❌ Платеж не подтвержден. Если это ошибка, отправьте чек повторно."
+        ))
+    await admin_payments(query, context, 0)
+
+def parse_id_list(args) -> list:
+    """Разбор списка id вида «101 105 110-180»"""
+    ids = []
+    for arg in args:
+        for part in arg.split(","):
+            start, _, end = part.partition("-")
+            if not start.isdigit() or (end and not end.isdigit()):
+                raise ValueError(part)
+            first, last = int(start), int(end or start)
+            # Размер проверяется до построения списка: диапазон может быть огромным
+            if len(ids) + max(0, last - first + 1) > MAX_APPROVE_BATCH:
+                raise ValueError(f"не более {MAX_APPROVE_BATCH} за раз")
+            ids.extend(range(first, last + 1))
+    return ids
+
+@observe_handler
+async def approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/approve <id|диапазон> ... — подтверждение пачки платежей одним запросом"""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    try:
+        transaction_ids = parse_id_list(context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"Неверный номер: {e}")
+        return
+    if not transaction_ids or len(transaction_ids) > MAX_APPROVE_BATCH:
+        await update.message.reply_text(
+            f"Использование: /approve 101 105 110-180 (не более {MAX_APPROVE_BATCH} за раз)"
+        )
+        return
+    users = await credit_approved(context, transaction_ids, update.effective_user.id)
+    await update.message.reply_text(f"✅ Попытки начислены {users} пользователям.")
+
+def build_application(receive_updates: bool = True) -> Application:
+    """Создание Application с зарегистрированными обработчиками
+
+    receive_updates=False — апдейты кладет в update_queue внешний источник
+    (вебхук или ingress многопроцессного режима), Updater не создается.
+    """
+    builder = Application.builder().token(BOT_TOKEN)
+    if BOT_API_URL:
+        builder = builder.base_url(BOT_API_URL)
+    builder = builder.request(InstrumentedRequest(connection_pool_size=256))
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(CONCURRENT_UPDATES)
+    if BOT_MODE == "webhook" or not receive_updates:
+        builder = builder.updater(None)
+    else:
+        builder = builder.get_updates_request(InstrumentedRequest())
+    application = builder.build()
+    
+    # Регистрация обработчиков
+    application.add_handler(CommandHandler("start", throttled(scheduler.wrap(start))))
+    application.add_handler(CommandHandler("broadcast", scheduler.wrap(broadcast_command)))
+    application.add_handler(CommandHandler("broadcast_status", scheduler.wrap(broadcast_status)))
+    application.add_handler(CommandHandler("broadcast_cancel", scheduler.wrap(broadcast_cancel)))
+    application.add_handler(CommandHandler("approve", scheduler.wrap(approve_command)))
+    application.add_handler(CallbackQueryHandler(throttled(scheduler.wrap(button))))
+    application.add_handler(MessageHandler(filters.PHOTO, throttled(scheduler.wrap(handle_receipt))))
+    return application
+
+def register_metrics():
+    """Метрики компонентов, считываемые при каждом сборе"""
+    db.register_metrics()
+    REGISTRY.callback(
+        'wheelbot_animation_frames_total', 'Spin animation frames by outcome',
+        lambda: {'sent': animator.frames_sent, 'dropped': animator.frames_dropped},
+        labels=['outcome'], type='counter'
+    )
+    REGISTRY.callback(
+        'wheelbot_bot_api_retry_after_total', 'RetryAfter (429) responses handled by the animator',
+        lambda: animator.retry_after_count, type='counter'
+    )
+    REGISTRY.callback('wheelbot_animations_pending', 'Spin animations in progress', lambda: animator.pending)
+    REGISTRY.callback(
+        'wheelbot_handler_updates', 'Updates in the per-user scheduler by state',
+        lambda: {'running': scheduler.running, 'waiting': scheduler.waiting},
+        labels=['state']
+    )
+    REGISTRY.callback('wheelbot_handler_active_users', 'Users with queued or running updates',
+                      lambda: scheduler.active_users)
+    REGISTRY.callback('wheelbot_throttle_tracked_users', 'Users tracked by the rate limiter', lambda: len(throttle))
+
 async def main():
     application = None
+    webhook = None
+    metrics_server = None
     try:
         await init_db()
-        application = Application.builder().token(BOT_TOKEN).build()
-        
-        # Регистрация обработчиков
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CallbackQueryHandler(button))
-        application.add_handler(MessageHandler(filters.PHOTO, handle_receipt))
+        if METRICS_PORT:
+            register_metrics()
+            metrics_server = MetricsServer(METRICS_LISTEN, METRICS_PORT)
+            await metrics_server.start()
+        application = build_application()
         
-        logger.info("Bot starting...")
+        logger.info(f"Bot starting in {BOT_MODE} mode...")
         await application.initialize()
         await application.start()
-        await application.updater.start_polling()
+        await animator.start(application.bot)
+        broadcaster.start(application.bot)
+        await broadcaster.resume_all()
+        if BOT_MODE == "webhook":
+            webhook = WebhookServer(
+                application,
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                webhook_url=WEBHOOK_URL
+            )
+            await webhook.start()
+        else:
+            await application.updater.start_polling()
         
         # Бесконечный цикл ожидания
         while True:
+            await maintain_partitions()
             await asyncio.sleep(3600)  # Проверка каждые 60 минут
             
     except asyncio.CancelledError:
@@ -357,9 +715,17 @@ async def main():
     finally:
         if application:
             logger.info("Stopping bot gracefully...")
-            await application.updater.stop()
+            if webhook:
+                await webhook.stop()
+            if application.updater:
+                await application.updater.stop()
+            await animator.stop()
+            await broadcaster.stop()
             await application.stop()
             await application.shutdown()
+        if metrics_server:
+            await metrics_server.stop()
+        await db.close()
 
 if __name__ == '__main__':
     loop = asyncio.new_event_loop()
@@ -0,0 +1,354 @@
+"""Многопроцессный режим: ingress и N процессов-обработчиков
+
+Ingress получает апдейты (long polling или вебхук) без десериализации в
+объекты python-telegram-bot, берет из JSON id пользователя и отправляет
+апдейт в очередь процесса user_id % N. Все апдейты одного пользователя
+обрабатывает один процесс в порядке поступления; у каждого процесса свой
+пул Database, кэш балансов и Application.
+
+Запуск:
+
+    python workers.py --workers 4
+    python workers.py --workers 4 --record updates.jsonl
+    python workers.py --workers 4 --replay updates.jsonl
+
+В режиме --replay апдейты читаются из файла (по одному JSON в строке),
+после обработки выводится пропускная способность. Для локальной проверки
+BOT_API_URL указывают на bench.fake_bot_api.
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from http_server import HTTPServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.telegram.org/bot'
+POLL_TIMEOUT = 30
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+# Поля апдейта с инициатором в 'from' или 'user'
+USER_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'my_chat_member', 'chat_member',
+    'chat_join_request', 'poll_answer',
+)
+CHAT_FIELDS = ('channel_post', 'edited_channel_post')
+
+
+def update_user_id(update: Dict) -> int:
+    """id пользователя-инициатора апдейта (для постов каналов — id чата)"""
+    for field in USER_FIELDS:
+        payload = update.get(field)
+        if payload:
+            user = payload.get('from') or payload.get('user')
+            if user:
+                return user['id']
+    for field in CHAT_FIELDS:
+        payload = update.get(field)
+        if payload:
+            return payload['chat']['id']
+    return update.get('update_id', 0)
+
+
+def shard_for(user_id: int, workers: int) -> int:
+    return user_id % workers
+
+
+class Router:
+    """Раскладка апдейтов по очередям процессов"""
+
+    def __init__(self, queues: List, record_path: Optional[str] = None):
+        self.queues = queues
+        self.routed = [0] * len(queues)
+        self._record = open(record_path, 'a', encoding='utf-8') if record_path else None
+
+    def route(self, update: Dict) -> int:
+        index = shard_for(update_user_id(update), len(self.queues))
+        self.queues[index].put(('update', update))
+        self.routed[index] += 1
+        if self._record:
+            self._record.write(json.dumps(update, ensure_ascii=False) + '\n')
+        return index
+
+    def close(self):
+        for queue in self.queues:
+            queue.put(None)
+        if self._record:
+            self._record.close()
+
+
+async def poll_updates(router: Router, token: str, base_url: Optional[str], stop: asyncio.Event):
+    """Long polling getUpdates напрямую через HTTP"""
+    import httpx
+
+    url = f"{base_url or DEFAULT_API_URL}{token}/getUpdates"
+    offset = None
+    async with httpx.AsyncClient(timeout=POLL_TIMEOUT + 10) as client:
+        while not stop.is_set():
+            try:
+                response = await client.post(url, json={'timeout': POLL_TIMEOUT, 'offset': offset})
+                payload = response.json()
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not payload.get('ok'):
+                retry_after = payload.get('parameters', {}).get('retry_after', 1)
+                logger.error(f"getUpdates error: {payload.get('description')}")
+                await asyncio.sleep(retry_after)
+                continue
+            for update in payload['result']:
+                router.route(update)
+                offset = update['update_id'] + 1
+
+
+class IngressWebhook:
+    """Вебхук ingress: проверка секрета и маршрутизация без объектов PTB"""
+
+    def __init__(self, router: Router, listen: str, port: int, url_path: str, secret_token: Optional[str]):
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET must be set in webhook mode")
+        self.router = router
+        self.url_path = '/' + url_path.lstrip('/')
+        self.secret_token = secret_token
+        self.server = HTTPServer(self.handle, listen, port)
+
+    async def handle(self, request: Request) -> Response:
+        if request.path != self.url_path:
+            return Response(404)
+        if request.method != 'POST':
+            return Response(405)
+        if not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ''), self.secret_token
+        ):
+            return Response(403)
+        try:
+            update = request.json()
+        except ValueError:
+            return Response(400)
+        if not isinstance(update, dict) or 'update_id' not in update:
+            return Response(400)
+        self.router.route(update)
+        return Response(200)
+
+
+def worker_entry(index: int, queues: List, ready):
+    """Точка входа процесса-обработчика"""
+    load_dotenv()
+    # Глобальный лимит анимаций Bot API делится между процессами
+    workers = len(queues)
+    os.environ['ANIMATION_GLOBAL_RATE'] = str(float(os.getenv('ANIMATION_GLOBAL_RATE', 25)) / workers)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        asyncio.run(run_worker(index, queues, ready))
+    except Exception as e:
+        logger.error(f"Worker {index} crashed: {e}")
+        raise
+
+
+async def run_worker(index: int, queues: List, ready):
+    import wheel_of_fortune_bot as bot
+    from metrics import MetricsServer
+    from telegram import Update
+
+    workers = len(queues)
+    queue = queues[index]
+    if bot.db.cache:
+        bot.db.cache.set_owner(
+            lambda user_id: shard_for(user_id, workers) == index,
+            lambda user_id: queues[shard_for(user_id, workers)].put(('invalidate', user_id))
+        )
+    # Начисления в таблицы лидеров повторяются во всех процессах
+    def forward_points(*entry):
+        for other in range(workers):
+            if other != index:
+                queues[other].put(('leaderboard', entry))
+
+    bot.leaderboards.set_forward(forward_points)
+
+    # Таблицы лидеров пересчитывает процесс 0 и рассылает итоги остальным.
+    # Апдейты маршрутизируются только после готовности всех процессов,
+    # поэтому итоги — первое сообщение в очереди и начисления не теряются
+    snapshot = await bot.init_db(rebuild_leaderboards=index == 0)
+    loop = asyncio.get_running_loop()
+    if index == 0:
+        for other in range(1, workers):
+            queues[other].put(('leaderboard_snapshot', snapshot))
+    else:
+        _, snapshot = await loop.run_in_executor(None, queue.get)
+        if snapshot:
+            bot.leaderboards.load(snapshot)
+    metrics_server = None
+    if bot.METRICS_PORT:
+        bot.register_metrics()
+        metrics_server = MetricsServer(bot.METRICS_LISTEN, bot.METRICS_PORT + index)
+        await metrics_server.start()
+    application = bot.build_application(receive_updates=False)
+    await application.initialize()
+    await application.start()
+    await bot.animator.start(application.bot)
+    bot.broadcaster.start(application.bot)
+    # Рассылками управляет администратор, поэтому они живут в его процессе
+    if shard_for(bot.ADMIN_ID, workers) == index:
+        await bot.broadcaster.resume_all()
+    # Обслуживание партиций достаточно одного процесса
+    maintenance = asyncio.create_task(_maintain_partitions(bot)) if index == 0 else None
+    logger.info(f"Worker {index}/{workers} ready")
+    ready.put(index)
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, queue.get)
+            if item is None:
+                break
+            kind, payload = item
+            if kind == 'invalidate':
+                # Следующее чтение — с основного сервера, реплика может отставать
+                bot.db.invalidate_user(payload)
+                continue
+            if kind == 'leaderboard':
+                bot.leaderboards.add(*payload, forward=False)
+                continue
+            update = Update.de_json(payload, application.bot)
+            if update is not None:
+                await application.update_queue.put(update)
+    finally:
+        if maintenance:
+            maintenance.cancel()
+        # stop() дорабатывает уже поставленные в очередь апдейты
+        await application.stop()
+        while bot.animator.pending:
+            await asyncio.sleep(0.05)
+        await bot.animator.stop()
+        await bot.broadcaster.stop()
+        await application.shutdown()
+        if metrics_server:
+            await metrics_server.stop()
+        await bot.db.close()
+        logger.info(f"Worker {index} stopped")
+
+
+async def _maintain_partitions(bot):
+    while True:
+        await bot.maintain_partitions()
+        await asyncio.sleep(3600)
+
+
+def start_workers(count: int) -> Tuple[List, List]:
+    """Запуск процессов и ожидание их готовности (подключение к БД, initialize)"""
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(count)]
+    ready = context.Queue()
+    processes = [
+        context.Process(target=worker_entry, args=(index, queues, ready), name=f"wheelbot-worker-{index}")
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    started = 0
+    while started < count:
+        try:
+            ready.get(timeout=1)
+            started += 1
+        except queue_module.Empty:
+            dead = [process.name for process in processes if not process.is_alive()]
+            if dead:
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError(f"Workers failed to start: {', '.join(dead)}")
+    return queues, processes
+
+
+def stop_workers(router: Router, processes: List, timeout: Optional[float] = 30.0):
+    """Остановка процессов после обработки уже разосланных апдейтов"""
+    router.close()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for process in processes:
+        process.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"{process.name} did not stop in time, terminating")
+            process.terminate()
+
+
+def replay(router: Router, path: str) -> int:
+    count = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                router.route(json.loads(line))
+                count += 1
+    return count
+
+
+async def serve(router: Router):
+    import wheel_of_fortune_bot as bot
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    if bot.BOT_MODE == "webhook":
+        ingress = IngressWebhook(router, bot.WEBHOOK_LISTEN, bot.WEBHOOK_PORT, bot.WEBHOOK_PATH, bot.WEBHOOK_SECRET)
+        await ingress.server.start()
+        if bot.WEBHOOK_URL:
+            from telegram import Bot
+            async with Bot(bot.BOT_TOKEN, base_url=bot.BOT_API_URL or DEFAULT_API_URL) as api:
+                await api.set_webhook(url=bot.WEBHOOK_URL, secret_token=bot.WEBHOOK_SECRET)
+        await stop.wait()
+        await ingress.server.stop()
+    else:
+        poller = asyncio.create_task(poll_updates(router, bot.BOT_TOKEN, bot.BOT_API_URL, stop))
+        await stop.wait()
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Многопроцессный режим бота")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('BOT_WORKERS', 0)) or os.cpu_count(),
+                        help="число процессов-обработчиков (по умолчанию BOT_WORKERS или число ядер)")
+    parser.add_argument('--replay', help="обработать апдейты из файла JSON lines и выйти")
+    parser.add_argument('--record', help="дописывать полученные апдейты в файл JSON lines")
+    args = parser.parse_args()
+    # Без секрета любой, кто знает путь вебхука, подделает апдейт администратора
+    if not args.replay and os.getenv('BOT_MODE') == 'webhook' and not os.getenv('WEBHOOK_SECRET'):
+        parser.error("WEBHOOK_SECRET must be set in webhook mode")
+
+    logging.basicConfig(
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    queues, processes = start_workers(args.workers)
+    router = Router(queues, args.record)
+    started = time.perf_counter()
+    try:
+        if args.replay:
+            count = replay(router, args.replay)
+            logger.info(f"Replaying {count} updates on {args.workers} workers")
+        else:
+            asyncio.run(serve(router))
+    finally:
+        # Повтор записи дорабатывается полностью, иначе ждем не дольше 30 секунд
+        stop_workers(router, processes, None if args.replay else 30.0)
+    if args.replay:
+        elapsed = time.perf_counter() - started
+        print(f"Processed {count} updates in {elapsed:.2f}s ({count / elapsed:.1f} updates/s), "
+              f"per worker: {router.routed}")
+
+
+if __name__ == '__main__':
+    main()